@@ -1,5 +1,7 @@
 # config.py
 import os
+import copy
+import threading
 import yaml
 import base64
 from typing import Optional
@@ -62,11 +64,51 @@ def ensure_config_exists():
     return False
 
 
+# 已解析配置的缓存：(文件状态, 配置)。文件 mtime/大小/inode 变化或 save_config 时失效，
+# 避免推送等路径上每次获取仓库配置都重新读取并解析 YAML
+_config_cache = None
+_config_cache_lock = threading.Lock()
+
+
+def _config_file_state():
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _invalidate_config_cache():
+    global _config_cache
+    with _config_cache_lock:
+        _config_cache = None
+
+
 def load_config():
-    """加载配置文件"""
+    """加载配置文件（按文件状态缓存解析结果，每次返回独立副本）"""
+    global _config_cache
+
     # 确保配置文件存在
     ensure_config_exists()
 
+    state = _config_file_state()
+    with _config_cache_lock:
+        cached = _config_cache
+    if state is not None and cached is not None and cached[0] == state:
+        return copy.deepcopy(cached[1])
+
+    config = _load_config_from_file()
+    if config is None:
+        return DEFAULT_CONFIG.copy()
+    # 读取期间文件未变化才缓存（解析时可能回写配置，如旧格式转换，下次再缓存）
+    if state is not None and _config_file_state() == state:
+        with _config_cache_lock:
+            _config_cache = (state, copy.deepcopy(config))
+    return config
+
+
+def _load_config_from_file():
+    """读取并解析配置文件；读取失败时返回 None"""
     try:
         with open(CONFIG_FILE, "r", encoding="utf-8") as f:
             config = yaml.safe_load(f)
@@ -124,11 +166,12 @@ def load_config():
     except Exception as e:
         print(f"❌ 加载配置文件失败: {e}")
         print(f"📝 使用默认配置")
-        return DEFAULT_CONFIG.copy()
+        return None
 
 
 def save_config(config):
     """保存配置文件（使用临时文件确保原子性）"""
+    _invalidate_config_cache()
     # 确保目录存在
     os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
 
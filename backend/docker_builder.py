@@ -47,7 +47,7 @@ class DockerBuilder(ABC):
             tag: 镜像标签
             **kwargs: 其他构建参数
         Returns:
-            构建日志流
+            构建日志流（每项都是已解码的 dict，调用方不再做类型判断）
         """
         pass
 
@@ -62,7 +62,7 @@ class DockerBuilder(ABC):
             tag: 镜像标签
             auth_config: 认证配置
         Returns:
-            推送日志流
+            推送日志流（每项都是已解码的 dict）
         """
         pass
 
@@ -19,7 +19,20 @@ except:
 class GitSourceManager:
     """Git 数据源管理器（基于数据库）"""
 
-    def __init__(self):
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        # 进程内单例：每次构建/请求都会调用 GitSourceManager()，无需重复初始化
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._init()
+                    cls._instance = instance
+        return cls._instance
+
+    def _init(self):
         self.lock = threading.RLock()
 
     def _to_dict(
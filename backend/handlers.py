@@ -1,23 +1,41 @@
 # handlers.py
 import asyncio
+import functools
+import hashlib
 import json
+import logging
 import os
+import random
+import queue
 import re
 import shutil
 import subprocess
+import tempfile
 import threading
+import time
 import urllib
 import uuid
+import weakref
 import gzip
+import heapq
+import io
 import zipfile
 import tarfile
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import ChainMap, OrderedDict, defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from http.server import BaseHTTPRequestHandler
 from urllib import parse
 from typing import Optional, List, Tuple
 import yaml
 
+try:
+    # 优先使用 libyaml 的 C 实现，解析速度明显快于纯 Python 实现
+    from yaml import CSafeLoader as _YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlSafeLoader
+
 from backend.config import (
     load_config,
     save_config,
@@ -28,6 +46,9 @@ from backend.config import (
     get_all_registries,
 )
 from backend.utils import generate_image_name, get_safe_filename
+from backend.database import get_db_session
+from backend.models import Task
+from backend.template_parser import parse_template, replace_template_variables
 from backend.auth import authenticate, verify_token, require_auth
 from backend.task_queue_manager import GlobalTaskQueueManager
 from backend.webhook_trigger import get_branch_mapping_value
@@ -43,21 +64,96 @@ USER_TEMPLATES_DIR = "data/templates"  # 用户自定义模板，通过Docker映
 # 前端文件
 DIST_DIR = "dist"  # 前端构建产物
 INDEX_FILE = "dist/index.html"  # 前端入口文件
+# 上传文件落盘时的复制缓冲区大小（4 MiB，远大于 copyfileobj 默认值）
+UPLOAD_COPY_BUFFER_SIZE = 4 << 20
+# 导出镜像时的写缓冲区大小（4 MiB）
+_EXPORT_WRITE_BUFFER_SIZE = 4 << 20
+# 构建日志中的分隔线及固定的标题块（预先拼接，整块写入一次）
+_BANNER = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+_BUILD_START_BANNER = _BANNER + "🚀 开始构建任务\n" + _BANNER
+_EXTRACT_DONE_BANNER = _BANNER + "✅ 解压完成，构建上下文已准备就绪\n" + _BANNER
+# Docker 拉取基础镜像失败的错误信息，提取镜像名
+_MANIFEST_NOT_FOUND_RE = re.compile(r"manifest for (\S+) not found")
+_MANIFEST_ERROR_HINT = (
+    "\n💡 镜像拉取失败分析:\n"
+    "   无法拉取基础镜像: %s\n"
+    "   可能的原因:\n"
+    "   1. 镜像不存在或已被删除\n"
+    "   2. 镜像标签不正确\n"
+    "   3. 网络连接问题或仓库访问受限\n"
+    "   4. 需要认证但未配置认证信息\n"
+    "   建议: 检查 Dockerfile 中的 FROM 指令，确认镜像名称和标签是否正确\n"
+)
+# 模拟模式（Docker 不可用）下的构建输出，预先拼接后整块写入一次
+_SIM_BUILD_TEMPLATE = (
+    "🧪 模拟模式：Docker 服务不可用\n"
+    "Step 1/4 : FROM {base_image} (模拟)\n"
+    "Step 2/4 : COPY . . (模拟)\n"
+    "Step 3/4 : WORKDIR /app (模拟)\n"
+    "Step 4/4 : CMD (模拟)\n"
+    "✅ 模拟构建成功: {full_tag}\n"
+)
+_SIM_PUSH_LAYERS = "".join(f"📡 Pushing layer {i}/3...\n" for i in range(1, 4))
+# 构建过程中轮询数据库任务状态（是否被停止）的最小间隔（秒）
+_STOP_POLL_INTERVAL = 0.5
+# 任务日志批量写入：单次合并的最大字符数、队列最大积压条数
+_LOG_BATCH_MAX_BYTES = 64 * 1024
+_LOG_QUEUE_MAX_ITEMS = 10000
+# 源码构建默认浅克隆深度（构建只需要目标分支/标签的工作区），0 或 None 表示完整克隆
+_GIT_CLONE_DEPTH = 1
+# 完整的 40 位提交 SHA（浅克隆时需要 init + fetch <sha> 的方式检出）
+_COMMIT_SHA_RE = re.compile(r"[0-9a-fA-F]{40}")
+# 一次性构建克隆的 git 传输参数：协议 v2 减少引用广播，跳过 fsync（克隆目录用完即删）
+# core.fsync 需要 git 2.36+，旧版本会忽略未知配置项
+_GIT_TRANSFER_OPTIONS = (
+    "-c", "protocol.version=2",
+    "-c", "core.fsync=none",
+    "-c", "fetch.negotiationAlgorithm=skipping",
+)
+# 多服务构建时并行推送服务镜像的最大线程数
+_MAX_PUSH_WORKERS = 8
+# 等待后台 registry 登录完成的最长时间（秒），超时后直接推送，由推送阶段的重新登录兜底
+_REGISTRY_LOGIN_TIMEOUT = 30
+# 推送遇到限流/临时错误时的最大尝试次数、指数退避的基数（秒）：1, 5, 25...，
+# 以及所有退避等待合计的上限（秒），避免重试拖住构建线程过久
+_PUSH_MAX_ATTEMPTS = 5
+_PUSH_BACKOFF_BASE = 1
+_PUSH_BACKOFF_TOTAL_CAP = 30
+# BuildManager 内存日志每个任务保留的最大行数
+_MEMORY_LOG_MAX_LINES = 10000
+
+logger = logging.getLogger(__name__)
 
 # 导入 Docker 构建器
-from backend.docker_builder import create_docker_builder
+from backend.docker_builder import MockDockerBuilder, create_docker_builder
 
 # 全局 Docker 构建器（在配置更新时会重新创建）
 docker_builder = None
 DOCKER_AVAILABLE = False
+# 当前构建器对应的 Docker 配置，配置未变化时复用已连接的客户端
+_docker_builder_config = None
 
 
 def init_docker_builder():
-    """初始化 Docker 构建器"""
-    global docker_builder, DOCKER_AVAILABLE
+    """初始化 Docker 构建器
+
+    配置未变化时先 ping 现有客户端，守护进程仍可达才复用；
+    否则（如 Docker 已重启）重新创建客户端。
+    """
+    global docker_builder, DOCKER_AVAILABLE, _docker_builder_config
     config = load_config()
     docker_config = config.get("docker", {})
+    if (
+        docker_builder is not None
+        and docker_config == _docker_builder_config
+        and not isinstance(docker_builder, MockDockerBuilder)
+        and docker_builder.ping()
+    ):
+        DOCKER_AVAILABLE = True
+        return docker_builder
+
     docker_builder = create_docker_builder(docker_config)
+    _docker_builder_config = docker_config
     DOCKER_AVAILABLE = docker_builder.is_available()
     print(f"🐳 Docker 构建器已初始化: {docker_builder.get_connection_info()}")
     return docker_builder
@@ -70,10 +166,236 @@ except Exception as e:
     print(f"⚠️ 初始化 Docker 构建器失败: {e}")
 
 
+# 错误信息中的控制字符（0x00-0x1F、0x7F）统一替换为空格
+_CTRL_TRANS = {c: 0x20 for c in (*range(0x20), 0x7F)}
+
+
+def _sanitize_error(e) -> str:
+    """将异常转换为可安全返回给前端的单行文本"""
+    return str(e).translate(_CTRL_TRANS).strip()
+
+
+# 构建输出块中需要记录的字段及其日志前缀（按输出顺序）
+_BUILD_CHUNK_FIELDS = (
+    ("stream", ""),
+    ("status", "📊 "),
+    ("progress", "⏳ "),
+    ("error", "❌ 构建错误: "),
+    ("errorDetail", "💥 错误详情: "),
+)
+_KNOWN_BUILD_CHUNK_KEYS = frozenset(
+    ("stream", "status", "progress", "error", "errorDetail", "aux", "id")
+)
+
+
+def _render_build_chunk(chunk: dict, line_prefix: str = ""):
+    """把一个构建输出块格式化为一段日志文本，返回 (text, error)
+
+    每个字段一行、自动补齐换行，整块只需一次 log 调用；遇到 error 字段后
+    停止（调用方随即抛出异常，后面的字段不再输出）。没有 error 时 error 为 None。
+    """
+    parts = []
+    for key, prefix in _BUILD_CHUNK_FIELDS:
+        value = chunk.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = str(value)
+        line = line_prefix + prefix + value
+        parts.append(line if line.endswith("\n") else line + "\n")
+        if key == "error":
+            return "".join(parts), value
+    return "".join(parts), None
+
+
+# 判定推送/登录错误为认证失败的关键字（忽略大小写，一次扫描，不生成小写副本）
+_AUTH_ERROR_RE = re.compile(
+    r"denied|unauthorized|401|authentication required", re.IGNORECASE
+)
+
+
+def _is_auth_error(msg, detail=None) -> bool:
+    """错误信息（及可选的 errorDetail）是否表示认证失败"""
+    if _AUTH_ERROR_RE.search(str(msg)):
+        return True
+    return bool(detail) and _AUTH_ERROR_RE.search(str(detail)) is not None
+
+
+# 判定推送错误为限流或临时故障（可退避重试）的关键字
+_TRANSIENT_PUSH_ERROR_RE = re.compile(
+    r"\b(?:429|50[0234])\b|too ?many ?requests|time[d ]?out|connection reset"
+    r"|connection refused|broken pipe|unexpected eof|service unavailable|bad gateway",
+    re.IGNORECASE,
+)
+
+
+def _is_transient_push_error(msg, detail=None) -> bool:
+    """错误信息（及可选的 errorDetail）是否表示限流或临时故障"""
+    if _TRANSIENT_PUSH_ERROR_RE.search(str(msg)):
+        return True
+    return bool(detail) and _TRANSIENT_PUSH_ERROR_RE.search(str(detail)) is not None
+
+
+def _diagnose_manifest_error(error_msg: str):
+    """基础镜像拉取失败（manifest for <image> not found）时返回分析提示，否则返回 None"""
+    image_match = _MANIFEST_NOT_FOUND_RE.search(error_msg)
+    if not image_match:
+        return None
+    return _MANIFEST_ERROR_HINT % image_match.group(1)
+
+
+# 镜像名中的 registry 部分：第一个 "/" 之前、且包含 "." 的段
+_IMAGE_REGISTRY_RE = re.compile(r"([^/]*\.[^/]*)/")
+# 仓库地址中可能带有的协议前缀（http:// 或 https://）
+_REGISTRY_SCHEME_RE = re.compile(r"^https?://", re.I)
+
+
+# 匹配阶段使用的紧凑仓库条目：名称、地址，以及 config_by_name 所用的 key（registry_id 或名称）
+_RegistryRef = namedtuple("_RegistryRef", "name address key")
+
+
+class _AddressTrieNode:
+    """registry 地址前缀树节点"""
+
+    __slots__ = ("children", "registry", "first")
+
+    def __init__(self):
+        self.children = {}
+        self.registry = None  # 地址恰好在此结束的仓库
+        self.first = None  # 子树中最先加入的仓库（地址以此前缀开头）
+
+
+class _RegistryMatcher:
+    """按镜像名匹配推送/拉取用的 registry 配置
+
+    一次构建（或导出）内只读取一次仓库列表：完全匹配走地址字典，
+    部分匹配在地址前缀树上沿镜像的 registry 走一遍，与仓库数量无关；
+    按名称取到的配置（含解密密码）也按 key 缓存，多个服务推送到同一仓库时不再重复查询和解密。
+    """
+
+    def __init__(self, team_id=None, user_id=None):
+        self.team_id = team_id
+        self.user_id = user_id
+        self.registry_count = 0
+        self._by_address = None
+        self._trie = None
+        self._matches = {}
+        self._configs = {}
+        self._active = None
+
+    @staticmethod
+    def image_registry(image_name: str):
+        """从 registry.com/namespace/image 形式的镜像名提取 registry 地址，没有时返回 None"""
+        match = _IMAGE_REGISTRY_RE.match(image_name)
+        return match.group(1) if match else None
+
+    def _load(self):
+        registries = get_all_registries(team_id=self.team_id, user_id=self.user_id)
+        by_address = {}
+        for reg in registries:
+            address = reg.get("registry", "")
+            if address and address not in by_address:
+                # 地址重复时保留列表中的第一个，与逐个扫描时一致；
+                # 索引只保存紧凑条目，完整配置由 config_for 按需获取
+                by_address[address] = _RegistryRef(
+                    reg.get("name", "Unknown"),
+                    address,
+                    reg.get("registry_id") or reg.get("name"),
+                )
+        trie = _AddressTrieNode()
+        for address, reg in by_address.items():
+            # 仓库地址按用户输入保存，可能带协议或命名空间（如 host/ns），前缀树只按主机部分匹配
+            host = _REGISTRY_SCHEME_RE.sub("", address).split("/", 1)[0]
+            if not host:
+                continue
+            node = trie
+            for ch in host:
+                node = node.children.setdefault(ch, _AddressTrieNode())
+                if node.first is None:
+                    node.first = reg
+            if node.registry is None:
+                node.registry = reg
+        self.registry_count = len(registries)
+        self._by_address = by_address
+        self._trie = trie
+
+    def find(self, image_name: str):
+        """返回 (registry 条目, 匹配方式)，匹配方式为 "exact" 或 "partial"，未匹配返回 (None, None)
+
+        registry 条目为 _RegistryRef（不含密码），用 config_for 获取完整配置。
+        """
+        image_registry = self.image_registry(image_name)
+        if not image_registry:
+            return None, None
+        # 多个服务通常推送到同一个 registry，按地址缓存匹配结果
+        cached = self._matches.get(image_registry)
+        if cached is None:
+            cached = self._matches[image_registry] = self._find_by_host(image_registry)
+        return cached
+
+    def _find_by_host(self, image_registry: str):
+        """在地址字典和前缀树上匹配 registry 地址（结果由 find 缓存）"""
+        if self._by_address is None:
+            self._load()
+
+        reg = self._by_address.get(image_registry)
+        if reg is not None:
+            return reg, "exact"
+
+        # 沿镜像 registry 逐字符下行：途经的最长仓库主机是它的前缀；
+        # 整串走完时，子树中的仓库主机都以它为前缀。
+        # 只在主机名边界（串尾或端口分隔符 ":"）处匹配，避免 reg.com 匹配到 reg.com.evil.com
+        node = self._trie
+        longest_prefix = None
+        for i, ch in enumerate(image_registry, 1):
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.registry is not None and image_registry[i : i + 1] in ("", ":"):
+                longest_prefix = node.registry
+        else:
+            if longest_prefix is None:
+                port_node = node.children.get(":")
+                longest_prefix = port_node.first if port_node else None
+        if longest_prefix is not None:
+            return longest_prefix, "partial"
+        return None, None
+
+    def config_by_name(self, name):
+        """按名称或 ID 获取仓库配置（含解密密码），同一构建内只查询一次"""
+        if name not in self._configs:
+            self._configs[name] = get_registry_by_name(
+                name, team_id=self.team_id, user_id=self.user_id
+            )
+        return self._configs[name]
+
+    def config_for(self, reg):
+        return self.config_by_name(reg.key)
+
+    def active_config(self):
+        """激活仓库配置（未匹配到仓库时的后备），同一构建内只查询一次"""
+        if self._active is None:
+            self._active = get_active_registry(
+                team_id=self.team_id, user_id=self.user_id
+            )
+        return self._active
+
+    def match(self, image_name: str):
+        """根据镜像名返回匹配的仓库配置（含解密密码），未匹配返回 None"""
+        reg, _ = self.find(image_name)
+        return self.config_for(reg) if reg is not None else None
+
+
+_NATURAL_SORT_SPLIT_RE = re.compile(r"(\d+)")
+
+
+@functools.lru_cache(maxsize=1024)
 def natural_sort_key(s):
-    return [
-        int(text) if text.isdigit() else text.lower() for text in re.split(r"(\d+)", s)
-    ]
+    # 返回元组：结果会被缓存复用，不能是可变列表
+    return tuple(
+        int(text) if text.isdigit() else text.lower()
+        for text in _NATURAL_SORT_SPLIT_RE.split(s)
+    )
 
 
 def _usernames_by_id(user_ids):
@@ -126,7 +448,7 @@ def validate_and_clean_image_name(image_name: str) -> str:
             cleaned_name = image_name[7:]
 
         raise ValueError(
-            f"镜像名称不能包含协议前缀（http:// 或 https://）。"
+            "镜像名称不能包含协议前缀（http:// 或 https://）。"
             f"请使用格式: {cleaned_name}，而不是 {image_name}"
         )
 
@@ -143,47 +465,391 @@ def validate_and_clean_image_name(image_name: str) -> str:
 
 
 # === 模板目录辅助函数 ===
-def get_all_templates():
-    """获取所有模板列表（内置 + 用户自定义），支持子目录分类，用户模板优先"""
+# 项目类型（模板子目录名）只允许小写字母、数字、下划线和连字符
+_PROJECT_TYPE_RE = re.compile(r"^[a-z0-9_-]+$")
+# 常见项目类型子目录，按顺序查找模板
+_TEMPLATE_PROJECT_TYPES = ("jar", "nodejs", "python", "go", "rust", "web")
+
+
+# 模板修改时间的 ISO 格式缓存（按 st_mtime_ns），模板文件很少变动，避免重复格式化
+_TEMPLATE_MTIME_CACHE_SIZE = 1024
+_template_mtime_iso_cache = {}
+
+
+def _format_template_mtime(stat_result) -> str:
+    mtime_ns = stat_result.st_mtime_ns
+    formatted = _template_mtime_iso_cache.get(mtime_ns)
+    if formatted is None:
+        if len(_template_mtime_iso_cache) >= _TEMPLATE_MTIME_CACHE_SIZE:
+            _template_mtime_iso_cache.clear()
+        formatted = datetime.fromtimestamp(stat_result.st_mtime).isoformat()
+        _template_mtime_iso_cache[mtime_ns] = formatted
+    return formatted
+
+
+# 成员数超过该值的 zip 才使用多线程解压，小压缩包串行更快
+_PARALLEL_UNZIP_MIN_MEMBERS = 64
+
+
+def _extract_zip(zip_ref: zipfile.ZipFile, extract_to: str) -> None:
+    """解压 zip；成员较多时按文件并行解压（zlib 解压期间会释放 GIL）"""
+    members = zip_ref.infolist()
+    workers = min(os.cpu_count() or 1, 8)
+    if workers < 2 or len(members) < _PARALLEL_UNZIP_MIN_MEMBERS:
+        zip_ref.extractall(extract_to)
+        return
+
+    # 先串行创建目录，避免多个线程同时创建同一父目录
+    files = []
+    parents = set()
+    for info in members:
+        if info.is_dir():
+            zip_ref.extract(info, extract_to)
+        else:
+            files.append(info)
+            parent = info.filename.rpartition("/")[0]
+            if parent and parent not in parents:
+                parents.add(parent)
+                # 通过 extract 创建目录，沿用 zipfile 对路径的安全处理
+                zip_ref.extract(zipfile.ZipInfo(parent + "/"), extract_to)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(lambda info: zip_ref.extract(info, extract_to), files):
+            pass
+
+
+def _extract_tar(tar_ref: tarfile.TarFile, extract_to: str) -> int:
+    """解压 tar 并返回成员数量
+
+    边解压边计数，不再先 getnames() 读一遍整个压缩包（gzip 无法随机访问，
+    第二遍需要从头重新解压）。
+    """
+    count = 0
+
+    def counting_members():
+        nonlocal count
+        for member in tar_ref:
+            count += 1
+            yield member
+
+    tar_ref.extractall(extract_to, members=counting_members())
+    return count
+
+
+def _extract_tar_gz_with_pigz(file_path: str, extract_to: str):
+    """使用 pigz 多线程解压 tar.gz
+
+    Returns:
+        解压出的成员数量；pigz/tar 不可用或执行失败时返回 None，由调用方回退到 tarfile。
+        执行失败时会先删除本次新写出的顶层文件/目录，回退解压不会与残留内容混在一起
+    """
+    pigz = shutil.which("pigz")
+    tar = shutil.which("tar")
+    if not pigz or not tar:
+        return None
+    existing = set(os.listdir(extract_to))
+    try:
+        with subprocess.Popen(
+            [pigz, "-dc", file_path], stdout=subprocess.PIPE
+        ) as pigz_proc:
+            tar_proc = subprocess.run(
+                [tar, "-xvf", "-", "-C", extract_to],
+                stdin=pigz_proc.stdout,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            pigz_proc.stdout.close()
+            pigz_returncode = pigz_proc.wait()
+        succeeded = pigz_returncode == 0 and tar_proc.returncode == 0
+    except OSError:
+        succeeded = False
+    if not succeeded:
+        for name in set(os.listdir(extract_to)) - existing:
+            path = os.path.join(extract_to, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.unlink(path)
+        return None
+    return len(tar_proc.stdout.splitlines())
+
+
+# (单位, 除数) 查表：下标即 bit_length 对应的单位级数
+_SIZE_UNITS = tuple(
+    (name, 1 << (10 * i)) for i, name in enumerate(("B", "KB", "MB", "GB", "TB"))
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _fmt_size(size: int) -> str:
+    """格式化字节数，如 512 B、1.50 KB、2.00 MB"""
+    # 每 10 个二进制位进一级单位
+    unit = min(max(size.bit_length() - 1, 0) // 10, len(_SIZE_UNITS) - 1)
+    if unit == 0:
+        return f"{size} B"
+    name, divisor = _SIZE_UNITS[unit]
+    return f"{size / divisor:.2f} {name}"
+
+
+# 正在被后台线程删除的 *.deleting-* 目录，避免多个线程重复删除同一目录
+_removing_trees = set()
+_removing_trees_lock = threading.Lock()
+
+
+def _rmtree_all(paths) -> None:
+    for doomed in paths:
+        shutil.rmtree(doomed, ignore_errors=True)
+        with _removing_trees_lock:
+            _removing_trees.discard(doomed)
+
+
+def _remove_tree_async(path: str) -> None:
+    """在后台线程中删除目录，不阻塞调用方
+
+    先把目录原子地改名为唯一的临时名称再删除，同名目录（如同一任务重试）
+    可以立即重新创建而不会被后台删除误伤。进程在删除完成前退出时会遗留
+    *.deleting-* 目录，每次调用时一并清理同级目录下的这些残留。
+    """
+    path = path.rstrip(os.sep)
+    parent = os.path.dirname(path) or "."
+    doomed = os.path.join(
+        parent, f"{os.path.basename(path)}.deleting-{uuid.uuid4().hex[:8]}"
+    )
+    try:
+        os.rename(path, doomed)
+    except FileNotFoundError:
+        doomed = None
+    try:
+        leftovers = [
+            os.path.join(parent, name)
+            for name in os.listdir(parent)
+            if ".deleting-" in name
+        ]
+    except OSError:
+        leftovers = []
+    with _removing_trees_lock:
+        targets = [
+            target
+            for target in dict.fromkeys(([doomed] if doomed else []) + leftovers)
+            if target not in _removing_trees
+        ]
+        _removing_trees.update(targets)
+    if not targets:
+        return
+    threading.Thread(
+        target=_rmtree_all,
+        args=(targets,),
+        name="rmtree-build-context",
+        daemon=True,
+    ).start()
+
+
+def preallocate_file(f, size) -> None:
+    """按已知大小预分配文件空间（Linux posix_fallocate），减少写入过程中的碎片和扩展元数据更新
+
+    不支持的平台或文件系统上静默跳过。预分配会把文件长度扩展到 size，
+    写完后应在实际写入位置 truncate，以防实际内容比声明的短。
+    """
+    if not size or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError:
+        pass
+
+
+def _place_upload_file(src: str, dst: str) -> None:
+    """把 staging 中的上传文件放入构建上下文
+
+    优先创建硬链接（同一文件系统下零拷贝）；跨文件系统或目标已存在时回退到
+    shutil.copyfile（Linux 上由内核 sendfile 完成复制）。staging 文件需保留，
+    因此不能直接 os.replace。
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# 源码构建时写入构建上下文的默认 .dockerignore（预先编码，直接一次 os.write）
+_DOCKERIGNORE_BYTES = """# Git 相关
+.git
+.gitignore
+.gitattributes
+
+# Python 缓存
+__pycache__
+*.pyc
+*.pyo
+*.pyd
+.Python
+.pytest_cache
+.venv
+venv/
+
+# Node.js
+node_modules/
+npm-debug.log*
+yarn-debug.log*
+yarn-error.log*
+
+# IDE
+.idea/
+.vscode/
+.cursor/
+*.swp
+*.swo
+.DS_Store
+
+# 测试和文档
+test_*.py
+*_test.py
+*.md
+README*
+LICENSE
+
+# 日志
+*.log
+logs/
+""".encode("utf-8")
+
+
+def _is_within_dir(base_dir: str, path: str) -> bool:
+    """判断 path 解析符号链接后是否仍位于 base_dir 内（用于约束仓库中的不可信路径）"""
+    base_real = os.path.realpath(base_dir)
+    path_real = os.path.realpath(path)
+    return os.path.commonpath([base_real, path_real]) == base_real
+
+
+def _unlink_if_exists(path: str) -> None:
+    """删除已存在的文件或符号链接，避免随后写入时跟随仓库中的符号链接写到别处"""
+    if os.path.lexists(path):
+        os.unlink(path)
+
+
+# 构建配置日志中需要隐藏的键名敏感词（合并为一个预编译正则）以及即使命中也安全的键
+_SENSITIVE_KEY_RE = re.compile(
+    "|".join(
+        map(
+            re.escape,
+            (
+                "password",
+                "token",
+                "secret",
+                "credential",
+                "auth",
+                "access_token",
+                "api_key",
+                "apikey",
+                "private_key",
+                "privatekey",
+                "pwd",
+                "passwd",
+            ),
+        )
+    )
+)
+_SAFE_CONFIG_KEYS = frozenset(
+    ("image_name", "tag", "tag_name", "dockerfile_name", "template_name")
+)
+
+
+def _sanitize_config(config_dict):
+    """过滤配置中的敏感信息（键名包含敏感词的值替换为占位符）"""
+    if not isinstance(config_dict, dict):
+        return config_dict
+
+    sanitized = {}
+    for k, v in config_dict.items():
+        # 排除一些安全的键名（即使包含敏感词，如 image_name, tag_name 等）
+        if k not in _SAFE_CONFIG_KEYS and _SENSITIVE_KEY_RE.search(k.lower()):
+            sanitized[k] = "***已隐藏***"
+        elif isinstance(v, dict):
+            sanitized[k] = _sanitize_config(v)
+        elif isinstance(v, list):
+            sanitized[k] = [
+                _sanitize_config(item) if isinstance(item, dict) else item
+                for item in v
+            ]
+        else:
+            sanitized[k] = v
+    return sanitized
+
+
+def _iter_files_scandir(top):
+    """递归遍历目录下的文件（不跟随目录符号链接），返回 os.DirEntry 以复用其 stat 缓存"""
+    try:
+        with os.scandir(top) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_files_scandir(entry.path)
+            elif entry.is_file():
+                yield entry
+        except OSError:
+            continue
+
+
+def get_all_templates(include_stat=False):
+    """获取所有模板列表（内置 + 用户自定义），支持子目录分类，用户模板优先
+
+    Args:
+        include_stat: 为 True 时每个条目附带 "stat"（目录扫描时取得的 os.stat_result，
+            无法获取时为 None），避免调用方再次按路径 stat
+    """
     templates = {}
 
+    def add_template(entry, template_type, project_type):
+        name = entry.name[: -len(".Dockerfile")]
+        info = {
+            "name": name,
+            "path": entry.path,
+            "type": template_type,
+            "project_type": project_type,
+        }
+        if include_stat:
+            try:
+                info["stat"] = entry.stat()
+            except OSError:
+                info["stat"] = None
+        templates[name] = info
+
     def scan_templates(base_dir, template_type):
         """扫描模板目录，支持子目录（项目类型）"""
-        if not os.path.exists(base_dir):
+        try:
+            with os.scandir(base_dir) as it:
+                entries = list(it)
+        except OSError:
             return
 
         # 扫描根目录的模板（向后兼容）
-        for f in os.listdir(base_dir):
-            if f.endswith(".Dockerfile"):
-                name = f.replace(".Dockerfile", "")
+        for entry in entries:
+            if entry.name.endswith(".Dockerfile"):
                 # 从文件名推断项目类型（兼容模式）
-                project_type = "nodejs" if "node" in name.lower() else "jar"
-                templates[name] = {
-                    "name": name,
-                    "path": os.path.join(base_dir, f),
-                    "type": template_type,
-                    "project_type": project_type,
-                }
+                name = entry.name[: -len(".Dockerfile")]
+                add_template(
+                    entry, template_type, "nodejs" if "node" in name.lower() else "jar"
+                )
 
         # 扫描子目录（项目类型目录）
-        for project_type in os.listdir(base_dir):
-            type_dir = os.path.join(base_dir, project_type)
-            if not os.path.isdir(type_dir):
-                continue
-
+        for type_entry in entries:
+            project_type = type_entry.name
             # 跳过隐藏目录和特殊目录
             if project_type.startswith(".") or project_type.startswith("_"):
                 continue
+            if not type_entry.is_dir():
+                continue
 
-            for f in os.listdir(type_dir):
-                if f.endswith(".Dockerfile"):
-                    name = f.replace(".Dockerfile", "")
-                    templates[name] = {
-                        "name": name,
-                        "path": os.path.join(type_dir, f),
-                        "type": template_type,
-                        "project_type": project_type,
-                    }
+            try:
+                with os.scandir(type_entry.path) as it:
+                    for entry in it:
+                        if entry.name.endswith(".Dockerfile"):
+                            add_template(entry, template_type, project_type)
+            except OSError:
+                continue
 
     # 1. 先加载内置模板
     scan_templates(BUILTIN_TEMPLATES_DIR, "builtin")
@@ -194,6 +860,60 @@ def get_all_templates():
     return templates
 
 
+def get_template_info(template_name):
+    """定位单个模板（用户模板优先），只检查候选路径而不扫描全部模板
+
+    Returns:
+        与 get_all_templates() 中条目结构相同的字典，模板不存在时返回 None
+    """
+    # 模板名称只能是单个文件名，避免拼接出模板目录之外的路径
+    if not template_name or "/" in template_name or "\\" in template_name:
+        return None
+    filename = f"{template_name}.Dockerfile"
+
+    def make_info(path, template_type, project_type):
+        return {
+            "name": template_name,
+            "path": path,
+            "type": template_type,
+            "project_type": project_type,
+        }
+
+    for base_dir, template_type in (
+        (USER_TEMPLATES_DIR, "user"),
+        (BUILTIN_TEMPLATES_DIR, "builtin"),
+    ):
+        # 1. 常见项目类型子目录
+        for project_type in _TEMPLATE_PROJECT_TYPES:
+            path = os.path.join(base_dir, project_type, filename)
+            if os.path.lexists(path):
+                return make_info(path, template_type, project_type)
+
+        # 2. 其他自定义项目类型子目录
+        try:
+            with os.scandir(base_dir) as entries:
+                for entry in entries:
+                    if (
+                        entry.name in _TEMPLATE_PROJECT_TYPES
+                        or entry.name.startswith((".", "_"))
+                        or not entry.is_dir()
+                    ):
+                        continue
+                    path = os.path.join(entry.path, filename)
+                    if os.path.lexists(path):
+                        return make_info(path, template_type, entry.name)
+        except FileNotFoundError:
+            continue
+
+        # 3. 根目录（向后兼容，从文件名推断项目类型）
+        path = os.path.join(base_dir, filename)
+        if os.path.lexists(path):
+            project_type = "nodejs" if "node" in template_name.lower() else "jar"
+            return make_info(path, template_type, project_type)
+
+    return None
+
+
 def get_template_path(template_name, project_type=None):
     """获取指定模板的文件路径，支持子目录，优先返回用户自定义模板"""
     filename = f"{template_name}.Dockerfile"
@@ -212,7 +932,7 @@ def get_template_path(template_name, project_type=None):
 
     # 如果没有指定项目类型，遍历所有子目录查找
     if not project_type:
-        for ptype in ["jar", "nodejs", "python", "go", "rust", "web"]:
+        for ptype in _TEMPLATE_PROJECT_TYPES:
             # 用户模板目录
             user_type_path = os.path.join(USER_TEMPLATES_DIR, ptype, filename)
             if os.path.exists(user_type_path):
@@ -242,6 +962,10 @@ def get_user_template_path(template_name, project_type="jar"):
     return os.path.join(type_dir, f"{template_name}.Dockerfile")
 
 
+# ENV KEY=value 键值对（支持带引号、含空格的值）
+_ENV_KV_RE = re.compile(r'(\w+)=("(?:[^"\\]|\\.)*"|\S+)')
+
+
 def parse_dockerfile_services(dockerfile_content: str) -> tuple:
     """
     解析 Dockerfile，识别所有服务阶段（FROM ... AS <stage_name>）
@@ -264,19 +988,15 @@ def parse_dockerfile_services(dockerfile_content: str) -> tuple:
     # 注意：只排除明确的构建阶段，不要排除可能作为最终镜像的阶段
     excluded_stages = {"builder", "build", "runtime", "deps", "dependencies"}
     # 排除以 -builder 结尾的阶段（如 frontend-builder），但保留 -base 结尾的（如 backend-base 可能是最终镜像）
-    excluded_suffixes = ["-builder"]
+    excluded_suffixes = ("-builder",)
 
     def is_excluded_stage(stage_name: str) -> bool:
         """检查阶段名称是否应该被排除（不识别为服务）"""
         stage_lower = stage_name.lower()
-        # 完全匹配排除列表
-        if stage_lower in excluded_stages:
-            return True
-        # 匹配排除的后缀（如 -builder）
-        for suffix in excluded_suffixes:
-            if stage_lower.endswith(suffix):
-                return True
-        return False
+        # 完全匹配排除列表，或匹配排除的后缀（如 -builder）
+        return stage_lower in excluded_stages or stage_lower.endswith(
+            excluded_suffixes
+        )
 
     lines = dockerfile_content.split("\n")
     current_stage = None
@@ -367,15 +1087,11 @@ def parse_dockerfile_services(dockerfile_content: str) -> tuple:
                 # ENV 可能有两种格式：
                 # 1. ENV KEY=value
                 # 2. ENV KEY value
-                if "=" in env_line:
+                env_pairs = _ENV_KV_RE.findall(env_line)
+                if env_pairs:
                     # 格式1: KEY=value（可能多个，用空格分隔）
-                    parts = env_line.split()
-                    for part in parts:
-                        if "=" in part:
-                            key, value = part.split("=", 1)
-                            current_params["env"][key.strip()] = value.strip().strip(
-                                "\"'"
-                            )
+                    for key, value in env_pairs:
+                        current_params["env"][key] = value.strip("\"'")
                 else:
                     # 格式2: KEY value（单个环境变量）
                     parts = env_line.split(None, 1)
@@ -445,6 +1161,84 @@ def parse_dockerfile_services(dockerfile_content: str) -> tuple:
     return services, global_params
 
 
+# compose 解析结果缓存：内容摘要 -> 镜像列表（编辑时经常重复提交相同内容）
+_COMPOSE_CACHE_SIZE = 32
+_compose_images_cache = OrderedDict()
+_compose_images_cache_lock = threading.Lock()
+
+
+def _get_cached_compose_images(digest: bytes):
+    with _compose_images_cache_lock:
+        images = _compose_images_cache.get(digest)
+        if images is not None:
+            _compose_images_cache.move_to_end(digest)
+        return images
+
+
+def _cache_compose_images(digest: bytes, images: list) -> None:
+    with _compose_images_cache_lock:
+        _compose_images_cache[digest] = images
+        _compose_images_cache.move_to_end(digest)
+        while len(_compose_images_cache) > _COMPOSE_CACHE_SIZE:
+            _compose_images_cache.popitem(last=False)
+
+
+# 镜像引用：name 尽量短，其后是 @digest 或不含 / 的 :tag
+_IMG_RE = re.compile(r"^(?P<name>[^@]*?)(?:@(?P<digest>.*)|:(?P<tag>[^:/@]*))?$", re.S)
+
+
+@functools.lru_cache(maxsize=256)
+def _split_image_reference(reference: str):
+    """拆分镜像引用为 (name, tag)，digest 引用返回 digest 作为 tag"""
+    if not reference:
+        return "", "latest"
+    m = _IMG_RE.match(reference)
+    return m["name"], m["digest"] or m["tag"] or "latest"
+
+
+# multipart/form-data 解析
+_MULTIPART_CHUNK_SIZE = 1024 * 1024  # 每次从请求体读取 1 MiB
+_MULTIPART_NAME_RE = re.compile(r'\bname="([^"]*)"')
+_MULTIPART_FILENAME_RE = re.compile(r'\bfilename="([^"]*)"')
+
+
+class MultipartPart:
+    """multipart/form-data 请求中的单个字段
+
+    普通字段的内容保存在 data 中；文件字段的内容直接写入 file_path 指向的临时文件。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        filename: Optional[str],
+        data: bytes = b"",
+        file_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.filename = filename
+        self.data = data
+        self.file_path = file_path
+
+    def read(self) -> bytes:
+        if self.file_path:
+            with open(self.file_path, "rb") as f:
+                return f.read()
+        return self.data
+
+    def text(self) -> str:
+        return self.data.decode("utf-8", errors="ignore")
+
+    def discard(self) -> None:
+        """删除文件字段对应的临时文件"""
+        if self.file_path:
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                pass
+            self.file_path = None
+
+
 class App2DockerHandler(BaseHTTPRequestHandler):
     server_version = "App2Docker/1.0"
 
@@ -691,7 +1485,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 200, {"templates": [item["name"] for item in details], "items": details}
             )
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
+            clean_msg = _sanitize_error(e)
             self._send_json(
                 500, {"error": f"获取模板信息失败: {clean_msg or '未知错误'}"}
             )
@@ -712,7 +1506,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
         except ValueError as ve:
             self._send_json(400, {"error": str(ve)})
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
+            clean_msg = _sanitize_error(e)
             self._send_json(500, {"error": f"获取模板失败: {clean_msg or '未知错误'}"})
 
     def handle_export_image(self, query_params):
@@ -771,9 +1565,9 @@ class App2DockerHandler(BaseHTTPRequestHandler):
             tar_path = os.path.join(EXPORT_DIR, tar_filename)
 
             image_stream = docker_builder.export_image(full_tag)
-            with open(tar_path, "wb") as f:
-                for chunk in image_stream:
-                    f.write(chunk)
+            # 使用大缓冲区合并小块写入，writelines 在 C 层遍历数据块
+            with open(tar_path, "wb", buffering=_EXPORT_WRITE_BUFFER_SIZE) as f:
+                f.writelines(image_stream)
 
             final_path = tar_path
             download_name = tar_filename
@@ -784,7 +1578,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 download_name = os.path.basename(final_path)
                 content_type = "application/gzip"
                 with open(tar_path, "rb") as src, gzip.open(final_path, "wb") as dst:
-                    shutil.copyfileobj(src, dst)
+                    shutil.copyfileobj(src, dst, _EXPORT_WRITE_BUFFER_SIZE)
                 os.remove(tar_path)
 
             success = self._send_file(
@@ -796,7 +1590,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 except OSError:
                     pass
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip() or "未知错误"
+            clean_msg = _sanitize_error(e) or "未知错误"
             self._send_json(500, {"error": f"导出镜像失败: {clean_msg}"})
 
     def do_POST(self):
@@ -818,28 +1612,112 @@ class App2DockerHandler(BaseHTTPRequestHandler):
         else:
             self.send_error(404)
 
-    def handle_suggest_image_name(self):
-        try:
-            content_length = int(self.headers["Content-Length"])
-            body = self.rfile.read(content_length)
+    def _iter_multipart(self, discard_files: bool = False):
+        """流式解析 multipart/form-data 请求体，逐个产出 MultipartPart
 
-            boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
-            parts = body.split(b"--" + boundary)
+        按块读取 self.rfile，不会一次性将整个请求体读入内存。文件字段直接写入
+        UPLOAD_DIR 下的临时文件（调用方负责移动或 discard）；discard_files 为
+        True 时只保留文件名，丢弃文件内容。
+        """
+        boundary = self.headers.get_boundary()
+        if not boundary:
+            raise ValueError("请求缺少 multipart boundary")
+        delimiter = b"\r\n--" + boundary.encode()
+        remaining = int(self.headers.get("Content-Length", 0))
+        # 在最前面补一个换行，使第一个分隔符与后续分隔符格式一致
+        buf = bytearray(b"\r\n")
+
+        def fill() -> bool:
+            nonlocal remaining
+            if remaining <= 0:
+                return False
+            chunk = self.rfile.read(min(remaining, _MULTIPART_CHUNK_SIZE))
+            if not chunk:
+                remaining = 0
+                return False
+            remaining -= len(chunk)
+            buf.extend(chunk)
+            return True
 
-            app_filename = None
-            for part in parts[1:-1]:
-                if (
-                    b"\r\n\r\n" in part
-                    and b'name="jar_file"' in part
-                    and b'filename="' in part
-                ):
-                    headers = part[: part.find(b"\r\n\r\n")].decode(
-                        "utf-8", errors="ignore"
-                    )
-                    match = re.search(r'filename="(.+?)"', headers)
-                    if match:
-                        app_filename = match.group(1)
+        # 跳过第一个分隔符之前的内容
+        while True:
+            index = buf.find(delimiter)
+            if index >= 0:
+                del buf[: index + len(delimiter)]
+                break
+            if not fill():
+                return
+
+        while True:
+            while len(buf) < 2:
+                if not fill():
+                    return
+            if buf[:2] == b"--":  # 结束分隔符
+                return
+
+            header_end = buf.find(b"\r\n\r\n")
+            while header_end < 0:
+                if not fill():
+                    return
+                header_end = buf.find(b"\r\n\r\n")
+            headers = bytes(buf[:header_end]).decode("utf-8", errors="ignore")
+            del buf[: header_end + 4]
+
+            name_match = _MULTIPART_NAME_RE.search(headers)
+            filename_match = _MULTIPART_FILENAME_RE.search(headers)
+            name = name_match.group(1) if name_match else ""
+            filename = filename_match.group(1) if filename_match else None
+
+            if filename is None:
+                sink = io.BytesIO()
+            elif discard_files:
+                sink = None
+            else:
+                os.makedirs(UPLOAD_DIR, exist_ok=True)
+                sink = tempfile.NamedTemporaryFile(
+                    dir=UPLOAD_DIR, suffix=".upload", delete=False
+                )
+
+            try:
+                while True:
+                    index = buf.find(delimiter)
+                    if index >= 0:
+                        if sink is not None:
+                            # 通过 memoryview 写出，避免切片再复制一份数据
+                            with memoryview(buf) as view:
+                                sink.write(view[:index])
+                        del buf[: index + len(delimiter)]
                         break
+                    # 保留可能被截断的分隔符前缀，其余数据写入当前字段
+                    keep = len(delimiter) - 1
+                    if len(buf) > keep:
+                        if sink is not None:
+                            with memoryview(buf) as view:
+                                sink.write(view[:-keep])
+                        del buf[:-keep]
+                    if not fill():
+                        raise ValueError("multipart 请求体不完整")
+            except BaseException:
+                if filename is not None and sink is not None:
+                    sink.close()
+                    os.remove(sink.name)
+                raise
+
+            if filename is None:
+                yield MultipartPart(name, None, data=sink.getvalue())
+            elif sink is None:
+                yield MultipartPart(name, filename)
+            else:
+                sink.close()
+                yield MultipartPart(name, filename, file_path=sink.name)
+
+    def handle_suggest_image_name(self):
+        try:
+            app_filename = None
+            for part in self._iter_multipart(discard_files=True):
+                if part.name == "jar_file" and part.filename:
+                    app_filename = part.filename
+                    break
 
             if not app_filename:
                 self._send_json(400, {"error": "未找到文件"})
@@ -861,27 +1739,9 @@ class App2DockerHandler(BaseHTTPRequestHandler):
 
     def handle_save_config(self):
         try:
-            content_length = int(self.headers["Content-Length"])
-            body = self.rfile.read(content_length)
-
-            boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
-            parts = body.split(b"--" + boundary)
-            form_data = {}
-
-            for part in parts[1:-1]:
-                if b"\r\n\r\n" in part:
-                    header_end = part.find(b"\r\n\r\n")
-                    headers = part[:header_end].decode("utf-8", errors="ignore")
-                    data = part[header_end + 4 :].rstrip(b"\r\n")
-
-                    if 'name="' in headers:
-                        try:
-                            field_name = headers.split('name="')[1].split('"')[0]
-                            form_data[field_name] = data.decode(
-                                "utf-8", errors="ignore"
-                            )
-                        except:
-                            continue
+            form_data = {
+                part.name: part.text() for part in self._iter_multipart() if part.name
+            }
 
             config = load_config()
             new_docker_config = {
@@ -933,75 +1793,58 @@ class App2DockerHandler(BaseHTTPRequestHandler):
             import traceback
 
             traceback.print_exc()
-            error_msg = str(e)
-            clean_error_msg = re.sub(r"[\x00-\x1F\x7F]", " ", error_msg).strip()
+            clean_error_msg = _sanitize_error(e)
             self._send_json(500, {"error": f"保存配置失败: {clean_error_msg}"})
 
     def _collect_template_details(self):
         """收集所有模板详情（内置 + 用户自定义）"""
         details = []
-        templates = get_all_templates()
+        templates = get_all_templates(include_stat=True)
 
         for name, info in templates.items():
-            try:
-                stat = os.stat(info["path"])
-                details.append(
-                    {
-                        "name": name,
-                        "filename": os.path.basename(info["path"]),
-                        "size": stat.st_size,
-                        "updated_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                        "type": info["type"],  # 'builtin' 或 'user'
-                        "project_type": info.get(
-                            "project_type", "jar"
-                        ),  # 项目类型：jar 或 nodejs
-                        "editable": info["type"] == "user",  # 只有用户模板可编辑
-                    }
-                )
-            except OSError:
+            # 直接使用目录扫描时得到的 stat，无法获取（如失效链接）时跳过
+            stat = info["stat"]
+            if stat is None:
                 continue
+            details.append(
+                {
+                    "name": name,
+                    "filename": os.path.basename(info["path"]),
+                    "size": stat.st_size,
+                    "updated_at": _format_template_mtime(stat),
+                    "type": info["type"],  # 'builtin' 或 'user'
+                    "project_type": info.get(
+                        "project_type", "jar"
+                    ),  # 项目类型：jar 或 nodejs
+                    "editable": info["type"] == "user",  # 只有用户模板可编辑
+                }
+            )
 
         details.sort(key=lambda item: natural_sort_key(item["name"]))
         return details
 
     def _extract_images_from_compose(self, compose_doc):
-        images = []
+        """逐个产出 (service, image, tag, raw)"""
         if not isinstance(compose_doc, dict):
-            return images
+            return
         services = compose_doc.get("services", {})
         if isinstance(services, dict):
-            for service_name, service_conf in services.items():
-                if not isinstance(service_conf, dict):
-                    continue
-                image_ref = service_conf.get("image")
-                if image_ref:
-                    image_name, tag = self._split_image_reference(
-                        str(image_ref).strip()
-                    )
-                    if image_name:
-                        images.append(
-                            {
-                                "service": service_name,
-                                "image": image_name,
-                                "tag": tag,
-                                "raw": image_ref,
-                            }
-                        )
-        return images
+            yield from self._iter_image_entries(
+                (service_name, service_conf.get("image"))
+                for service_name, service_conf in services.items()
+                if isinstance(service_conf, dict)
+            )
+
+    def _iter_image_entries(self, service_images):
+        """将 (service, image_ref) 拆分为 (service, image, tag, raw)，跳过空引用"""
+        for service_name, image_ref in service_images:
+            if image_ref:
+                image_name, tag = _split_image_reference(str(image_ref).strip())
+                if image_name:
+                    yield service_name, image_name, tag, image_ref
 
     def _split_image_reference(self, reference: str):
-        if not reference:
-            return "", "latest"
-        if "@" in reference:
-            name, digest = reference.split("@", 1)
-            return name or "", digest or "latest"
-        slash_index = reference.rfind("/")
-        colon_index = reference.rfind(":")
-        if colon_index > slash_index:
-            name = reference[:colon_index]
-            tag = reference[colon_index + 1 :] or "latest"
-            return name or "", tag
-        return reference, "latest"
+        return _split_image_reference(reference)
 
     def _resolve_template_path(self, template_name, for_write=False):
         """解析模板路径
@@ -1055,25 +1898,43 @@ class App2DockerHandler(BaseHTTPRequestHandler):
             self._send_json(400, {"error": "compose 内容不能为空"})
             return
 
-        try:
-            documents = list(yaml.safe_load_all(content))
-        except yaml.YAMLError as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
-            self._send_json(
-                400, {"error": f"解析 YAML 失败: {clean_msg or '未知错误'}"}
-            )
+        digest = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+        images = _get_cached_compose_images(digest)
+        if images is not None:
+            self._send_json(200, {"images": images})
             return
 
+        # 逐个文档解析，不一次性物化全部文档
+        entries = (
+            entry
+            for doc in yaml.load_all(content, Loader=_YamlSafeLoader)
+            for entry in self._extract_images_from_compose(doc)
+        )
+
         images = []
         seen = set()
-        for doc in documents:
-            for item in self._extract_images_from_compose(doc):
-                key = f"{item['image']}:{item['tag']}"
+        try:
+            for service_name, image_name, tag, raw in entries:
+                key = (image_name, tag)
                 if key in seen:
                     continue
                 seen.add(key)
-                images.append(item)
+                images.append(
+                    {"service": service_name, "image": image_name, "tag": tag, "raw": raw}
+                )
+        except yaml.YAMLError as e:
+            clean_msg = _sanitize_error(e) or "未知错误"
+            if not images:
+                self._send_json(400, {"error": f"解析 YAML 失败: {clean_msg}"})
+                return
+            # 后续文档解析失败时返回已解析出的镜像，并附带警告（不缓存不完整结果）
+            self._send_json(
+                200,
+                {"images": images, "warning": f"部分 YAML 文档解析失败: {clean_msg}"},
+            )
+            return
 
+        _cache_compose_images(digest, images)
         self._send_json(200, {"images": images})
 
     def handle_create_template(self):
@@ -1091,7 +1952,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 return
 
             # 验证项目类型格式：只允许小写字母、数字、下划线和连字符
-            if not re.match(r"^[a-z0-9_-]+$", project_type):
+            if not _PROJECT_TYPE_RE.match(project_type):
                 self._send_json(
                     400, {"error": "项目类型只能包含小写字母、数字、下划线和连字符"}
                 )
@@ -1123,7 +1984,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
         except ValueError as ve:
             self._send_json(400, {"error": str(ve)})
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
+            clean_msg = _sanitize_error(e)
             self._send_json(500, {"error": f"创建模板失败: {clean_msg or '未知错误'}"})
 
     def handle_update_template(self):
@@ -1144,22 +2005,20 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 return
 
             # 检查原模板是否存在
-            templates = get_all_templates()
-            if original_name not in templates:
+            original_template = get_template_info(original_name)
+            if not original_template:
                 self._send_json(404, {"error": "原模板不存在"})
                 return
 
-            original_template = templates[original_name]
             is_builtin = original_template["type"] == "builtin"
+            reserved_dst = False  # 是否已为重命名占用目标文件名
             original_project_type = original_template["project_type"]
 
             # 使用提供的项目类型，如果没有则使用原模板的项目类型
             target_project_type = project_type or original_project_type
 
             # 验证项目类型格式
-            if target_project_type and not re.match(
-                r"^[a-z0-9_-]+$", target_project_type
-            ):
+            if target_project_type and not _PROJECT_TYPE_RE.match(target_project_type):
                 self._send_json(
                     400, {"error": "项目类型只能包含小写字母、数字、下划线和连字符"}
                 )
@@ -1191,16 +2050,31 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 src_path = original_template["path"]
                 dst_path = get_user_template_path(target_name, target_project_type)
 
-                # 检查目标路径是否已存在（且不是原文件）
-                if dst_path != src_path and os.path.exists(dst_path):
-                    self._send_json(400, {"error": "目标模板名称已存在"})
-                    return
+                # 重命名时以 O_EXCL 占用目标文件名，已存在时由内核直接返回 EEXIST，
+                # 避免"检查是否存在"与写入之间被其他请求抢先
+                if dst_path != src_path:
+                    try:
+                        os.close(
+                            os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+                        )
+                    except FileExistsError:
+                        self._send_json(400, {"error": "目标模板名称已存在"})
+                        return
+                    reserved_dst = True
 
             # 写入新内容
             tmp_path = dst_path + ".tmp"
-            with open(tmp_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            os.replace(tmp_path, dst_path)
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(tmp_path, dst_path)
+            except OSError:
+                if reserved_dst:
+                    try:
+                        os.remove(dst_path)
+                    except OSError:
+                        pass
+                raise
 
             # 如果是用户模板的重命名或项目类型修改，删除原文件
             if not is_builtin and dst_path != original_template["path"]:
@@ -1231,7 +2105,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
         except ValueError as ve:
             self._send_json(400, {"error": str(ve)})
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
+            clean_msg = _sanitize_error(e)
             self._send_json(500, {"error": f"更新模板失败: {clean_msg or '未知错误'}"})
 
     def handle_delete_template(self):
@@ -1243,8 +2117,8 @@ class App2DockerHandler(BaseHTTPRequestHandler):
                 return
 
             # 检查是否为内置模板
-            templates = get_all_templates()
-            if name in templates and templates[name]["type"] == "builtin":
+            template_info = get_template_info(name)
+            if template_info and template_info["type"] == "builtin":
                 self._send_json(
                     403,
                     {"error": "内置模板不可删除，请在用户模板中创建同名模板进行覆盖"},
@@ -1254,57 +2128,41 @@ class App2DockerHandler(BaseHTTPRequestHandler):
             filepath, clean_name, filename = self._resolve_template_path(
                 name, for_write=True
             )
-            if not os.path.exists(filepath):
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
                 self._send_json(404, {"error": "模板不存在"})
                 return
-            os.remove(filepath)
             self._send_json(200, {"message": "模板已删除"})
         except ValueError as ve:
             self._send_json(400, {"error": str(ve)})
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
+            clean_msg = _sanitize_error(e)
             self._send_json(500, {"error": f"删除模板失败: {clean_msg or '未知错误'}"})
 
     def handle_upload(self):
-        content_length = int(self.headers["Content-Length"])
-        body = self.rfile.read(content_length)
-
+        upload_part = None
         try:
-            boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
-            parts = body.split(b"--" + boundary)
             form_data = {}
-            file_data = None
             file_name = None
 
-            for part in parts[1:-1]:
-                if b"\r\n\r\n" not in part:
-                    continue
-                header_end = part.find(b"\r\n\r\n")
-                headers = part[:header_end].decode("utf-8", errors="ignore")
-                data = part[header_end + 4 :].rstrip(b"\r\n")
-
-                if "filename=" in headers:
-                    try:
-                        filename = headers.split("filename=")[1].split('"')[1]
-                        # 支持多种文件类型：jar, zip, tar, tar.gz
-                        if filename.endswith(
-                            (".jar", ".zip", ".tar", ".tar.gz", ".tgz")
-                        ):
-                            file_data = data
-                            file_name = filename
-                            form_data["original_filename"] = filename
-                    except Exception as e:
-                        print(f"⚠️ 解析文件名失败: {e}")
-                        continue
-                else:
-                    try:
-                        field_name = headers.split('name="')[1].split('"')[0]
-                        form_data[field_name] = data.decode("utf-8", errors="ignore")
-                    except Exception as e:
-                        print(f"⚠️ 解析字段失败: {e}")
-                        continue
+            for part in self._iter_multipart():
+                if part.filename is not None:
+                    # 支持多种文件类型：jar, zip, tar, tar.gz
+                    if part.filename.endswith(
+                        (".jar", ".zip", ".tar", ".tar.gz", ".tgz")
+                    ):
+                        if upload_part:
+                            upload_part.discard()
+                        upload_part = part
+                        file_name = part.filename
+                        form_data["original_filename"] = part.filename
+                    else:
+                        part.discard()
+                elif part.name:
+                    form_data[part.name] = part.text()
 
-            if not file_data:
+            if not upload_part or not os.path.getsize(upload_part.file_path):
                 self._send_json(400, {"error": "未上传文件"})
                 return
 
@@ -1328,7 +2186,7 @@ class App2DockerHandler(BaseHTTPRequestHandler):
             # 👇 启动后台构建，立即返回 build_id
             build_manager = BuildManager()
             build_id = build_manager.start_build(
-                file_data=file_data,
+                file_path=upload_part.file_path,
                 image_name=image_name,
                 tag=tag,
                 should_push=should_push,
@@ -1346,12 +2204,16 @@ class App2DockerHandler(BaseHTTPRequestHandler):
             )
 
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
+            clean_msg = _sanitize_error(e)
             print(f"❌ 上传处理失败: {clean_msg}")
             import traceback
 
             traceback.print_exc()
             self._send_json(500, {"error": f"服务器错误: {clean_msg}"})
+        finally:
+            # start_build 成功时文件已移入 staging 目录，此处仅清理残留的临时文件
+            if upload_part:
+                upload_part.discard()
 
     def log_message(self, format, *args):
         return  # 静音日志
@@ -1381,13 +2243,14 @@ def _retry_login_and_push(
         log_func: 日志函数
 
     Returns:
-        bool: 是否成功重新登录
+        (bool, dict): 是否成功重新登录，以及重试推送应使用的认证配置
+        （登录返回 IdentityToken 时带上新令牌，失败时为原 auth_config）
     """
     if log_func is None:
         log_func = print
 
     if not (username and password):
-        return False
+        return False, auth_config
 
     try:
         if hasattr(docker_builder, "client") and docker_builder.client:
@@ -1402,11 +2265,456 @@ def _retry_login_and_push(
                 password=password,
                 registry=login_registry,
             )
-            log_func(f"✅ 重新登录成功\n")
-            return True
+            log_func("✅ 重新登录成功\n")
+            new_auth_config = dict(
+                auth_config or {}, username=username, password=password
+            )
+            identity_token = (login_result or {}).get("IdentityToken")
+            if identity_token:
+                new_auth_config["identitytoken"] = identity_token
+            return True, new_auth_config
     except Exception as e:
         log_func(f"❌ 重新登录失败: {str(e)}\n")
-    return False
+    return False, auth_config
+
+
+class _PushStatusLog:
+    """推送输出的去重记录
+
+    docker push 每个进度块都会带一条 status（大量连续重复的 Pushing/Waiting），
+    这里跳过与上一行相同的行，其余行直接交给 log，由 _TaskLogBatcher 在后台合并落库；
+    不在本地缓冲，长时间上传时最新状态也能立即可见。
+    """
+
+    def __init__(self, log):
+        self._log = log
+        self._last_line = None
+
+    def add(self, line: str):
+        if line != self._last_line:
+            self._last_line = line
+            self._log(line)
+
+
+class _PushError(RuntimeError):
+    """推送失败：推送流中的 error 字段，detail 为对应的 errorDetail"""
+
+    def __init__(self, message, detail=None):
+        super().__init__(message)
+        self.detail = detail
+
+
+def _consume_push_stream(stream, log, line_prefix: str = ""):
+    """消费 docker push 输出流并记录 status，遇到 error 字段时抛出 _PushError"""
+    status_log = _PushStatusLog(log)
+    for chunk in stream:
+        status = chunk.get("status")
+        if status is not None:
+            status_log.add(f"{line_prefix}{status}\n")
+            continue
+        error_msg = chunk.get("error")
+        if error_msg is not None:
+            raise _PushError(error_msg, chunk.get("errorDetail") or {})
+
+
+def _push_with_retry(
+    docker_builder,
+    repository: str,
+    tag: str,
+    auth_config: dict,
+    username: str = None,
+    password: str = None,
+    registry_host: str = None,
+    log=print,
+    line_prefix: str = "",
+    max_attempts: int = _PUSH_MAX_ATTEMPTS,
+    stop_event: threading.Event = None,
+) -> bool:
+    """推送镜像并按错误类型重试
+
+    认证错误时重新登录并重试（只重新登录一次）；限流/临时错误（429、5xx、超时、
+    连接重置等）按指数退避加随机抖动重试，最多尝试 max_attempts 次，退避等待合计
+    不超过 _PUSH_BACKOFF_TOTAL_CAP 秒；其他错误不重试。传入 stop_event 时在其上等待，
+    任务被停止后立即放弃重试。
+
+    Returns:
+        bool: 是否经过重试才推送成功
+
+    Raises:
+        推送失败时抛出异常：首次即遇到的不可重试错误原样抛出；重新登录失败或重试后仍失败时
+        抛出 _PushError，消息中注明（重新登录失败）/（已重试）
+    """
+    push_kwargs = dict(repository=repository, tag=tag, auth_config=auth_config)
+    relogged = False
+    waited = 0.0
+    for attempt in range(max_attempts):
+        try:
+            _consume_push_stream(
+                docker_builder.push_image(**push_kwargs), log, line_prefix
+            )
+            return attempt > 0
+        except _PushError as e:
+            log(f"{line_prefix}❌ 推送错误: {e}\n")
+            if e.detail:
+                log(f"{line_prefix}❌ 错误详情: {e.detail}\n")
+            error = e
+        except Exception as e:
+            log(f"{line_prefix}❌ 推送异常: {e}\n")
+            error = e
+
+        detail = getattr(error, "detail", None)
+        if _is_auth_error(str(error), detail):
+            if relogged:
+                raise _PushError(f"{error}（已重试）", detail) from error
+            relogged = True
+            log(f"{line_prefix}🔄 检测到认证错误，尝试重新登录...\n")
+            ok, push_kwargs["auth_config"] = _retry_login_and_push(
+                docker_builder,
+                repository,
+                tag,
+                push_kwargs["auth_config"],
+                username,
+                password,
+                registry_host,
+                log,
+            )
+            if not ok:
+                raise _PushError(f"{error}（重新登录失败）", detail) from error
+            log(f"{line_prefix}🔄 重新登录成功，重试推送...\n")
+            continue
+        if not _is_transient_push_error(str(error), detail):
+            if attempt:
+                raise _PushError(f"{error}（已重试）", detail) from error
+            raise error
+        if attempt + 1 >= max_attempts:
+            break
+        delay = min(
+            _PUSH_BACKOFF_BASE * 5**attempt + random.uniform(0, 1),
+            _PUSH_BACKOFF_TOTAL_CAP - waited,
+        )
+        if delay <= 0:
+            break
+        waited += delay
+        log(
+            f"{line_prefix}⏳ 推送遇到临时错误，{delay:.1f} 秒后重试（{attempt + 1}/{max_attempts - 1}）\n"
+        )
+        if stop_event is None:
+            time.sleep(delay)
+        elif stop_event.wait(delay):
+            raise _PushError(f"{error}（任务已停止，放弃重试）", detail) from error
+    raise _PushError(f"{error}（已重试）", detail) from error
+
+
+def _registry_auth_config(registry_config):
+    """由仓库配置生成 docker-py 推送用的认证信息
+
+    Returns:
+        (auth_config, username, password, registry_host)：未配置用户名密码时 auth_config 为 None
+    """
+    registry_config = registry_config or {}
+    username = registry_config.get("username")
+    password = registry_config.get("password")
+    registry_host = registry_config.get("registry", "")
+    auth_config = None
+    if username and password:
+        # docker-py 的 push API 需要 serveraddress 指定 registry；
+        # 阿里云等私有仓库直接使用仓库地址（不加协议），docker.io 使用标准地址
+        auth_config = {
+            "username": username,
+            "password": password,
+            "serveraddress": (
+                registry_host
+                if registry_host and registry_host != "docker.io"
+                else "https://index.docker.io/v1/"
+            ),
+        }
+    return auth_config, username, password, registry_host
+
+
+# 登录认证失败时的排查建议
+_LOGIN_AUTH_HINT = (
+    "⚠️  认证失败，可能的原因：\n"
+    "   1. 用户名或密码不正确\n"
+    "   2. 对于阿里云registry，请确认：\n"
+    "      - 用户名：使用阿里云账号或独立的镜像仓库用户名\n"
+    "      - 密码：使用阿里云账号密码或镜像仓库独立密码\n"
+    "      - 如果使用访问令牌，请确认令牌未过期\n"
+    "   3. 请检查registry配置中的认证信息是否正确\n"
+    "⚠️  继续尝试推送（推送时会使用auth_config，但可能仍然失败）\n"
+)
+# 推送认证失败时的排查建议，{username}/{registry}/{image} 由 _log_push_auth_hint 填入
+_PUSH_AUTH_HINT = (
+    "💡 推送认证失败，建议：\n"
+    "   1. 确认registry配置中的用户名和密码正确\n"
+    "   2. 对于阿里云registry，请使用独立的Registry登录密码\n"
+    "   3. 检查认证信息是否过期（如访问令牌）\n"
+    "   4. 可以尝试手动执行以下命令测试：\n"
+    "      docker login --username={username} {registry}\n"
+    "      docker push {image}\n"
+    "   5. 如果手动命令成功，说明配置有问题；如果也失败，说明认证信息不正确\n"
+)
+
+
+def _log_push_auth_hint(log, username, registry_host, image: str):
+    """推送认证失败时一次性输出排查建议"""
+    log(
+        _PUSH_AUTH_HINT.format(
+            username=username or "YOUR_USERNAME",
+            registry=registry_host or "",
+            image=image,
+        )
+    )
+
+
+def _login_registry(
+    docker_builder, username, password, registry_host, log, line_prefix: str = ""
+):
+    """推送前登录 registry（确保认证生效），失败只记录日志，推送时仍会携带 auth_config"""
+    try:
+        if hasattr(docker_builder, "client") and docker_builder.client:
+            # 对于阿里云等registry，需要确保使用正确的registry地址
+            login_registry = (
+                registry_host if registry_host and registry_host != "docker.io" else None
+            )
+            log(f"{line_prefix}🔑 正在登录到registry: {login_registry or 'docker.io'}\n")
+            log(f"{line_prefix}🔑 用户名: {username}\n")
+            login_result = docker_builder.client.login(
+                username=username,
+                password=password,
+                registry=login_registry,
+            )
+            log(f"{line_prefix}✅ 登录成功: {login_result}\n")
+        else:
+            log(f"{line_prefix}⚠️  Docker客户端不可用，跳过登录\n")
+    except Exception as login_error:
+        error_msg = str(login_error)
+        log(f"{line_prefix}❌ 登录失败: {error_msg}\n")
+
+        # 检查是否是认证错误
+        if _is_auth_error(error_msg):
+            log(_LOGIN_AUTH_HINT)
+        else:
+            log("⚠️  继续尝试推送（推送时会使用auth_config）\n")
+
+
+def _remote_manifest_digest(repository: str, tag: str, registry_config, timeout=10):
+    """HEAD 请求 registry 上 repository:tag 的 manifest，返回 Docker-Content-Digest；查询失败返回 None"""
+    from urllib.parse import quote
+
+    from backend.migration_manager import (
+        _open_manifest_request,
+        _registry_api_base,
+        _split_repository_for_manifest,
+    )
+
+    registry_config = registry_config or {}
+    try:
+        host, name = _split_repository_for_manifest(
+            repository, registry_config.get("registry") or ""
+        )
+        manifest_url = f"{_registry_api_base(host)}/v2/{quote(name, safe='/')}/manifests/{quote(tag, safe='')}"
+        with _open_manifest_request(
+            manifest_url,
+            "HEAD",
+            registry_config.get("username") or "",
+            registry_config.get("password") or "",
+            image_name=name,
+            registry_host=host,
+            timeout=timeout,
+        ) as resp:
+            return resp.headers.get("Docker-Content-Digest")
+    except Exception:
+        return None
+
+
+def _registry_up_to_date(docker_builder, repository: str, tag: str, registry_config):
+    """本地镜像的 RepoDigests 中已包含 registry 上该 tag 的 digest 时返回 True
+
+    新构建（未推送过）的镜像没有 RepoDigests，直接返回 False，不发起网络请求；
+    只有重新构建出与上次推送相同的镜像时才会 HEAD 查询一次 manifest。
+    """
+    client = getattr(docker_builder, "client", None)
+    if not client:
+        return False
+    try:
+        local_digests = client.images.get(f"{repository}:{tag}").attrs.get(
+            "RepoDigests"
+        )
+    except Exception:
+        return False
+    if not local_digests:
+        return False
+    remote_digest = _remote_manifest_digest(repository, tag, registry_config)
+    return bool(remote_digest) and f"{repository}@{remote_digest}" in local_digests
+
+
+# 提前登录 registry 的共享线程池，各次构建复用，不再为每次登录单独创建线程池
+_REGISTRY_LOGIN_EXECUTOR = ThreadPoolExecutor(
+    max_workers=_MAX_PUSH_WORKERS, thread_name_prefix="registry-login"
+)
+
+
+def _start_registry_login(docker_builder, registry_config, log, line_prefix: str = ""):
+    """在后台线程中提前登录 registry，返回 Future；未配置认证信息时返回 None
+
+    凭据助手调用可能耗时数百毫秒，与镜像构建并行执行后推送时无需再等待登录。
+    """
+    auth_config, username, password, registry_host = _registry_auth_config(
+        registry_config
+    )
+    if auth_config is None:
+        return None
+    return _REGISTRY_LOGIN_EXECUTOR.submit(
+        _login_registry,
+        docker_builder,
+        username,
+        password,
+        registry_host,
+        log,
+        line_prefix,
+    )
+
+
+def _push_to_registry(
+    docker_builder,
+    repository: str,
+    tag: str,
+    registry_config,
+    log=print,
+    line_prefix: str = "",
+    login_future=None,
+    stop_event: threading.Event = None,
+) -> bool:
+    """按仓库配置推送镜像：有认证信息时先登录，推送失败时按错误类型重试
+
+    源码构建的单服务推送和多服务推送共用此流程。传入 login_future
+    （见 _start_registry_login）时等待后台登录完成，不再重复登录；
+    stop_event 用于在退避等待期间感知任务停止。
+
+    registry 上该 tag 已指向与本地镜像相同的 digest 时跳过推送。
+
+    Returns:
+        bool: 是否经过重试才推送成功
+
+    Raises:
+        推送失败时抛出异常（见 _push_with_retry）
+    """
+    if _registry_up_to_date(docker_builder, repository, tag, registry_config):
+        log(
+            f"{line_prefix}⏭️  registry 中 {repository}:{tag} 已是最新（digest 相同），跳过推送\n"
+        )
+        return False
+    auth_config, username, password, registry_host = _registry_auth_config(
+        registry_config
+    )
+    log(
+        f"{line_prefix}🔐 Registry配置 - 地址: {registry_host}, 用户名: {username}, 密码: {'***' if password else '(未配置)'}\n"
+    )
+    if auth_config:
+        log(f"{line_prefix}✅ 已配置认证信息\n")
+        log(
+            f"{line_prefix}🔐 Auth配置: username={username}, serveraddress={auth_config['serveraddress']}\n"
+        )
+        # 对于阿里云registry，添加特殊提示
+        if registry_host and "aliyuncs.com" in registry_host:
+            log(f"{line_prefix}ℹ️  检测到阿里云registry，请确保使用独立的Registry登录密码\n")
+        if login_future is None:
+            _login_registry(
+                docker_builder, username, password, registry_host, log, line_prefix
+            )
+        else:
+            try:
+                login_future.result(timeout=_REGISTRY_LOGIN_TIMEOUT)
+            except FutureTimeoutError:
+                log(f"{line_prefix}⚠️  等待registry登录超时，继续尝试推送\n")
+    else:
+        log(f"{line_prefix}ℹ️  未配置认证信息，将使用匿名推送（适用于公开仓库）\n")
+
+    log(f"{line_prefix}🚀 开始推送，repository: {repository}, tag: {tag}\n")
+    return _push_with_retry(
+        docker_builder,
+        repository,
+        tag,
+        auth_config,
+        username,
+        password,
+        registry_host,
+        log,
+        line_prefix,
+        stop_event=stop_event,
+    )
+
+
+class _TaskLogBatcher:
+    """任务日志批量写入器
+
+    生产者只把日志放入队列；单个后台线程把积压的日志合并成不超过
+    _LOG_BATCH_MAX_BYTES 的块后再调用 task_manager.add_log，
+    将高频的逐行落库合并为少量写入。传入 memory_log 时，同一批日志
+    也在一次加锁内追加到内存日志中。
+    """
+
+    def __init__(self, task_manager, task_id: str, memory_log=None, lock=None):
+        self._task_manager = task_manager
+        self._task_id = task_id
+        self._memory_log = memory_log
+        self._memory_lock = lock
+        self._queue = queue.Queue(maxsize=_LOG_QUEUE_MAX_ITEMS)
+        self._thread = threading.Thread(
+            target=self._run, name=f"task-log-{task_id[:8]}", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, msg: str):
+        self._queue.put(msg)
+
+    def flush(self):
+        """阻塞直到已提交的日志全部写入"""
+        self._queue.join()
+
+    def close(self):
+        """写完剩余日志并结束后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            try:
+                size = len(item)
+                while size < _LOG_BATCH_MAX_BYTES:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._queue.task_done()
+                        stopping = True
+                        break
+                    batch.append(item)
+                    size += len(item)
+
+                message = "".join(batch)
+                try:
+                    self._task_manager.add_log(self._task_id, message)
+                except Exception as e:
+                    # 如果任务管理器记录失败，至少打印到控制台
+                    print(f"⚠️ 任务日志记录失败 (task_id={self._task_id}): {e}")
+                    print(f"日志内容: {message}")
+                if self._memory_log is not None:
+                    with self._memory_lock:
+                        self._memory_log.extend(batch)
+            except Exception as e:
+                print(f"⚠️ 任务日志写入线程异常 (task_id={self._task_id}): {e}")
+            finally:
+                # 无论本批是否写入成功都要标记完成，保证 flush() 不会永久阻塞
+                for _ in batch:
+                    self._queue.task_done()
 
 
 class BuildManager:
@@ -1422,15 +2730,18 @@ class BuildManager:
         return cls._instance
 
     def _init(self):
-        self.logs = defaultdict(deque)  # build_id -> deque[str] (保留用于兼容)
+        # build_id -> deque[str] (保留用于兼容)，每个任务只在内存中保留最近的日志，
+        # 完整日志由 task_manager.add_log 持久化
+        self.logs = defaultdict(lambda: deque(maxlen=_MEMORY_LOG_MAX_LINES))
         self.lock = threading.Lock()
+        # 每个任务独立的日志锁，并发构建写内存日志时互不阻塞；
+        # 弱引用保存，任务结束、不再被日志闭包引用后自动释放
+        self._log_locks = weakref.WeakValueDictionary()
         self.tasks = {}  # build_id -> Thread (保留用于兼容)
         self.task_manager = BuildTaskManager()  # 使用任务管理器
 
     def _registry_scope_for_task(self, task_id: str) -> tuple:
         """解析任务关联的 team_id / user_id，供镜像仓库推送与拉取使用。"""
-        from backend.database import get_db_session
-        from backend.models import Task
         from backend.registry_manager import scope_from_task_like
         from backend.team_scope import infer_team_id_for_new_task
 
@@ -1460,21 +2771,17 @@ class BuildManager:
         return reg_team_id, reg_user_id
 
     def _save_upload_staging(
-        self, task_id: str, file_data: bytes, original_filename: str
+        self, task_id: str, file_path: str, original_filename: str
     ) -> str:
-        """将上传文件落盘，供全局队列在有空闲槽位时再启动构建。"""
+        """将上传的临时文件移入 staging 目录，供全局队列在有空闲槽位时再启动构建。"""
         staging_dir = os.path.join(BUILD_DIR, "pending_uploads", task_id)
         os.makedirs(staging_dir, exist_ok=True)
         safe_name = os.path.basename(original_filename or "") or "upload.bin"
         upload_path = os.path.join(staging_dir, safe_name)
-        with open(upload_path, "wb") as f:
-            f.write(file_data)
+        shutil.move(file_path, upload_path)
         return upload_path
 
     def _merge_task_config(self, task_id: str, updates: dict) -> None:
-        from backend.database import get_db_session
-        from backend.models import Task
-
         db = get_db_session()
         try:
             task = db.query(Task).filter(Task.task_id == task_id).first()
@@ -1512,9 +2819,6 @@ class BuildManager:
             )
             return
 
-        with open(upload_path, "rb") as f:
-            file_data = f.read()
-
         image_name = task_row.get("image") or cfg.get("image_name") or "myapp/demo"
         tag = task_row.get("tag") or cfg.get("tag") or "latest"
         selected_template = task_row.get("template") or cfg.get("template") or ""
@@ -1532,7 +2836,7 @@ class BuildManager:
             target=self._build_task,
             args=(
                 task_id,
-                file_data,
+                upload_path,
                 image_name,
                 tag,
                 should_push,
@@ -1552,7 +2856,7 @@ class BuildManager:
 
     def start_build(
         self,
-        file_data: bytes,
+        file_path: str,  # 已落盘的上传文件路径，会被移动到 staging 目录
         image_name: str,
         tag: str,
         should_push: bool,
@@ -1585,7 +2889,7 @@ class BuildManager:
             created_by=created_by,
         )
 
-        upload_path = self._save_upload_staging(task_id, file_data, original_filename)
+        upload_path = self._save_upload_staging(task_id, file_path, original_filename)
         self._merge_task_config(
             task_id,
             {
@@ -1602,7 +2906,7 @@ class BuildManager:
     def _build_task(
         self,
         task_id: str,
-        file_data: bytes,
+        upload_path: str,
         image_name: str,
         tag: str,
         should_push: bool,
@@ -1623,170 +2927,159 @@ class BuildManager:
         # 构建上下文路径不需要保存到数据库（临时路径）
         # 如果需要，可以通过 task_id 和 image_name 推导
 
+        log_lock = self._task_log_lock(task_id)
+        # 在下方 try 内创建，保证之后任何异常都会在 finally 中关闭后台线程
+        log_batcher = None
+
         def log(msg: str):
             """添加日志，自动确保以换行符结尾"""
             if not msg.endswith("\n"):
                 msg = msg + "\n"
-            # 使用任务管理器记录日志
-            self.task_manager.add_log(task_id, msg)
-            # 保留旧的日志系统用于兼容
-            with self.lock:
-                self.logs[task_id].append(msg)
-
-        # 更新任务状态为运行中
-        self.task_manager.update_task_status(task_id, "running")
-
-        reg_team_id, reg_user_id = self._registry_scope_for_task(task_id)
+            log_batcher.write(msg)
 
         def do_extract_archive(file_path: str, extract_to: str):
             """解压压缩文件"""
+            # 日志先缓存在本地，按段落合并成一条写入，避免每行都落库、加锁
+            log_buf = []
+
+            def log_line(msg: str):
+                log_buf.append(msg if msg.endswith("\n") else msg + "\n")
+
+            def flush_log():
+                if log_buf:
+                    log("".join(log_buf))
+                    log_buf.clear()
+
             try:
                 # 获取压缩包大小
                 archive_size = os.path.getsize(file_path)
-                if archive_size < 1024:
-                    archive_size_str = f"{archive_size} B"
-                elif archive_size < 1024 * 1024:
-                    archive_size_str = f"{archive_size / 1024:.2f} KB"
-                else:
-                    archive_size_str = f"{archive_size / (1024 * 1024):.2f} MB"
+                archive_size_str = _fmt_size(archive_size)
 
-                log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
-                log(f"📦 开始解压压缩包\n")
-                log(f"  文件路径: {file_path}\n")
-                log(f"  文件大小: {archive_size_str}\n")
-                log(f"  解压目标: {extract_to}\n")
-                log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
+                log_line(_BANNER)
+                log_line("📦 开始解压压缩包\n")
+                log_line(f"  文件路径: {file_path}\n")
+                log_line(f"  文件大小: {archive_size_str}\n")
+                log_line(f"  解压目标: {extract_to}\n")
+                log_line(_BANNER)
+                flush_log()
 
                 if file_path.endswith(".zip"):
-                    log("📦 检测到 ZIP 格式，开始解压...\n")
+                    log_line("📦 检测到 ZIP 格式，开始解压...\n")
                     with zipfile.ZipFile(file_path, "r") as zip_ref:
                         # 获取压缩包内的文件列表
-                        file_list = zip_ref.namelist()
-                        log(f"  压缩包内包含 {len(file_list)} 个文件/目录\n")
-                        zip_ref.extractall(extract_to)
+                        member_count = len(zip_ref.infolist())
+                        log_line(f"  压缩包内包含 {member_count} 个文件/目录\n")
+                        _extract_zip(zip_ref, extract_to)
                 elif file_path.endswith((".tar.gz", ".tgz")):
-                    log("📦 检测到 TAR.GZ 格式，开始解压...\n")
-                    with tarfile.open(file_path, "r:gz") as tar_ref:
-                        # 获取压缩包内的文件列表
-                        file_list = tar_ref.getnames()
-                        log(f"  压缩包内包含 {len(file_list)} 个文件/目录\n")
-                        tar_ref.extractall(extract_to)
+                    log_line("📦 检测到 TAR.GZ 格式，开始解压...\n")
+                    # 优先使用 pigz 多线程解压，不可用时回退到 tarfile
+                    member_count = _extract_tar_gz_with_pigz(file_path, extract_to)
+                    if member_count is not None:
+                        log_line(f"  压缩包内包含 {member_count} 个文件/目录（pigz）\n")
+                    else:
+                        with tarfile.open(file_path, "r:gz") as tar_ref:
+                            member_count = _extract_tar(tar_ref, extract_to)
+                        log_line(f"  压缩包内包含 {member_count} 个文件/目录\n")
                 elif file_path.endswith(".tar"):
-                    log("📦 检测到 TAR 格式，开始解压...\n")
+                    log_line("📦 检测到 TAR 格式，开始解压...\n")
                     with tarfile.open(file_path, "r") as tar_ref:
-                        # 获取压缩包内的文件列表
-                        file_list = tar_ref.getnames()
-                        log(f"  压缩包内包含 {len(file_list)} 个文件/目录\n")
-                        tar_ref.extractall(extract_to)
+                        member_count = _extract_tar(tar_ref, extract_to)
+                    log_line(f"  压缩包内包含 {member_count} 个文件/目录\n")
                 else:
-                    log(f"❌ 不支持的压缩格式: {file_path}\n")
+                    log_line(f"❌ 不支持的压缩格式: {file_path}\n")
+                    flush_log()
                     return False
 
-                log("✅ 解压操作完成\n")
-                log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
+                log_line("✅ 解压操作完成\n")
+                log_line(_BANNER)
+                flush_log()
 
                 # 列出解压后的目录概况和文件
                 try:
-                    log("📂 解压后构建根目录概况：\n")
-                    log(f"  构建上下文路径: {extract_to}\n")
+                    log_line("📂 解压后构建根目录概况：\n")
+                    log_line(f"  构建上下文路径: {extract_to}\n")
 
                     if os.path.exists(extract_to):
                         # 统计根目录下的直接内容
-                        root_items = os.listdir(extract_to)
-                        dirs = []
-                        files = []
+                        # 单次 scandir 遍历同时得到根目录分类、各目录文件数和总大小
+                        dirs = {}  # 目录名 -> 递归文件数
+                        files = {}  # 文件名 -> 大小
                         total_size = 0
                         total_files = 0
 
-                        for item in root_items:
-                            item_path = os.path.join(extract_to, item)
-                            if os.path.isdir(item_path):
-                                dirs.append(item)
-                            elif os.path.isfile(item_path):
-                                files.append(item)
-
-                        # 递归统计所有文件大小和数量
-                        for root, dirs_list, files_list in os.walk(extract_to):
-                            for f in files_list:
-                                file_path_full = os.path.join(root, f)
-                                if os.path.isfile(file_path_full):
-                                    total_size += os.path.getsize(file_path_full)
-                                    total_files += 1
-
-                        # 格式化大小
-                        if total_size < 1024:
-                            size_str = f"{total_size} B"
-                        elif total_size < 1024 * 1024:
-                            size_str = f"{total_size / 1024:.2f} KB"
-                        elif total_size < 1024 * 1024 * 1024:
-                            size_str = f"{total_size / (1024 * 1024):.2f} MB"
-                        else:
-                            size_str = f"{total_size / (1024 * 1024 * 1024):.2f} GB"
-
-                        log(f"  📁 根目录下目录数: {len(dirs)}\n")
-                        log(f"  📄 根目录下文件数: {len(files)}\n")
-                        log(f"  📊 解压后总文件数: {total_files}\n")
-                        log(f"  💾 解压后总大小: {size_str}\n")
-                        log(f"\n")
+                        with os.scandir(extract_to) as it:
+                            root_entries = list(it)
+                        for entry in root_entries:
+                            if entry.is_dir():
+                                dir_file_count = 0
+                                for sub_entry in _iter_files_scandir(entry.path):
+                                    total_size += sub_entry.stat().st_size
+                                    dir_file_count += 1
+                                dirs[entry.name] = dir_file_count
+                                total_files += dir_file_count
+                            elif entry.is_file():
+                                size = entry.stat().st_size
+                                files[entry.name] = size
+                                total_size += size
+                                total_files += 1
+
+                        size_str = _fmt_size(total_size)
+
+                        log_line(f"  📁 根目录下目录数: {len(dirs)}\n")
+                        log_line(f"  📄 根目录下文件数: {len(files)}\n")
+                        log_line(f"  📊 解压后总文件数: {total_files}\n")
+                        log_line(f"  💾 解压后总大小: {size_str}\n")
+                        log_line("\n")
 
                         if dirs:
-                            log("  📁 根目录下的目录列表：\n")
+                            log_line("  📁 根目录下的目录列表：\n")
                             for d in sorted(dirs)[:20]:  # 最多显示20个
-                                dir_path = os.path.join(extract_to, d)
-                                if os.path.isdir(dir_path):
-                                    # 统计目录下的文件数
-                                    dir_file_count = sum(
-                                        len(files) for _, _, files in os.walk(dir_path)
-                                    )
-                                    log(f"    📂 {d}/ ({dir_file_count} 个文件)\n")
+                                log_line(f"    📂 {d}/ ({dirs[d]} 个文件)\n")
                             if len(dirs) > 20:
-                                log(f"    ... 还有 {len(dirs) - 20} 个目录\n")
-                            log(f"\n")
+                                log_line(f"    ... 还有 {len(dirs) - 20} 个目录\n")
+                            log_line("\n")
 
                         if files:
-                            log("  📄 根目录下的文件列表：\n")
+                            log_line("  📄 根目录下的文件列表：\n")
                             for f in sorted(files)[:30]:  # 最多显示30个
-                                file_path_full = os.path.join(extract_to, f)
-                                if os.path.isfile(file_path_full):
-                                    size = os.path.getsize(file_path_full)
-                                    if size < 1024:
-                                        f_size_str = f"{size} B"
-                                    elif size < 1024 * 1024:
-                                        f_size_str = f"{size / 1024:.2f} KB"
-                                    elif size < 1024 * 1024 * 1024:
-                                        f_size_str = f"{size / (1024 * 1024):.2f} MB"
-                                    else:
-                                        f_size_str = (
-                                            f"{size / (1024 * 1024 * 1024):.2f} GB"
-                                        )
-                                    log(f"    📄 {f} ({f_size_str})\n")
+                                size = files[f]
+                                f_size_str = _fmt_size(size)
+                                log_line(f"    📄 {f} ({f_size_str})\n")
                             if len(files) > 30:
-                                log(f"    ... 还有 {len(files) - 30} 个文件\n")
-                            log(f"\n")
+                                log_line(f"    ... 还有 {len(files) - 30} 个文件\n")
+                            log_line("\n")
 
-                        log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
-                        log(f"✅ 解压完成，构建上下文已准备就绪\n")
-                        log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
+                        log_line(_EXTRACT_DONE_BANNER)
                 except Exception as e:
-                    log(f"⚠️  无法列出目录内容: {str(e)}\n")
+                    log_line(f"⚠️  无法列出目录内容: {str(e)}\n")
                     import traceback
 
-                    log(f"    {traceback.format_exc()}\n")
+                    log_line(f"    {traceback.format_exc()}\n")
 
+                flush_log()
                 return True
             except Exception as e:
-                log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
-                log(f"❌ 解压失败: {str(e)}\n")
+                log_line(_BANNER)
+                log_line(f"❌ 解压失败: {str(e)}\n")
                 import traceback
 
-                log(f"    {traceback.format_exc()}\n")
-                log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
+                log_line(f"    {traceback.format_exc()}\n")
+                log_line(_BANNER)
+                flush_log()
                 return False
 
         try:
-            log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
-            log(f"🚀 开始构建任务\n")
-            log(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
+            # 日志交给后台线程批量落库，并在同一批次内追加到旧的内存日志（保留用于兼容）
+            log_batcher = _TaskLogBatcher(
+                self.task_manager, task_id, self.logs[task_id], log_lock
+            )
+
+            # 更新任务状态为运行中
+            self.task_manager.update_task_status(task_id, "running")
+
+            reg_team_id, reg_user_id = self._registry_scope_for_task(task_id)
+
+            log(_BUILD_START_BANNER)
             log(f"📦 开始处理上传: {original_filename}\n")
             log(f"📝 上传的文件名: {original_filename}\n")
             log(f"🏷️ 镜像名: {full_tag}\n")
@@ -1802,15 +3095,15 @@ class BuildManager:
             )
 
             if is_archive:
-                log(f"📦 文件类型: 压缩包\n")
+                log("📦 文件类型: 压缩包\n")
                 log(
                     f"🔧 解压选项: {'已启用（将解压到构建根目录）' if extract_archive else '未启用（保持压缩包原样）'}\n"
                 )
             elif is_jar:
-                log(f"📦 文件类型: JAR 文件\n")
+                log("📦 文件类型: JAR 文件\n")
             else:
-                log(f"📦 文件类型: 普通文件\n")
-            log(f"\n")
+                log("📦 文件类型: 普通文件\n")
+            log("\n")
 
             # === 模拟模式 ===
             if not DOCKER_AVAILABLE:
@@ -1822,79 +3115,64 @@ class BuildManager:
                 is_archive = any(
                     original_filename.lower().endswith(ext)
                     for ext in [".zip", ".tar", ".tar.gz", ".tgz"]
-                )
-
-                if is_archive:
-                    # 压缩包：根据用户选择决定是否解压
-                    file_path = os.path.join(build_context, original_filename)
-                    log(f"🧪 模拟模式：保存压缩包文件...\n")
-                    log(f"  构建上下文路径: {build_context}\n")
-                    log(f"  压缩包文件路径: {file_path}\n")
-
-                    with open(file_path, "wb") as f:
-                        f.write(file_data)
-
-                    file_size = os.path.getsize(file_path)
-                    if file_size < 1024:
-                        file_size_str = f"{file_size} B"
-                    elif file_size < 1024 * 1024:
-                        file_size_str = f"{file_size / 1024:.2f} KB"
-                    else:
-                        file_size_str = f"{file_size / (1024 * 1024):.2f} MB"
-                    log(f"  文件大小: {file_size_str}\n")
-                    log(f"✅ 模拟模式：压缩包文件保存完成\n\n")
+                )
 
+                if is_archive:
+                    # 压缩包：根据用户选择决定是否解压
                     if extract_archive:
-                        # 用户选择解压
-                        log(f"🧪 模拟模式：解压选项已启用（将解压到构建根目录）\n")
-                        if do_extract_archive(file_path, build_context):
+                        # 用户选择解压：直接从暂存的上传文件解压到构建根目录
+                        log("🧪 模拟模式：解压选项已启用（将解压到构建根目录）\n")
+                        if do_extract_archive(upload_path, build_context):
                             log(
-                                f"🧪 模拟模式：压缩包已解压到构建上下文根目录（原始文件名: {original_filename}）\n"
+                                f"🧪 模拟模式：压缩包已解压到构建上下文根目录（原始文件名: {original_filename}）\n\n"
                             )
-                            try:
-                                os.remove(file_path)
-                                log(f"🧪 模拟模式：原始压缩包文件已删除\n\n")
-                            except:
-                                pass
                         else:
                             log("⚠️ 模拟模式：解压失败（不支持的格式）\n")
                     else:
+                        file_path = os.path.join(build_context, original_filename)
+                        log("🧪 模拟模式：保存压缩包文件...\n")
+                        log(f"  构建上下文路径: {build_context}\n")
+                        log(f"  压缩包文件路径: {file_path}\n")
+
+                        _place_upload_file(upload_path, file_path)
+
+                        file_size_str = _fmt_size(os.path.getsize(file_path))
+                        log(f"  文件大小: {file_size_str}\n")
+                        log("✅ 模拟模式：压缩包文件保存完成\n\n")
+
                         # 用户选择不解压，保持压缩包原样
-                        log(f"🧪 模拟模式：解压选项未启用（保持压缩包原样）\n")
+                        log("🧪 模拟模式：解压选项未启用（保持压缩包原样）\n")
                         log(
                             f"🧪 模拟模式：压缩包已保存: {original_filename}（未解压，保持原样）\n"
                         )
-                        log(f"  构建时将使用压缩包文件本身\n\n")
+                        log("  构建时将使用压缩包文件本身\n\n")
                 elif is_jar:
                     # JAR 文件：保存为固定名称 app.jar
-                    with open(os.path.join(build_context, "app.jar"), "wb") as f:
-                        f.write(file_data)
+                    _place_upload_file(upload_path, os.path.join(build_context, "app.jar"))
                     log(
                         f"🧪 模拟模式：JAR 文件已保存为: app.jar（原始文件名: {original_filename}）\n"
                     )
                 else:
                     # 其他文件：保持原文件名
                     file_path = os.path.join(build_context, original_filename)
-                    with open(file_path, "wb") as f:
-                        f.write(file_data)
+                    _place_upload_file(upload_path, file_path)
                     log(
                         f"🧪 模拟模式：文件已保存: {original_filename}（保持原文件名）\n"
                     )
 
-                for line in [
-                    "🧪 模拟模式：Docker 服务不可用\n",
-                    f"Step 1/4 : FROM {'node:20-alpine' if project_type == 'nodejs' else 'openjdk:17-jre-slim'} (模拟)\n",
-                    "Step 2/4 : COPY . . (模拟)\n",
-                    "Step 3/4 : WORKDIR /app (模拟)\n",
-                    f"Step 4/4 : CMD (模拟)\n",
-                    f"✅ 模拟构建成功: {full_tag}\n",
-                ]:
-                    log(line)
+                log(
+                    _SIM_BUILD_TEMPLATE.format(
+                        base_image=(
+                            "node:20-alpine"
+                            if project_type == "nodejs"
+                            else "openjdk:17-jre-slim"
+                        ),
+                        full_tag=full_tag,
+                    )
+                )
 
                 if should_push:
                     # 推送时统一使用激活的registry
-                    from backend.config import get_active_registry
-
                     push_registry_config = get_active_registry()
 
                     log("🚀 开始模拟推送...\n")
@@ -1903,8 +3181,7 @@ class BuildManager:
                     )
                     username = push_registry_config.get("username", None)
                     log(f"🚀 账号: {username}\n")
-                    for i in range(1, 4):
-                        log(f"📡 Pushing layer {i}/3...\n")
+                    log(_SIM_PUSH_LAYERS)
                     log(
                         f"✅ 模拟推送完成到 {push_registry_config.get('registry', 'Unknown')}\n"
                     )
@@ -1926,57 +3203,47 @@ class BuildManager:
 
             if is_archive:
                 # 压缩包：根据用户选择决定是否解压
-                file_path = os.path.join(build_context, original_filename)
-                log(f"📦 保存压缩包文件到构建上下文...\n")
-                log(f"  构建上下文路径: {build_context}\n")
-                log(f"  压缩包文件路径: {file_path}\n")
-
-                with open(file_path, "wb") as f:
-                    f.write(file_data)
-
-                file_size = os.path.getsize(file_path)
-                if file_size < 1024:
-                    file_size_str = f"{file_size} B"
-                elif file_size < 1024 * 1024:
-                    file_size_str = f"{file_size / 1024:.2f} KB"
-                else:
-                    file_size_str = f"{file_size / (1024 * 1024):.2f} MB"
-                log(f"  文件大小: {file_size_str}\n")
-                log(f"✅ 压缩包文件保存完成\n\n")
-
                 if extract_archive:
-                    # 用户选择解压
-                    log(f"🔧 解压选项: 已启用（将解压到构建根目录）\n")
-                    if do_extract_archive(file_path, build_context):
-                        # 解压成功，删除临时文件
-                        log(f"🗑️  删除原始压缩包文件: {original_filename}\n")
-                        try:
-                            os.remove(file_path)
-                            log(f"✅ 原始压缩包文件已删除\n\n")
-                        except Exception as e:
-                            log(f"⚠️  删除原始压缩包文件失败: {str(e)}\n")
-                    else:
+                    # 用户选择解压：直接从暂存的上传文件解压到构建根目录，
+                    # 不再先把压缩包放进构建上下文、解压后再删除
+                    archive_size_str = _fmt_size(os.path.getsize(upload_path))
+                    log(f"📦 压缩包文件: {original_filename}（{archive_size_str}）\n")
+                    log("🔧 解压选项: 已启用（将解压到构建根目录）\n")
+                    if not do_extract_archive(upload_path, build_context):
                         log(f"❌ 解压失败: {original_filename}\n")
+                        log_batcher.flush()
                         self.task_manager.update_task_status(task_id, "failed")
                         return
+                    log(
+                        f"✅ 压缩包已解压到构建上下文根目录（原始文件名: {original_filename}）\n\n"
+                    )
                 else:
+                    file_path = os.path.join(build_context, original_filename)
+                    log("📦 保存压缩包文件到构建上下文...\n")
+                    log(f"  构建上下文路径: {build_context}\n")
+                    log(f"  压缩包文件路径: {file_path}\n")
+
+                    _place_upload_file(upload_path, file_path)
+
+                    file_size_str = _fmt_size(os.path.getsize(file_path))
+                    log(f"  文件大小: {file_size_str}\n")
+                    log("✅ 压缩包文件保存完成\n\n")
+
                     # 用户选择不解压，保持压缩包原样
-                    log(f"🔧 解压选项: 未启用（保持压缩包原样）\n")
+                    log("🔧 解压选项: 未启用（保持压缩包原样）\n")
                     log(f"📦 压缩包已保存: {original_filename}（未解压，保持原样）\n")
-                    log(f"  构建时将使用压缩包文件本身\n\n")
+                    log("  构建时将使用压缩包文件本身\n\n")
             elif is_jar:
                 # JAR 文件：保存为固定名称 app.jar
                 jar_path = os.path.join(build_context, "app.jar")
-                with open(jar_path, "wb") as f:
-                    f.write(file_data)
+                _place_upload_file(upload_path, jar_path)
                 log(
                     f"✅ JAR 文件已保存为: app.jar（原始文件名: {original_filename}）\n"
                 )
             else:
                 # 其他文件：保持原文件名
                 file_path = os.path.join(build_context, original_filename)
-                with open(file_path, "wb") as f:
-                    f.write(file_data)
+                _place_upload_file(upload_path, file_path)
                 log(f"✅ 文件已保存: {original_filename}（保持原文件名）\n")
 
             # 获取模板路径（优先用户模板，否则使用内置模板）
@@ -2004,8 +3271,6 @@ class BuildManager:
                 )
 
             # 替换所有变量
-            from backend.template_parser import replace_template_variables
-
             try:
                 dockerfile_content = replace_template_variables(
                     dockerfile_content, template_vars
@@ -2018,7 +3283,7 @@ class BuildManager:
                 os.path.join(build_context, "Dockerfile"), "w", encoding="utf-8"
             ) as f:
                 f.write(dockerfile_content)
-            log(f"✅ 已生成 Dockerfile\n")
+            log("✅ 已生成 Dockerfile\n")
 
             # 复制资源包到构建上下文
             if resource_package_ids:
@@ -2058,7 +3323,7 @@ class BuildManager:
                                     ) or config.get("target_dir", "resources")
                                     log(f"   📦 {package_id} -> {target_path}\n")
                         else:
-                            log(f"⚠️ 资源包复制失败或资源包不存在\n")
+                            log("⚠️ 资源包复制失败或资源包不存在\n")
                 except Exception as e:
                     log(f"⚠️ 复制资源包失败: {str(e)}\n")
 
@@ -2080,19 +3345,31 @@ class BuildManager:
             build_succeeded = False
             last_error = None
 
-            for chunk in build_stream:
-                # 检查是否请求停止（通过任务状态判断）
-                from backend.database import get_db_session
-                from backend.models import Task
+            # 停止检查：优先看内存中的停止事件（stop_task 会设置），
+            # 数据库状态只按时间间隔轮询，避免每个输出块都查询一次
+            stop_event = self.task_manager.stop_event(task_id)
+            last_stop_check = time.monotonic()
 
-                db = get_db_session()
-                try:
-                    task = db.query(Task).filter(Task.task_id == task_id).first()
-                    if task and task.status == "stopped":
-                        log(f"\n⚠️ 任务已被用户停止\n")
-                        return
-                finally:
-                    db.close()
+            # stream 输出逐行交给 log：_TaskLogBatcher 的后台线程会把积压的行合并落库，
+            # 无需本地缓冲，也不会因构建步骤长时间无输出而滞留日志
+            for chunk in build_stream:
+                now = time.monotonic()
+                stopped = stop_event.is_set()
+                if not stopped and now - last_stop_check >= _STOP_POLL_INTERVAL:
+                    last_stop_check = now
+                    db = get_db_session()
+                    try:
+                        task = (
+                            db.query(Task.status)
+                            .filter(Task.task_id == task_id)
+                            .first()
+                        )
+                        stopped = bool(task and task.status == "stopped")
+                    finally:
+                        db.close()
+                if stopped:
+                    log("\n⚠️ 任务已被用户停止\n")
+                    return
 
                 if "stream" in chunk:
                     stream_msg = chunk["stream"]
@@ -2103,58 +3380,25 @@ class BuildManager:
                         or "Successfully tagged" in stream_msg
                     ):
                         build_succeeded = True
-                elif "error" in chunk:
+                    continue
+
+                if "error" in chunk:
                     last_error = chunk["error"]
                     log(f"\n🔥 [DOCKER ERROR]: {last_error}\n")
 
                     # 检测是否是镜像拉取失败的错误
-                    if "manifest" in last_error.lower() and (
-                        "not found" in last_error.lower()
-                        or "unknown" in last_error.lower()
-                    ):
-                        import re
-
-                        image_match = re.search(
-                            r"manifest for ([^\s]+) not found", last_error
-                        )
-                        if image_match:
-                            image_name = image_match.group(1)
-                            log(f"\n💡 镜像拉取失败分析:\n")
-                            log(f"   无法拉取基础镜像: {image_name}\n")
-                            log(f"   可能的原因:\n")
-                            log(f"   1. 镜像不存在或已被删除\n")
-                            log(f"   2. 镜像标签不正确\n")
-                            log(f"   3. 网络连接问题或仓库访问受限\n")
-                            log(f"   4. 需要认证但未配置认证信息\n")
-                            log(
-                                f"   建议: 检查 Dockerfile 中的 FROM 指令，确认镜像名称和标签是否正确\n"
-                            )
+                    hint = _diagnose_manifest_error(last_error)
+                    if hint:
+                        log(hint)
                 elif "errorDetail" in chunk:
                     err_msg = chunk["errorDetail"].get("message", "Unknown")
                     last_error = err_msg
                     log(f"\n💥 [ERROR DETAIL]: {err_msg}\n")
 
                     # 检测是否是镜像拉取失败的错误
-                    if "manifest" in err_msg.lower() and (
-                        "not found" in err_msg.lower() or "unknown" in err_msg.lower()
-                    ):
-                        import re
-
-                        image_match = re.search(
-                            r"manifest for ([^\s]+) not found", err_msg
-                        )
-                        if image_match:
-                            image_name = image_match.group(1)
-                            log(f"\n💡 镜像拉取失败分析:\n")
-                            log(f"   无法拉取基础镜像: {image_name}\n")
-                            log(f"   可能的原因:\n")
-                            log(f"   1. 镜像不存在或已被删除\n")
-                            log(f"   2. 镜像标签不正确\n")
-                            log(f"   3. 网络连接问题或仓库访问受限\n")
-                            log(f"   4. 需要认证但未配置认证信息\n")
-                            log(
-                                f"   建议: 检查 Dockerfile 中的 FROM 指令，确认镜像名称和标签是否正确\n"
-                            )
+                    hint = _diagnose_manifest_error(err_msg)
+                    if hint:
+                        log(hint)
                 elif "aux" in chunk and "ID" in chunk["aux"]:
                     build_succeeded = True
 
@@ -2166,45 +3410,18 @@ class BuildManager:
 
             if should_push:
                 # 推送时直接使用构建好的镜像名，根据镜像名找到对应的registry获取认证信息
-                from backend.config import (
-                    get_active_registry,
-                    get_all_registries,
-                    get_registry_by_name,
-                )
-
                 # 根据镜像名找到对应的registry配置
+                registry_matcher = _RegistryMatcher(reg_team_id, reg_user_id)
+
                 def find_matching_registry_for_push(image_name):
                     """根据镜像名找到匹配的registry配置"""
-                    # 如果镜像名包含斜杠，提取registry部分
-                    parts = image_name.split("/")
-                    if len(parts) >= 2 and "." in parts[0]:
-                        # 镜像名格式: registry.com/namespace/image
-                        image_registry = parts[0]
-                        all_registries = get_all_registries(
-                            team_id=reg_team_id, user_id=reg_user_id
-                        )
-                        for reg in all_registries:
-                            reg_address = reg.get("registry", "")
-                            reg_key = reg.get("registry_id") or reg.get("name")
-                            if reg_address and (
-                                image_registry == reg_address
-                                or image_registry.startswith(reg_address)
-                                or reg_address.startswith(image_registry)
-                            ):
-                                return get_registry_by_name(
-                                    reg_key,
-                                    team_id=reg_team_id,
-                                    user_id=reg_user_id,
-                                )
-                    return None
+                    return registry_matcher.match(image_name)
 
                 # 尝试根据镜像名找到匹配的registry
                 push_registry_config = find_matching_registry_for_push(image_name)
                 if not push_registry_config:
                     # 如果找不到匹配的，使用激活的registry
-                    push_registry_config = get_active_registry(
-                        team_id=reg_team_id, user_id=reg_user_id
-                    )
+                    push_registry_config = registry_matcher.active_config()
                     log(
                         f"\n⚠️  未找到匹配的registry配置，使用激活仓库: {push_registry_config.get('name', 'Unknown')}\n"
                     )
@@ -2246,61 +3463,21 @@ class BuildManager:
                         # 如果没有registry_host，默认使用docker.io
                         auth_config["serveraddress"] = "https://index.docker.io/v1/"
 
-                    log(f"✅ 已配置认证信息\n")
+                    log("✅ 已配置认证信息\n")
                     log(
                         f"🔐 Auth配置: username={push_username}, serveraddress={auth_config.get('serveraddress', 'docker.io')}\n"
                     )
 
                     # 推送前先登录到registry（重要：确保认证生效）
-                    try:
-                        if hasattr(docker_builder, "client") and docker_builder.client:
-                            # 对于阿里云等registry，需要确保使用正确的registry地址
-                            login_registry = (
-                                push_registry_host
-                                if push_registry_host
-                                and push_registry_host != "docker.io"
-                                else None
-                            )
-                            log(
-                                f"🔑 正在登录到registry: {login_registry or 'docker.io'}\n"
-                            )
-                            log(f"🔑 用户名: {push_username}\n")
-
-                            # 执行登录
-                            login_result = docker_builder.client.login(
-                                username=push_username,
-                                password=push_password,
-                                registry=login_registry,
-                            )
-                            log(f"✅ 登录成功: {login_result}\n")
-                        else:
-                            log(f"⚠️  Docker客户端不可用，跳过登录\n")
-                    except Exception as login_error:
-                        error_msg = str(login_error)
-                        log(f"❌ 登录失败: {error_msg}\n")
-
-                        # 检查是否是认证错误
-                        if (
-                            "401" in error_msg
-                            or "Unauthorized" in error_msg
-                            or "unauthorized" in error_msg
-                        ):
-                            log(f"⚠️  认证失败，可能的原因：\n")
-                            log(f"   1. 用户名或密码不正确\n")
-                            log(f"   2. 对于阿里云registry，请确认：\n")
-                            log(
-                                f"      - 用户名：使用阿里云账号或独立的镜像仓库用户名\n"
-                            )
-                            log(f"      - 密码：使用阿里云账号密码或镜像仓库独立密码\n")
-                            log(f"      - 如果使用访问令牌，请确认令牌未过期\n")
-                            log(f"   3. 请检查registry配置中的认证信息是否正确\n")
-                            log(
-                                f"⚠️  继续尝试推送（推送时会使用auth_config，但可能仍然失败）\n"
-                            )
-                        else:
-                            log(f"⚠️  继续尝试推送（推送时会使用auth_config）\n")
+                    _login_registry(
+                        docker_builder,
+                        push_username,
+                        push_password,
+                        push_registry_host,
+                        log,
+                    )
                 else:
-                    log(f"ℹ️  未配置认证信息，将使用匿名推送（适用于公开仓库）\n")
+                    log("ℹ️  未配置认证信息，将使用匿名推送（适用于公开仓库）\n")
 
                 try:
                     log(f"🚀 开始推送，repository: {push_repository}, tag: {tag}\n")
@@ -2309,50 +3486,44 @@ class BuildManager:
                             f"🔐 使用认证信息: username={auth_config.get('username')}, serveraddress={auth_config.get('serveraddress', 'docker.io')}\n"
                         )
                     else:
-                        log(f"⚠️  未使用认证信息\n")
+                        log("⚠️  未使用认证信息\n")
 
                     push_stream = docker_builder.push_image(
                         push_repository, tag, auth_config=auth_config
                     )
+                    push_log = _PushStatusLog(log)
                     for chunk in push_stream:
+                        # 每个块都要检查 error（同时带 status 的错误块也不能漏报）；
+                        # 进度按 status、progress、id 的顺序取第一个非空字段记录
                         status = (
                             chunk.get("status")
                             or chunk.get("progress")
                             or chunk.get("id")
                         )
                         if status:
-                            log(f"📡 {status}\n")
-                        if "error" in chunk:
-                            error_detail = chunk.get("errorDetail", {})
-                            error_msg = chunk["error"]
-                            log(f"\n❌ 推送失败: {error_msg}\n")
-                            if error_detail:
-                                log(f"❌ 错误详情: {error_detail}\n")
-                            return
+                            push_log.add(f"📡 {status}\n")
+                        error_msg = chunk.get("error")
+                        if error_msg is None:
+                            continue
+                        error_detail = chunk.get("errorDetail") or {}
+                        log(f"\n❌ 推送失败: {error_msg}\n")
+                        if error_detail:
+                            log(f"❌ 错误详情: {error_detail}\n")
+                        return
                     log(f"\n✅ 推送完成: {full_tag}\n")
                 except Exception as e:
                     error_str = str(e)
                     log(f"\n❌ 推送异常: {error_str}\n")
 
                     # 如果是认证错误，提供更详细的提示
-                    if (
-                        "denied" in error_str.lower()
-                        or "unauthorized" in error_str.lower()
-                        or "401" in error_str
-                    ):
-                        log(f"💡 推送认证失败，建议：\n")
-                        log(f"   1. 确认registry配置中的用户名和密码正确\n")
-                        log(f"   2. 对于阿里云registry，请使用独立的Registry登录密码\n")
-                        log(f"   3. 可以尝试手动执行以下命令测试：\n")
-                        log(
-                            f"      docker login --username={push_username} {push_registry_host}\n"
-                        )
-                        log(f"      docker push {full_tag}\n")
-                        log(
-                            f"   4. 如果手动命令成功，说明配置有问题；如果也失败，说明认证信息不正确\n"
+                    if _is_auth_error(error_str):
+                        _log_push_auth_hint(
+                            log, push_username, push_registry_host, full_tag
                         )
 
             log("\n🎉🎉🎉 所有操作已完成！🎉🎉🎉\n")
+            # 先确保日志全部落库，再更新任务状态
+            log_batcher.flush()
             # 更新任务状态为完成（确保状态更新）
             print(f"🔍 准备更新任务 {task_id[:8]} 状态为 completed")
             try:
@@ -2375,32 +3546,46 @@ class BuildManager:
                 traceback.print_exc()
             # 从任务字典中移除已完成的线程
             with self.lock:
-                if task_id in self.tasks:
-                    del self.tasks[task_id]
-                    print(f"✅ 任务 {task_id[:8]} 线程已清理")
+                removed = self.tasks.pop(task_id, None) is not None
+            if removed:
+                print(f"✅ 任务 {task_id[:8]} 线程已清理")
 
         except Exception as e:
-            clean_msg = re.sub(r"[\x00-\x1F\x7F]", " ", str(e)).strip()
-            log(f"\n❌ 构建异常: {clean_msg}\n")
+            clean_msg = _sanitize_error(e)
+            if log_batcher is not None:
+                log(f"\n❌ 构建异常: {clean_msg}\n")
+                log_batcher.flush()
             # 更新任务状态为失败
             self.task_manager.update_task_status(task_id, "failed", error=clean_msg)
             # 从任务字典中移除失败的线程
             with self.lock:
-                if task_id in self.tasks:
-                    del self.tasks[task_id]
-                    print(f"✅ 任务 {task_id[:8]} 线程已清理（失败）")
+                removed = self.tasks.pop(task_id, None) is not None
+            if removed:
+                print(f"✅ 任务 {task_id[:8]} 线程已清理（失败）")
             import traceback
 
             traceback.print_exc()
         finally:
+            if log_batcher is not None:
+                log_batcher.close()
+            self.task_manager.release_stop_event(task_id)
             if os.getenv("KEEP_BUILD_CONTEXT", "0") != "1":
                 try:
-                    shutil.rmtree(build_context, ignore_errors=True)
+                    _remove_tree_async(build_context)
                 except Exception as e:
                     print(f"⚠️ 清理失败: {e}")
 
-    def get_logs(self, build_id: str):
+    def _task_log_lock(self, task_id: str) -> threading.Lock:
+        """获取任务的日志锁（调用方需持有返回值，避免被回收）"""
         with self.lock:
+            lock = self._log_locks.get(task_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._log_locks[task_id] = lock
+            return lock
+
+    def get_logs(self, build_id: str):
+        with self._task_log_lock(build_id):
             return list(self.logs[build_id])
 
     def _trigger_task_from_config(self, task_config: dict) -> str:
@@ -2421,14 +3606,18 @@ class BuildManager:
         git_ref_type = task_config.get("git_ref_type", "branch")
         git_ref_name = task_config.get("git_ref_name") or branch
 
-        # 调试日志：检查任务配置中的分支
-        import json
-
-        print(f"🔍 _trigger_task_from_config:")
-        print(f"   - task_config中的branch: {repr(branch)}")
-        print(
-            f"   - task_config完整内容: {json.dumps({k: v for k, v in task_config.items() if k != 'template_params'}, indent=2, ensure_ascii=False, default=str)}"
-        )
+        # 调试日志：检查任务配置中的分支（完整配置仅在 DEBUG 级别下序列化）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "_trigger_task_from_config: branch=%r, task_config=%s",
+                branch,
+                json.dumps(
+                    {k: v for k, v in task_config.items() if k != "template_params"},
+                    indent=2,
+                    ensure_ascii=False,
+                    default=str,
+                ),
+            )
         project_type = task_config.get("project_type", "jar")
         template = task_config.get("template", "")
         template_params = task_config.get("template_params", {})
@@ -2642,6 +3831,7 @@ class BuildManager:
         resource_package_ids: list = None,  # 资源包ID列表
         git_ref_type: str = "branch",
         git_ref_name: str = None,
+        clone_depth: int = _GIT_CLONE_DEPTH,  # 克隆深度，0/None 表示完整克隆
     ):
         """从 Git 源码构建任务"""
         # 兼容场景：页面选择多阶段模式但仅选了一个服务时，实际会走单服务构建分支。
@@ -2691,93 +3881,43 @@ class BuildManager:
         # 构建上下文路径不需要保存到数据库（临时路径）
         # 如果需要，可以通过 task_id 和 image_name 推导
 
+        log_lock = self._task_log_lock(task_id)
+        # 在下方 try 内创建，保证之后任何异常都会在 finally 中关闭后台线程
+        log_batcher = None
+
         def log(msg: str):
             """添加日志（增强错误处理）"""
             try:
                 if not msg.endswith("\n"):
                     msg = msg + "\n"
-                # 使用任务管理器记录日志
-                try:
-                    self.task_manager.add_log(task_id, msg)
-                except Exception as e:
-                    # 如果任务管理器记录失败，至少打印到控制台
-                    print(f"⚠️ 任务日志记录失败 (task_id={task_id}): {e}")
-                    print(f"日志内容: {msg}")
-                # 保留旧的日志系统用于兼容
-                try:
-                    with self.lock:
-                        if task_id not in self.logs:
-                            self.logs[task_id] = deque()
-                        self.logs[task_id].append(msg)
-                except Exception as e:
-                    print(f"⚠️ 旧日志系统记录失败: {e}")
+                # 使用任务管理器记录日志（后台批量写入）
+                log_batcher.write(msg)
             except Exception as e:
                 # 即使日志函数本身失败，也要打印到控制台
                 print(f"⚠️ 日志函数异常: {e}")
                 print(f"原始消息: {msg}")
 
-        # 更新任务状态为运行中
         try:
-            self.task_manager.update_task_status(task_id, "running")
-        except Exception as e:
-            print(f"⚠️ 更新任务状态失败: {e}")
+            # 源码构建（尤其是 Docker 构建/推送输出）日志量很大，交给后台线程合并后批量落库，
+            # 并在同一批次内追加到旧的内存日志（保留用于兼容）
+            log_batcher = _TaskLogBatcher(
+                self.task_manager, task_id, self.logs[task_id], log_lock
+            )
 
-        reg_team_id, reg_user_id = self._registry_scope_for_task(task_id)
+            # 停止任务时会设置该事件，推送重试的退避等待据此提前结束
+            stop_event = self.task_manager.stop_event(task_id)
+
+            # 更新任务状态为运行中
+            try:
+                self.task_manager.update_task_status(task_id, "running")
+            except Exception as e:
+                print(f"⚠️ 更新任务状态失败: {e}")
+
+            reg_team_id, reg_user_id = self._registry_scope_for_task(task_id)
 
-        try:
             log(f"🚀 开始从 Git 源码构建: {git_url}\n")
 
             # 打印构建配置信息（过滤敏感信息）
-            def sanitize_config(config_dict):
-                """过滤敏感信息"""
-                if not isinstance(config_dict, dict):
-                    return config_dict
-
-                sensitive_patterns = [
-                    "password",
-                    "token",
-                    "secret",
-                    "credential",
-                    "auth",
-                    "access_token",
-                    "api_key",
-                    "apikey",
-                    "private_key",
-                    "privatekey",
-                    "pwd",
-                    "passwd",
-                ]
-                sanitized = {}
-                for k, v in config_dict.items():
-                    key_lower = k.lower()
-                    # 检查键名是否包含敏感词（但排除一些安全的键，如 image_name, tag_name 等）
-                    is_sensitive = any(
-                        pattern in key_lower for pattern in sensitive_patterns
-                    )
-                    # 排除一些安全的键名（即使包含敏感词）
-                    safe_keys = [
-                        "image_name",
-                        "tag",
-                        "tag_name",
-                        "dockerfile_name",
-                        "template_name",
-                    ]
-                    if k in safe_keys:
-                        is_sensitive = False
-
-                    if is_sensitive:
-                        sanitized[k] = "***已隐藏***"
-                    elif isinstance(v, dict):
-                        sanitized[k] = sanitize_config(v)
-                    elif isinstance(v, list):
-                        sanitized[k] = [
-                            sanitize_config(item) if isinstance(item, dict) else item
-                            for item in v
-                        ]
-                    else:
-                        sanitized[k] = v
-                return sanitized
-
             build_config = {
                 "git_url": git_url,
                 "image_name": image_name,
@@ -2800,7 +3940,7 @@ class BuildManager:
                 "resource_package_ids": resource_package_ids or [],
             }
 
-            sanitized_config = sanitize_config(build_config)
+            sanitized_config = _sanitize_config(build_config)
 
             # 判断构建模式
             is_multi_service = selected_services and len(selected_services) > 1
@@ -2808,25 +3948,22 @@ class BuildManager:
             if is_multi_service:
                 build_mode += f" (共 {len(selected_services)} 个服务)"
 
-            log(f"📋 构建配置解析结果:\n")
+            log("📋 构建配置解析结果:\n")
             log(f"   构建模式: {build_mode}\n")
             log(
                 f"   配置详情:\n{json.dumps(sanitized_config, indent=4, ensure_ascii=False)}\n"
             )
 
-            # 清理旧的构建上下文
+            # 清理旧的构建上下文（改名后后台删除，不阻塞本次构建）
             if os.path.exists(build_context):
                 try:
-                    shutil.rmtree(build_context)
+                    _remove_tree_async(build_context)
                 except Exception as e:
                     log(f"⚠️ 清理旧构建上下文失败: {e}\n")
             os.makedirs(build_context, exist_ok=True)
 
             # 克隆 Git 仓库
-            log(f"📥 正在克隆 Git 仓库...\n")
-            # 创建临时目录用于克隆（Git clone 会在目标目录下创建仓库目录）
-            temp_clone_dir = os.path.join(build_context, "source_temp")
-            os.makedirs(temp_clone_dir, exist_ok=True)
+            log("📥 正在克隆 Git 仓库...\n")
 
             # 获取 Git 配置，优先使用数据源的认证信息
             git_config = get_git_config()
@@ -2840,118 +3977,56 @@ class BuildManager:
                     git_config["username"] = source_auth["username"]
                 if source_auth.get("password"):
                     git_config["password"] = source_auth["password"]
-                log(f"🔐 使用数据源的认证信息\n")
+                log("🔐 使用数据源的认证信息\n")
             elif git_config.get("username") or git_config.get("password"):
-                log(f"🔐 使用全局 Git 配置的认证信息\n")
+                log("🔐 使用全局 Git 配置的认证信息\n")
 
             # Git clone 会在目标目录下创建仓库目录，所以目标目录应该是父目录
             # 调试日志：检查构建时使用的分支
-            print(f"🔍 _build_from_source_task:")
-            print(f"   - 参数branch: {branch}")
-            print(f"   - git_ref_type: {git_ref_type}")
-            print(f"   - git_ref_name: {git_ref_name or branch}")
-            print(f"   - git_url: {git_url}")
+            logger.debug(
+                "_build_from_source_task: branch=%s, git_ref_type=%s, git_ref_name=%s, git_url=%s",
+                branch,
+                git_ref_type,
+                git_ref_name or branch,
+                git_url,
+            )
             if git_ref_type == "tag":
                 log(f"📌 准备克隆标签: {git_ref_name or branch}\n")
             else:
                 log(f"📌 准备克隆分支: {branch or '默认分支'}\n")
-            clone_success, clone_error = self._clone_git_repo(
+            # 直接克隆到构建上下文目录：工作区本身就是构建上下文，不再复制一遍源码，
+            # 不需要的文件由下面写入的 .dockerignore 排除
+            clone_success, clone_error, actual_clone_dir = self._clone_git_repo(
                 git_url,
-                temp_clone_dir,
+                build_context,
                 branch,
                 git_config,
                 log,
                 git_ref_type=git_ref_type,
                 git_ref_name=git_ref_name or branch,
+                clone_depth=clone_depth,
+                dest_dir=build_context,
             )
 
             if not clone_success:
-                error_msg = f"Git 克隆失败"
+                error_msg = "Git 克隆失败"
                 if clone_error:
                     error_msg += f": {clone_error}"
                 raise RuntimeError(error_msg)
 
-            # Git clone 会在目标目录下创建仓库目录，找到实际的仓库目录
-            # 通常仓库目录名是 URL 的最后一部分（去掉 .git）
-            repo_name = git_url.rstrip("/").split("/")[-1].replace(".git", "")
-            actual_clone_dir = os.path.join(temp_clone_dir, repo_name)
-
-            # 如果找不到，尝试查找 temp_clone_dir 下的第一个目录
-            if not os.path.exists(actual_clone_dir):
-                items = os.listdir(temp_clone_dir)
-                if items:
-                    actual_clone_dir = os.path.join(temp_clone_dir, items[0])
-
-            if not os.path.exists(actual_clone_dir):
-                raise RuntimeError("无法找到克隆的仓库目录")
-
             # 如果指定了子目录，使用子目录作为构建上下文
             source_dir = actual_clone_dir
             if sub_path:
                 source_dir = os.path.join(actual_clone_dir, sub_path)
-                if not os.path.exists(source_dir):
+                if not _is_within_dir(actual_clone_dir, source_dir):
+                    raise RuntimeError(f"子目录超出仓库范围: {sub_path}")
+                if not os.path.isdir(source_dir):
                     raise RuntimeError(f"指定的子目录不存在: {sub_path}")
                 log(f"📂 使用子目录作为构建上下文: {sub_path}\n")
 
-            # 将源码复制到构建上下文根目录（排除不必要的文件）
-            log(f"📋 准备构建上下文...\n")
-
-            # 定义需要排除的文件和目录（类似 .dockerignore）
-            exclude_patterns = {
-                ".git",
-                ".gitignore",
-                ".dockerignore",
-                "__pycache__",
-                "*.pyc",
-                ".pytest_cache",
-                "node_modules",
-                ".venv",
-                "venv",
-                ".idea",
-                ".vscode",
-                ".cursor",
-                "*.md",
-                "*.log",
-                ".DS_Store",
-                "test_*.py",
-                "*_test.py",
-            }
-
-            def should_exclude(item_name):
-                """判断文件/目录是否应该被排除"""
-                # 直接匹配
-                if item_name in exclude_patterns:
-                    return True
-                # 通配符匹配
-                import fnmatch
-
-                for pattern in exclude_patterns:
-                    if fnmatch.fnmatch(item_name, pattern):
-                        return True
-                return False
-
-            copied_count = 0
-            excluded_count = 0
-
-            for item in os.listdir(source_dir):
-                if should_exclude(item):
-                    excluded_count += 1
-                    log(f"⏭️  跳过: {item}\n")
-                    continue
-
-                src = os.path.join(source_dir, item)
-                dst = os.path.join(build_context, item)
-
-                try:
-                    if os.path.isdir(src):
-                        shutil.copytree(src, dst, dirs_exist_ok=True)
-                    else:
-                        shutil.copy2(src, dst)
-                    copied_count += 1
-                except Exception as e:
-                    log(f"⚠️  复制失败 {item}: {e}\n")
-
-            log(f"✅ 已复制 {copied_count} 个文件/目录，跳过 {excluded_count} 个\n")
+            # 指定子目录时，子目录即为构建上下文
+            build_context = source_dir
+            log(f"📋 使用仓库工作区作为构建上下文: {build_context}\n")
 
             # 检查项目中是否存在 Dockerfile（使用自定义文件名或路径）
             # 规范化路径分隔符（Git 路径使用 /，但 Windows 使用 \）
@@ -2962,6 +4037,13 @@ class BuildManager:
                 source_dir, normalized_dockerfile_name
             )
             has_project_dockerfile = os.path.exists(project_dockerfile_path)
+            if has_project_dockerfile and not _is_within_dir(
+                actual_clone_dir, project_dockerfile_path
+            ):
+                raise RuntimeError(f"Dockerfile 路径超出仓库范围: {dockerfile_name}")
+
+            # 由模板生成时保留内容，后面解析阶段时无需再读回文件
+            dockerfile_content = None
 
             # 决定使用项目中的 Dockerfile 还是模板
             if has_project_dockerfile and use_project_dockerfile:
@@ -2976,15 +4058,23 @@ class BuildManager:
                 # 重要：无论原始文件名是什么，都统一复制为 "Dockerfile"
                 # 这样可以避免 buildx 的文件名识别问题，确保构建时使用默认文件名
                 dockerfile_path = os.path.join(build_context, "Dockerfile")
-                shutil.copy2(project_dockerfile_path, dockerfile_path)
-                log(
-                    f"✅ 已从 {dockerfile_relative_path} 复制到构建上下文的 Dockerfile\n"
-                )
+                # 按解析符号链接后的真实路径比较：两者指向同一文件时无需复制
+                if os.path.normcase(
+                    os.path.realpath(project_dockerfile_path)
+                ) == os.path.normcase(os.path.realpath(dockerfile_path)):
+                    log("✅ 项目 Dockerfile 已位于构建上下文根目录\n")
+                else:
+                    # 仓库中的 Dockerfile 可能是符号链接，先删除再写入，不跟随链接覆盖外部文件
+                    _unlink_if_exists(dockerfile_path)
+                    shutil.copy2(project_dockerfile_path, dockerfile_path)
+                    log(
+                        f"✅ 已从 {dockerfile_relative_path} 复制到构建上下文的 Dockerfile\n"
+                    )
             else:
                 if has_project_dockerfile and not use_project_dockerfile:
-                    log(f"📋 项目中有 Dockerfile，但用户选择使用模板\n")
+                    log("📋 项目中有 Dockerfile，但用户选择使用模板\n")
                 else:
-                    log(f"📋 项目中没有 Dockerfile，使用模板生成\n")
+                    log("📋 项目中没有 Dockerfile，使用模板生成\n")
 
                 # 使用模板生成 Dockerfile
                 template_path = get_template_path(selected_template, project_type)
@@ -2992,37 +4082,28 @@ class BuildManager:
                     raise RuntimeError(f"模板不存在: {selected_template}")
 
                 dockerfile_path = os.path.join(build_context, "Dockerfile")
-                from backend.template_parser import parse_template
-
-                # 合并全局模板参数和服务模板参数（如果有多个服务，使用第一个服务的参数作为默认值）
-                all_template_params = {
-                    "PROJECT_TYPE": project_type,
-                    "UPLOADED_FILENAME": "app.jar",  # 源码构建不需要这个
-                    **template_params,
-                }
+                _unlink_if_exists(dockerfile_path)
 
-                # 如果有服务模板参数，合并到全局参数中（用于单服务构建）
-                if service_template_params:
-                    # 如果只有一个服务，直接使用该服务的参数
-                    if len(service_template_params) == 1:
-                        service_name = list(service_template_params.keys())[0]
-                        all_template_params.update(
-                            service_template_params[service_name]
-                        )
-                    else:
-                        # 多个服务时，合并所有服务的参数（可能会有冲突，但先这样处理）
-                        for service_params in service_template_params.values():
-                            all_template_params.update(service_params)
+                # 合并全局模板参数和服务模板参数：ChainMap 按查找顺序分层，不复制字典
+                # 优先级与逐个 update 相同：后面的服务 > 前面的服务 > 全局参数 > 默认值
+                all_template_params = ChainMap(
+                    *reversed(list((service_template_params or {}).values())),
+                    template_params or {},
+                    {
+                        "PROJECT_TYPE": project_type,
+                        "UPLOADED_FILENAME": "app.jar",  # 源码构建不需要这个
+                    },
+                )
 
-                parse_template(
+                dockerfile_content = parse_template(
                     template_path,
                     dockerfile_path,
                     all_template_params,
                 )
-                log(f"✅ 已生成 Dockerfile\n")
+                log("✅ 已生成 Dockerfile\n")
 
             # 复制资源包到构建上下文
-            log(f"📦 检查资源包配置...\n")
+            log("📦 检查资源包配置...\n")
             if resource_package_ids:
                 log(f"📋 发现 {len(resource_package_ids)} 个资源包配置\n")
                 try:
@@ -3061,82 +4142,104 @@ class BuildManager:
                                     ) or config.get("target_dir", "resources")
                                     log(f"   📦 {package_id} -> {target_path}\n")
                         else:
-                            log(f"⚠️ 资源包复制失败或资源包不存在\n")
+                            log("⚠️ 资源包复制失败或资源包不存在\n")
                 except Exception as e:
                     log(f"⚠️ 复制资源包失败: {str(e)}\n")
             else:
-                log(f"ℹ️  未配置资源包，跳过资源包复制\n")
+                log("ℹ️  未配置资源包，跳过资源包复制\n")
 
             # Docker API 需要相对于构建上下文的 Dockerfile 路径
             dockerfile_relative = os.path.relpath(dockerfile_path, build_context)
             log(f"📄 Dockerfile 相对路径: {dockerfile_relative}\n")
-            # 创建 .dockerignore 文件以进一步优化构建上下文
+            # 创建 .dockerignore 文件排除 .git、依赖目录、文档等不需要的文件。
+            # 构建上下文就是仓库工作区，统一使用默认规则（覆盖项目自带的 .dockerignore，
+            # 与以往复制源码时跳过项目 .dockerignore 的行为一致）
             dockerignore_path = os.path.join(build_context, ".dockerignore")
-            if not os.path.exists(dockerignore_path):
-                log(f"📝 创建 .dockerignore 文件...\n")
-                with open(dockerignore_path, "w") as f:
-                    f.write(
-                        """# Git 相关
-.git
-.gitignore
-.gitattributes
+            log("📝 创建 .dockerignore 文件...\n")
+            # 先删除仓库中已有的 .dockerignore（可能是符号链接），再以 O_EXCL|O_NOFOLLOW 新建
+            _unlink_if_exists(dockerignore_path)
+            dockerignore_fd = os.open(
+                dockerignore_path,
+                os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0),
+                0o644,
+            )
+            try:
+                os.write(dockerignore_fd, _DOCKERIGNORE_BYTES)
+            finally:
+                os.close(dockerignore_fd)
+            log("✅ .dockerignore 已创建\n")
 
-# Python 缓存
-__pycache__
-*.pyc
-*.pyo
-*.pyd
-.Python
-.pytest_cache
-.venv
-venv/
+            # 推送路径控制：默认允许后置全局推送；在多服务独立推送模式下会关闭
+            service_level_push_completed = False
+            is_multi_services_build = bool(selected_services and len(selected_services) > 1)
 
-# Node.js
-node_modules/
-npm-debug.log*
-yarn-debug.log*
-yarn-error.log*
+            # 需要全局推送时（单服务构建或多服务单一推送模式），构建前先解析推送目标仓库，
+            # 并在后台登录，凭据助手的耗时与构建并行
+            global_push_login = None
+            if should_push and not (is_multi_services_build and push_mode != "single"):
+                log("🔑 预先解析推送仓库，登录与构建并行进行\n")
+                # 直接使用构建时的镜像名和标签进行推送
+                # full_tag 格式: image_name:tag，可能包含registry路径
+                # 例如: registry.cn-shanghai.aliyuncs.com/51jbm/app2docker:dev
+                global_push_repository = image_name  # 直接使用构建时的镜像名
+                global_push_tag = tag
+                # 强一致：优先按构建时 full_tag 反解 repository/tag，避免变量漂移导致推送错镜像
+                last_colon = full_tag.rfind(":")
+                last_slash = full_tag.rfind("/")
+                if last_colon > last_slash:
+                    global_push_repository = full_tag[:last_colon]
+                    global_push_tag = full_tag[last_colon + 1 :]
 
-# IDE
-.idea/
-.vscode/
-.cursor/
-*.swp
-*.swo
-.DS_Store
+                # 根据镜像名找到对应的registry配置
+                registry_matcher = _RegistryMatcher(reg_team_id, reg_user_id)
 
-# 测试和文档
-test_*.py
-*_test.py
-*.md
-README*
-LICENSE
+                def find_matching_registry_for_push(image_name):
+                    """根据镜像名找到匹配的registry配置"""
+                    image_registry = _RegistryMatcher.image_registry(image_name)
+                    if image_registry:
+                        log(f"🔍 从镜像名提取registry: {image_registry}\n")
+                        reg, _ = registry_matcher.find(image_name)
+                        log(f"🔍 共有 {registry_matcher.registry_count} 个registry配置\n")
+                        if reg is not None:
+                            log(f"✅ 找到匹配的registry: {reg.name}\n")
+                            return registry_matcher.config_for(reg)
+                    return None
 
-# 日志
-*.log
-logs/
-"""
+                # 尝试根据镜像名找到匹配的registry
+                registry_config = find_matching_registry_for_push(global_push_repository)
+                if not registry_config:
+                    # 如果找不到匹配的，使用激活的registry
+                    registry_config = registry_matcher.active_config()
+                    log(
+                        f"⚠️  未找到匹配的registry配置，使用激活仓库: {registry_config.get('name', 'Unknown')}\n"
+                    )
+                else:
+                    log(
+                        f"🎯 找到匹配的registry配置: {registry_config.get('name', 'Unknown')}\n"
                     )
-                log(f"✅ .dockerignore 已创建\n")
 
-            # 推送路径控制：默认允许后置全局推送；在多服务独立推送模式下会关闭
-            service_level_push_completed = False
-            is_multi_services_build = bool(selected_services and len(selected_services) > 1)
+                global_push_login = _start_registry_login(
+                    docker_builder, registry_config, log
+                )
 
             # 多服务构建逻辑（只有当服务数量大于1时才进入多服务构建）
             if is_multi_services_build:
                 # 多服务推送依赖团队仓库配置，此处再次解析避免作用域遗漏
                 reg_team_id, reg_user_id = self._registry_scope_for_task(task_id)
+                # 所有服务共用一份仓库索引和配置缓存
+                registry_matcher = _RegistryMatcher(reg_team_id, reg_user_id)
                 log(f"🔨 开始多服务构建，共 {len(selected_services)} 个服务\n")
                 log(f"📋 选中的服务: {', '.join(selected_services)}\n")
                 log(f"📦 推送模式: {push_mode}\n")
 
                 service_push_config = service_push_config or {}
                 built_services = []
+                # 多服务独立推送模式下提交到推送线程池的任务，构建结束后汇总结果
+                push_futures = []
 
                 # 单一推送模式：构建所有服务到一个镜像
                 if push_mode == "single":
-                    log(f"🔨 单一推送模式：所有服务将构建到一个镜像中\n")
+                    log("🔨 单一推送模式：所有服务将构建到一个镜像中\n")
                     log(f"📦 镜像标签: {full_tag}\n")
                     log(f"📂 构建上下文: {build_context}\n")
 
@@ -3146,8 +4249,9 @@ logs/
 
                     if os.path.exists(dockerfile_path):
                         try:
-                            with open(dockerfile_path, "r", encoding="utf-8") as f:
-                                dockerfile_content = f.read()
+                            if dockerfile_content is None:
+                                with open(dockerfile_path, "r", encoding="utf-8") as f:
+                                    dockerfile_content = f.read()
                             services, _ = parse_dockerfile_services(dockerfile_content)
                             if services and len(services) > 0:
                                 # 使用 Dockerfile 中最后一个阶段
@@ -3158,7 +4262,7 @@ logs/
                                 log(f"🚀 使用最后阶段: {target_stage}\n")
                             else:
                                 log(
-                                    f"⚠️ Dockerfile 中没有找到多阶段，将构建默认阶段（不指定 target）\n"
+                                    "⚠️ Dockerfile 中没有找到多阶段，将构建默认阶段（不指定 target）\n"
                                 )
                         except Exception as e:
                             log(
@@ -3187,10 +4291,10 @@ logs/
                             build_kwargs["target"] = target_stage
                             log(f"🚀 构建目标阶段: {target_stage}\n")
                         else:
-                            log(f"🚀 构建默认阶段（无 target）\n")
+                            log("🚀 构建默认阶段（无 target）\n")
 
                         build_stream = docker_builder.build_image(**build_kwargs)
-                        log(f"✅ Docker 构建流已启动\n")
+                        log("✅ Docker 构建流已启动\n")
                     except Exception as e:
                         log(f"❌ 启动 Docker 构建失败: {str(e)}\n")
                         import traceback
@@ -3198,26 +4302,15 @@ logs/
                         log(f"详细错误:\n{traceback.format_exc()}\n")
                         raise
 
-                    log(f"🔍 开始处理 Docker 构建流输出...\n")
+                    log("🔍 开始处理 Docker 构建流输出...\n")
                     chunk_count = 0
                     for chunk in build_stream:
                         chunk_count += 1
-                        if isinstance(chunk, dict):
-                            if "stream" in chunk:
-                                log(chunk["stream"])
-                            if "status" in chunk:
-                                log(f"📊 {chunk['status']}\n")
-                            if "progress" in chunk:
-                                log(f"⏳ {chunk['progress']}\n")
-                            if "error" in chunk:
-                                error_msg = chunk["error"]
-                                log(f"❌ 构建错误: {error_msg}\n")
-                                raise RuntimeError(f"构建失败: {error_msg}")
-                            if "errorDetail" in chunk:
-                                error_detail = chunk["errorDetail"]
-                                log(f"💥 错误详情: {error_detail}\n")
-                        else:
-                            log(f"📦 原始输出: {str(chunk)}\n")
+                        text, error_msg = _render_build_chunk(chunk)
+                        if text:
+                            log(text)
+                        if error_msg is not None:
+                            raise RuntimeError(f"构建失败: {error_msg}")
 
                     log(f"✅ 镜像构建完成: {full_tag}\n")
                     built_services = selected_services
@@ -3228,7 +4321,7 @@ logs/
                         # 使用单服务构建的推送逻辑
                         # ... (推送逻辑将在后面添加)
                     else:
-                        log(f"⏭️  跳过推送\n")
+                        log("⏭️  跳过推送\n")
 
                 # 多阶段推送模式：每个服务独立构建和推送
                 else:
@@ -3238,25 +4331,27 @@ logs/
 
                     if os.path.exists(dockerfile_path):
                         try:
-                            with open(dockerfile_path, "r", encoding="utf-8") as f:
-                                dockerfile_content = f.read()
+                            if dockerfile_content is None:
+                                with open(dockerfile_path, "r", encoding="utf-8") as f:
+                                    dockerfile_content = f.read()
                             services, _ = parse_dockerfile_services(dockerfile_content)
-                            if services and len(services) > 0:
-                                # 构建服务名称到阶段的映射
-                                # ✅ 配置的服务：只做「精确匹配」，不再做模糊/索引匹配
-                                # 这样可以避免 app2docker 误匹配到 app2docker-agent 等情况
+                            # 构建服务名称到阶段的映射
+                            # ✅ 配置的服务：只做「精确匹配」，不再做模糊/索引匹配
+                            # 这样可以避免 app2docker 误匹配到 app2docker-agent 等情况
+                            # 先按小写阶段名建索引（同名时保留第一个阶段），每个服务 O(1) 查找
+                            stage_by_lower = {}
+                            for service in services or ():
+                                stage_name = service.get("name")
+                                if stage_name:
+                                    stage_by_lower.setdefault(
+                                        stage_name.lower(), stage_name
+                                    )
+                            # 没有命名阶段时直接跳过服务匹配
+                            if stage_by_lower:
                                 for service_name in selected_services:
-                                    for service in services:
-                                        stage_name = service.get("name")
-                                        if (
-                                            stage_name
-                                            and service_name.lower()
-                                            == stage_name.lower()
-                                        ):
-                                            service_to_stage_map[service_name] = (
-                                                stage_name
-                                            )
-                                            break
+                                    stage_name = stage_by_lower.get(service_name.lower())
+                                    if stage_name:
+                                        service_to_stage_map[service_name] = stage_name
 
                                 log(
                                     f"🔍 从 Dockerfile 解析到阶段映射: {service_to_stage_map}\n"
@@ -3265,435 +4360,291 @@ logs/
                                     f"🔍 解析到的所有阶段: {[s.get('name') for s in services]}\n"
                                 )
                             else:
-                                log(f"⚠️ Dockerfile 中没有找到多阶段\n")
+                                log("⚠️ Dockerfile 中没有找到多阶段\n")
                         except Exception as e:
                             log(f"⚠️ 解析 Dockerfile 阶段失败: {e}\n")
                             import traceback
 
                             log(f"详细错误:\n{traceback.format_exc()}\n")
 
-                    for service_name in selected_services:
-                        log(f"\n{'='*60}\n")
-                        log(f"🚀 开始构建服务: {service_name}\n")
-
-                        # 获取服务的配置（支持每个服务独立的镜像名、tag 和 registry）
-                        service_config = service_push_config.get(service_name, {})
-                        if isinstance(service_config, dict):
-                            # 新格式：包含 push, imageName, tag, registry
-                            service_image_name = service_config.get(
-                                "imageName", f"{image_name}-{service_name}"
-                            )
-                            service_tag_value = service_config.get("tag", tag)
-                            service_registry = service_config.get("registry", "")
-                        else:
-                            # 兼容旧格式：只有 push 布尔值
-                            service_image_name = f"{image_name}-{service_name}"
-                            service_tag_value = tag
-                            service_registry = ""
-
-                        service_tag = f"{service_image_name}:{service_tag_value}"
-                        log(f"📦 镜像标签: {service_tag}\n")
-                        log(f"📂 构建上下文: {build_context}\n")
-
-                        # 确定要构建的 target stage
-                        target_stage = service_to_stage_map.get(service_name)
-                        if not target_stage:
+                    # 根据镜像名找到对应的registry配置（与单服务构建逻辑一致），所有服务共用
+                    def find_matching_registry_for_push(img_name):
+                        """根据镜像名找到匹配的registry配置：优先完全匹配，其次前缀匹配"""
+                        img_registry = _RegistryMatcher.image_registry(img_name)
+                        if img_registry:
+                            log(f"🔍 从镜像名提取registry: {img_registry}\n")
+                            reg, match_kind = registry_matcher.find(img_name)
                             log(
-                                f"⚠️ 服务 '{service_name}' 没有对应的 Dockerfile 阶段，将构建默认阶段（不指定 target）\n"
+                                f"🔍 扫描所有 {registry_matcher.registry_count} 个registry配置...\n"
                             )
-
-                        try:
-                            build_kwargs = {
-                                "path": build_context,
-                                "tag": service_tag,
-                                "dockerfile": dockerfile_relative,
-                            }
-                            # 只有在有明确的 target stage 时才添加 target 参数
-                            if target_stage:
-                                build_kwargs["target"] = target_stage
-                                log(f"🚀 构建目标阶段: {target_stage}\n")
+                            if reg is not None:
+                                kind_label = "完全匹配" if match_kind == "exact" else "部分匹配"
+                                log(
+                                    f"✅ 找到{kind_label}的registry: {reg.name} (地址: {reg.address})\n"
+                                )
+                                return registry_matcher.config_for(reg)
+
+                            log("⚠️  未找到匹配的registry配置\n")
+                        return None
+
+                    def push_service_image(
+                        service_name,
+                        push_repository,
+                        push_tag,
+                        registry_config,
+                        login_future,
+                        repository_lock,
+                    ):
+                        """推送单个服务镜像（在推送线程池中执行），失败只记录日志
+
+                        Returns:
+                            (service_name, ok, error)：error 为失败原因，成功时为 None
+                        """
+                        with repository_lock:
+                            push_host = (
+                                _RegistryMatcher.image_registry(push_repository)
+                                or "docker.io"
+                            )
+                            anonymous = _registry_auth_config(registry_config)[0] is None
+                            if anonymous and push_host in anonymous_denied_hosts:
+                                # 同一仓库的匿名推送已被拒绝，没有认证信息时必然失败，不再发起推送
+                                log(
+                                    f"⏭️  服务 {service_name} 缺少认证信息，{push_host} 已拒绝匿名推送，跳过推送\n"
+                                )
+                                return service_name, False, f"{push_host} 已拒绝匿名推送"
+                            try:
+                                retried = _push_to_registry(
+                                    docker_builder,
+                                    push_repository,
+                                    push_tag,
+                                    registry_config,
+                                    log,
+                                    line_prefix=f"[{service_name}] ",
+                                    login_future=login_future,
+                                    stop_event=stop_event,
+                                )
+                                log(
+                                    f"✅ 服务 {service_name} 推送完成{'（重试成功）' if retried else ''}\n"
+                                )
+                                return service_name, True, None
+                            except Exception as e:
+                                log(f"❌ 服务 {service_name} 推送失败: {str(e)}\n")
+                                # 推送失败不影响构建成功
+                                if anonymous and _is_auth_error(
+                                    str(e), getattr(e, "detail", None)
+                                ):
+                                    anonymous_denied_hosts.add(push_host)
+                                return service_name, False, str(e)
+
+                    # 已拒绝匿名推送的仓库地址（本次构建内有效，推送线程共享）
+                    anonymous_denied_hosts = set()
+                    # 推送线程池在第一个需要推送的服务构建完成后创建
+                    push_executor = None
+                    # 每个仓库（地址 + 用户名）只登录一次，登录在后台进行，与后续服务构建并行
+                    registry_logins = {}
+                    # 同一 repository 的多个 tag 依次推送：后推送的 tag 复用已上传的层，
+                    # 只需提交 manifest，避免并发推送重复上传相同的层
+                    repository_locks = defaultdict(threading.Lock)
+                    try:
+                        for service_name in selected_services:
+                            log(f"\n{'='*60}\n")
+                            log(f"🚀 开始构建服务: {service_name}\n")
+
+                            # 获取服务的配置（支持每个服务独立的镜像名、tag 和 registry）
+                            service_config = service_push_config.get(service_name, {})
+                            if isinstance(service_config, dict):
+                                # 新格式：包含 push, imageName, tag, registry
+                                service_image_name = service_config.get(
+                                    "imageName", f"{image_name}-{service_name}"
+                                )
+                                service_tag_value = service_config.get("tag", tag)
+                                service_registry = service_config.get("registry", "")
                             else:
-                                log(f"🚀 构建默认阶段（不指定 target）\n")
+                                # 兼容旧格式：只有 push 布尔值
+                                service_image_name = f"{image_name}-{service_name}"
+                                service_tag_value = tag
+                                service_registry = ""
+
+                            service_tag = f"{service_image_name}:{service_tag_value}"
+                            log(f"📦 镜像标签: {service_tag}\n")
+                            log(f"📂 构建上下文: {build_context}\n")
+
+                            # 确定要构建的 target stage
+                            target_stage = service_to_stage_map.get(service_name)
+                            if not target_stage:
+                                log(
+                                    f"⚠️ 服务 '{service_name}' 没有对应的 Dockerfile 阶段，将构建默认阶段（不指定 target）\n"
+                                )
 
-                            build_stream = docker_builder.build_image(**build_kwargs)
-                            log(f"✅ Docker 构建流已启动\n")
-                        except Exception as e:
-                            log(f"❌ 启动 Docker 构建失败: {str(e)}\n")
-                            import traceback
+                            try:
+                                build_kwargs = {
+                                    "path": build_context,
+                                    "tag": service_tag,
+                                    "dockerfile": dockerfile_relative,
+                                }
+                                # 只有在有明确的 target stage 时才添加 target 参数
+                                if target_stage:
+                                    build_kwargs["target"] = target_stage
+                                    log(f"🚀 构建目标阶段: {target_stage}\n")
+                                else:
+                                    log("🚀 构建默认阶段（不指定 target）\n")
 
-                            log(f"详细错误:\n{traceback.format_exc()}\n")
-                            raise
-
-                        log(f"🔍 开始处理 Docker 构建流输出...\n")
-                        chunk_count = 0
-                        for chunk in build_stream:
-                            chunk_count += 1
-                            if isinstance(chunk, dict):
-                                if "stream" in chunk:
-                                    log(f"[{service_name}] {chunk['stream']}")
-                                if "status" in chunk:
-                                    log(f"[{service_name}] 📊 {chunk['status']}\n")
-                                if "progress" in chunk:
-                                    log(f"[{service_name}] ⏳ {chunk['progress']}\n")
-                                if "error" in chunk:
-                                    error_msg = chunk["error"]
-                                    log(f"[{service_name}] ❌ 构建错误: {error_msg}\n")
+                                build_stream = docker_builder.build_image(**build_kwargs)
+                                log("✅ Docker 构建流已启动\n")
+                            except Exception as e:
+                                log(f"❌ 启动 Docker 构建失败: {str(e)}\n")
+                                import traceback
+
+                                log(f"详细错误:\n{traceback.format_exc()}\n")
+                                raise
 
+                            log("🔍 开始处理 Docker 构建流输出...\n")
+                            chunk_count = 0
+                            service_log_prefix = f"[{service_name}] "
+                            for chunk in build_stream:
+                                chunk_count += 1
+                                text, error_msg = _render_build_chunk(
+                                    chunk, service_log_prefix
+                                )
+                                if text:
+                                    log(text)
+                                if error_msg is not None:
                                     # 检测是否是镜像拉取失败的错误
-                                    if "manifest" in error_msg.lower() and (
-                                        "not found" in error_msg.lower()
-                                        or "unknown" in error_msg.lower()
-                                    ):
-                                        # 提取镜像名称
-                                        import re
-
-                                        image_match = re.search(
-                                            r"manifest for ([^\s]+) not found",
-                                            error_msg,
+                                    image_match = _MANIFEST_NOT_FOUND_RE.search(
+                                        error_msg
+                                    )
+                                    if image_match:
+                                        image_name = image_match.group(1)
+                                        enhanced_error = (
+                                            f"服务 {service_name} 构建失败: 无法拉取基础镜像 {image_name}\n"
+                                            "可能的原因：\n"
+                                            "1. 镜像不存在或已被删除\n"
+                                            "2. 镜像标签不正确\n"
+                                            "3. 网络连接问题或仓库访问受限\n"
+                                            "4. 需要认证但未配置认证信息\n"
+                                            "建议：检查 Dockerfile 中的 FROM 指令，确认镜像名称和标签是否正确"
                                         )
-                                        if image_match:
-                                            image_name = image_match.group(1)
-                                            enhanced_error = (
-                                                f"服务 {service_name} 构建失败: 无法拉取基础镜像 {image_name}\n"
-                                                f"可能的原因：\n"
-                                                f"1. 镜像不存在或已被删除\n"
-                                                f"2. 镜像标签不正确\n"
-                                                f"3. 网络连接问题或仓库访问受限\n"
-                                                f"4. 需要认证但未配置认证信息\n"
-                                                f"建议：检查 Dockerfile 中的 FROM 指令，确认镜像名称和标签是否正确"
-                                            )
-                                            log(
-                                                f"[{service_name}] 💡 {enhanced_error}\n"
-                                            )
-                                            raise RuntimeError(enhanced_error)
+                                        log(
+                                            f"[{service_name}] 💡 {enhanced_error}\n"
+                                        )
+                                        raise RuntimeError(enhanced_error)
 
                                     raise RuntimeError(
                                         f"服务 {service_name} 构建失败: {error_msg}"
                                     )
-                                if "errorDetail" in chunk:
-                                    error_detail = chunk["errorDetail"]
-                                    log(
-                                        f"[{service_name}] 💥 错误详情: {error_detail}\n"
-                                    )
-                            else:
-                                log(f"[{service_name}] 📦 原始输出: {str(chunk)}\n")
 
-                        log(f"✅ 服务 {service_name} 构建完成\n")
-                        built_services.append(service_name)
+                            log(f"✅ 服务 {service_name} 构建完成\n")
+                            built_services.append(service_name)
 
-                        # 根据推送配置决定是否推送
-                        should_push_service = False
-                        if isinstance(service_config, dict):
-                            should_push_service = service_config.get("push", False)
-                        else:
-                            # 兼容旧格式
-                            should_push_service = bool(service_config)
+                            # 根据推送配置决定是否推送
+                            should_push_service = False
+                            if isinstance(service_config, dict):
+                                should_push_service = service_config.get("push", False)
+                            else:
+                                # 兼容旧格式
+                                should_push_service = bool(service_config)
 
-                        if should_push_service:
-                            log(f"📡 开始推送服务镜像: {service_tag}\n")
-                            log(f"[{service_name}] 🧭 推送路径: service\n")
-                            try:
-                                # 初始化 registry_config
-                                registry_config = None
-
-                                # 根据镜像名找到对应的registry配置（与单服务构建逻辑一致）
-                                def find_matching_registry_for_push(img_name):
-                                    """根据镜像名找到匹配的registry配置，扫描所有仓库配置"""
-                                    # 如果镜像名包含斜杠，提取registry部分
-                                    parts = img_name.split("/")
-                                    if len(parts) >= 2 and "." in parts[0]:
-                                        # 镜像名格式: registry.com/namespace/image
-                                        img_registry = parts[0]
+                            if should_push_service:
+                                log(f"📡 开始推送服务镜像: {service_tag}\n")
+                                log(f"[{service_name}] 🧭 推送路径: service\n")
+                                try:
+                                    # 初始化 registry_config
+                                    registry_config = None
+
+                                    # 如果服务配置中指定了 registry，优先使用指定的 registry
+                                    if service_registry:
                                         log(
-                                            f"🔍 从镜像名提取registry: {img_registry}\n"
+                                            f"🔍 使用服务指定的 registry: {service_registry}\n"
                                         )
-                                        all_registries = get_all_registries(
-                                            team_id=reg_team_id, user_id=reg_user_id
+                                        # 获取包含解密密码的配置（同一构建内按名称缓存）
+                                        registry_config = registry_matcher.config_by_name(
+                                            service_registry
                                         )
-                                        log(
-                                            f"🔍 扫描所有 {len(all_registries)} 个registry配置...\n"
+                                        if registry_config:
+                                            log(
+                                                f"✅ 找到指定的 registry 配置: {service_registry}\n"
+                                            )
+                                        else:
+                                            log(
+                                                f"⚠️  未找到指定的 registry: {service_registry}，将尝试从镜像名匹配\n"
+                                            )
+                                            registry_config = None
+
+                                    # 如果未指定 registry 或找不到指定的 registry，尝试根据镜像名找到匹配的registry
+                                    if not registry_config:
+                                        registry_config = find_matching_registry_for_push(
+                                            service_image_name
                                         )
 
-                                        # 优先匹配：完全匹配
-                                        for reg in all_registries:
-                                            reg_address = reg.get("registry", "")
-                                            reg_name = reg.get("name", "Unknown")
-                                            reg_key = reg.get("registry_id") or reg_name
-                                            if (
-                                                reg_address
-                                                and img_registry == reg_address
-                                            ):
-                                                log(
-                                                    f"✅ 找到完全匹配的registry: {reg_name} (地址: {reg_address})\n"
-                                                )
-                                                return get_registry_by_name(
-                                                    reg_key,
-                                                    team_id=reg_team_id,
-                                                    user_id=reg_user_id,
-                                                )
-
-                                        # 次优匹配：包含关系
-                                        for reg in all_registries:
-                                            reg_address = reg.get("registry", "")
-                                            reg_name = reg.get("name", "Unknown")
-                                            reg_key = reg.get("registry_id") or reg_name
-                                            if reg_address and (
-                                                img_registry.startswith(reg_address)
-                                                or reg_address.startswith(img_registry)
-                                                or img_registry in reg_address
-                                                or reg_address in img_registry
-                                            ):
-                                                log(
-                                                    f"✅ 找到部分匹配的registry: {reg_name} (地址: {reg_address})\n"
-                                                )
-                                                return get_registry_by_name(
-                                                    reg_key,
-                                                    team_id=reg_team_id,
-                                                    user_id=reg_user_id,
-                                                )
-
-                                        log(f"⚠️  未找到匹配的registry配置\n")
-                                    return None
-
-                                # 如果服务配置中指定了 registry，优先使用指定的 registry
-                                if service_registry:
-                                    log(
-                                        f"🔍 使用服务指定的 registry: {service_registry}\n"
-                                    )
-                                    # 使用 get_registry_by_name 获取包含解密密码的配置
-                                    registry_config = get_registry_by_name(
-                                        service_registry,
-                                        team_id=reg_team_id,
-                                        user_id=reg_user_id,
-                                    )
-                                    if registry_config:
+                                    if not registry_config:
+                                        # 如果仍然找不到匹配的，使用激活的registry作为后备
+                                        registry_config = registry_matcher.active_config()
                                         log(
-                                            f"✅ 找到指定的 registry 配置: {service_registry}\n"
+                                            f"⚠️  未找到匹配的registry配置，使用激活仓库作为后备: {registry_config.get('name', 'Unknown')}\n"
                                         )
                                     else:
                                         log(
-                                            f"⚠️  未找到指定的 registry: {service_registry}，将尝试从镜像名匹配\n"
+                                            f"🎯 使用registry配置: {registry_config.get('name', 'Unknown')} (地址: {registry_config.get('registry', 'Unknown')})\n"
                                         )
-                                        registry_config = None
 
-                                # 如果未指定 registry 或找不到指定的 registry，尝试根据镜像名找到匹配的registry
-                                if not registry_config:
-                                    registry_config = find_matching_registry_for_push(
-                                        service_image_name
-                                    )
+                                    # 使用完整的镜像名和 tag 进行推送
+                                    # service_image_name 格式: image_name-service_name (可能包含 registry 前缀)
+                                    push_repository = service_image_name
+                                    push_tag = service_tag_value  # 使用服务配置的 tag
 
-                                if not registry_config:
-                                    # 如果仍然找不到匹配的，使用激活的registry作为后备
-                                    registry_config = get_active_registry(
-                                        team_id=reg_team_id, user_id=reg_user_id
+                                    login_key = (
+                                        registry_config.get("registry", ""),
+                                        registry_config.get("username"),
                                     )
-                                    log(
-                                        f"⚠️  未找到匹配的registry配置，使用激活仓库作为后备: {registry_config.get('name', 'Unknown')}\n"
-                                    )
-                                else:
-                                    log(
-                                        f"🎯 使用registry配置: {registry_config.get('name', 'Unknown')} (地址: {registry_config.get('registry', 'Unknown')})\n"
-                                    )
-
-                                username = registry_config.get("username")
-                                password = registry_config.get("password")
-                                registry_host = registry_config.get("registry", "")
-
-                                auth_config = None
-                                if username and password:
-                                    auth_config = {
-                                        "username": username,
-                                        "password": password,
-                                    }
-                                    if registry_host and registry_host != "docker.io":
-                                        auth_config["serveraddress"] = registry_host
-                                    else:
-                                        auth_config["serveraddress"] = (
-                                            "https://index.docker.io/v1/"
+                                    if login_key not in registry_logins:
+                                        registry_logins[login_key] = (
+                                            _start_registry_login(
+                                                docker_builder, registry_config, log
+                                            )
                                         )
 
-                                # 使用完整的镜像名和 tag 进行推送
-                                # service_image_name 格式: image_name-service_name (可能包含 registry 前缀)
-                                push_repository = service_image_name
-                                push_tag = service_tag_value  # 使用服务配置的 tag
-
-                                # 推送并处理错误（支持重试）
-                                push_retried = False
-
-                                try:
-                                    push_stream = docker_builder.push_image(
-                                        push_repository,
-                                        push_tag,
-                                        auth_config=auth_config,
-                                    )
-
-                                    for chunk in push_stream:
-                                        if isinstance(chunk, dict):
-                                            if "status" in chunk:
-                                                log(
-                                                    f"[{service_name}] {chunk['status']}\n"
-                                                )
-                                            elif "error" in chunk:
-                                                error_msg = chunk["error"]
-                                                error_detail = chunk.get(
-                                                    "errorDetail", {}
-                                                )
-                                                log(
-                                                    f"[{service_name}] ❌ 推送错误: {error_msg}\n"
-                                                )
-
-                                                # 检查是否是认证错误
-                                                is_auth_error = (
-                                                    "denied" in error_msg.lower()
-                                                    or "unauthorized"
-                                                    in error_msg.lower()
-                                                    or "401"
-                                                    in str(error_detail).lower()
-                                                    or "authentication required"
-                                                    in error_msg.lower()
-                                                )
-
-                                                if is_auth_error and not push_retried:
-                                                    # 尝试重新登录并重试
-                                                    log(
-                                                        f"[{service_name}] 🔄 检测到认证错误，尝试重新登录...\n"
-                                                    )
-                                                    if _retry_login_and_push(
-                                                        docker_builder,
-                                                        push_repository,
-                                                        push_tag,
-                                                        auth_config,
-                                                        username,
-                                                        password,
-                                                        registry_host,
-                                                        log,
-                                                    ):
-                                                        # 重新登录成功，重试推送
-                                                        log(
-                                                            f"[{service_name}] 🔄 重新登录成功，重试推送...\n"
-                                                        )
-                                                        push_retried = True
-                                                        push_stream = (
-                                                            docker_builder.push_image(
-                                                                push_repository,
-                                                                push_tag,
-                                                                auth_config=auth_config,
-                                                            )
-                                                        )
-                                                        for retry_chunk in push_stream:
-                                                            if isinstance(
-                                                                retry_chunk, dict
-                                                            ):
-                                                                if (
-                                                                    "status"
-                                                                    in retry_chunk
-                                                                ):
-                                                                    log(
-                                                                        f"[{service_name}] {retry_chunk['status']}\n"
-                                                                    )
-                                                                elif (
-                                                                    "error"
-                                                                    in retry_chunk
-                                                                ):
-                                                                    retry_error_msg = (
-                                                                        retry_chunk[
-                                                                            "error"
-                                                                        ]
-                                                                    )
-                                                                    log(
-                                                                        f"[{service_name}] ❌ 重试推送仍然失败: {retry_error_msg}\n"
-                                                                    )
-                                                                    raise RuntimeError(
-                                                                        f"服务 {service_name} 推送失败（已重试）: {retry_error_msg}"
-                                                                    )
-                                                        # 重试成功，跳出外层循环
-                                                        break
-                                                    else:
-                                                        raise RuntimeError(
-                                                            f"服务 {service_name} 推送失败: {error_msg}（重新登录失败）"
-                                                        )
-                                                else:
-                                                    raise RuntimeError(
-                                                        f"服务 {service_name} 推送失败: {error_msg}"
-                                                    )
-
-                                    log(f"✅ 服务 {service_name} 推送完成\n")
-
-                                except RuntimeError:
-                                    raise
-                                except Exception as e:
-                                    error_str = str(e)
-                                    # 检查是否是认证错误
-                                    is_auth_error = (
-                                        "denied" in error_str.lower()
-                                        or "unauthorized" in error_str.lower()
-                                        or "401" in error_str
-                                        or "authentication required"
-                                        in error_str.lower()
-                                    )
-
-                                    if is_auth_error and not push_retried:
-                                        log(
-                                            f"[{service_name}] 🔄 检测到认证错误，尝试重新登录...\n"
+                                    # 推送与后续服务的构建并行进行（网络 I/O），结果由推送线程记录
+                                    if push_executor is None:
+                                        push_executor = ThreadPoolExecutor(
+                                            max_workers=min(
+                                                _MAX_PUSH_WORKERS, len(selected_services)
+                                            ),
+                                            thread_name_prefix=f"push-{task_id[:8]}",
                                         )
-                                        if _retry_login_and_push(
-                                            docker_builder,
+                                    push_futures.append(
+                                        push_executor.submit(
+                                            push_service_image,
+                                            service_name,
                                             push_repository,
                                             push_tag,
-                                            auth_config,
-                                            username,
-                                            password,
-                                            registry_host,
-                                            log,
-                                        ):
-                                            # 重新登录成功，重试推送
-                                            log(
-                                                f"[{service_name}] 🔄 重新登录成功，重试推送...\n"
-                                            )
-                                            try:
-                                                push_stream = docker_builder.push_image(
-                                                    push_repository,
-                                                    push_tag,
-                                                    auth_config=auth_config,
-                                                )
-                                                for retry_chunk in push_stream:
-                                                    if isinstance(retry_chunk, dict):
-                                                        if "status" in retry_chunk:
-                                                            log(
-                                                                f"[{service_name}] {retry_chunk['status']}\n"
-                                                            )
-                                                        elif "error" in retry_chunk:
-                                                            retry_error_msg = (
-                                                                retry_chunk["error"]
-                                                            )
-                                                            log(
-                                                                f"[{service_name}] ❌ 重试推送仍然失败: {retry_error_msg}\n"
-                                                            )
-                                                            raise RuntimeError(
-                                                                f"服务 {service_name} 推送失败（已重试）: {retry_error_msg}"
-                                                            )
-                                                log(
-                                                    f"✅ 服务 {service_name} 推送完成（重试成功）\n"
-                                                )
-                                            except Exception as retry_error:
-                                                raise RuntimeError(
-                                                    f"服务 {service_name} 推送失败（已重试）: {str(retry_error)}"
-                                                )
-                                        else:
-                                            raise RuntimeError(
-                                                f"服务 {service_name} 推送失败: {error_str}（重新登录失败）"
-                                            )
-                                    else:
-                                        raise
-                            except Exception as e:
-                                log(f"❌ 服务 {service_name} 推送失败: {str(e)}\n")
-                                # 推送失败不影响构建成功
-                        else:
-                            log(f"⏭️  服务 {service_name} 跳过推送\n")
+                                            registry_config,
+                                            registry_logins[login_key],
+                                            repository_locks[push_repository],
+                                        )
+                                    )
+                                except Exception as e:
+                                    log(f"❌ 服务 {service_name} 推送失败: {str(e)}\n")
+                                    # 推送失败不影响构建成功
+                            else:
+                                log(f"⏭️  服务 {service_name} 跳过推送\n")
+                    finally:
+                        # 等待已提交的推送结束（构建中途失败时也等待，保证推送日志完整）
+                        if push_executor is not None:
+                            push_executor.shutdown(wait=True)
 
                 log(f"\n{'='*60}\n")
                 log(f"✅ 所有服务构建完成，共构建 {len(built_services)} 个服务\n")
                 log(f"📋 已构建的服务: {', '.join(built_services)}\n")
+                if push_futures:
+                    push_results = [future.result() for future in push_futures]
+                    failed_pushes = [
+                        f"{name}（{error}）" for name, ok, error in push_results if not ok
+                    ]
+                    log(
+                        f"📡 服务推送结果: 成功 {len(push_results) - len(failed_pushes)}/{len(push_results)}\n"
+                    )
+                    if failed_pushes:
+                        log(f"⚠️  推送失败的服务: {', '.join(failed_pushes)}\n")
                 if push_mode != "single":
                     # 多服务独立推送已在服务循环中处理，避免再次触发全局推送
                     service_level_push_completed = True
@@ -3704,12 +4655,12 @@ logs/
                 log(f"📂 构建上下文: {build_context}\n")
                 log(f"📄 Dockerfile 绝对路径: {dockerfile_path}\n")
 
-                log(f"🐳 准备调用 Docker 构建器...\n")
+                log("🐳 准备调用 Docker 构建器...\n")
                 try:
                     build_stream = docker_builder.build_image(
                         path=build_context, tag=full_tag, dockerfile=dockerfile_relative
                     )
-                    log(f"✅ Docker 构建流已启动\n")
+                    log("✅ Docker 构建流已启动\n")
                 except Exception as e:
                     log(f"❌ 启动 Docker 构建失败: {str(e)}\n")
                     import traceback
@@ -3717,388 +4668,60 @@ logs/
                     log(f"详细错误:\n{traceback.format_exc()}\n")
                     raise
 
-                log(f"🔍 开始处理 Docker 构建流输出...\n")
+                log("🔍 开始处理 Docker 构建流输出...\n")
                 chunk_count = 0
                 for chunk in build_stream:
                     chunk_count += 1
-                    if isinstance(chunk, dict):
-                        # 记录所有字段，确保不遗漏任何信息
-                        if "stream" in chunk:
-                            log(chunk["stream"])  # 编译日志在这里
-                        if "status" in chunk:
-                            log(f"📊 {chunk['status']}\n")
-                        if "progress" in chunk:
-                            log(f"⏳ {chunk['progress']}\n")
-                        if "error" in chunk:
-                            error_msg = chunk["error"]
-                            log(f"❌ 构建错误: {error_msg}\n")
-                            raise RuntimeError(error_msg)
-                        if "errorDetail" in chunk:
-                            error_detail = chunk["errorDetail"]
-                            log(f"💥 错误详情: {error_detail}\n")
-                        # 记录其他未知字段
-                        unknown_keys = set(chunk.keys()) - {
-                            "stream",
-                            "status",
-                            "progress",
-                            "error",
-                            "errorDetail",
-                            "aux",
-                            "id",
-                        }
-                        if unknown_keys:
-                            log(f"🔧 其他信息: {chunk}\n")
-                    else:
-                        log(f"📦 原始输出: {str(chunk)}\n")
+                    # 记录所有字段，确保不遗漏任何信息（编译日志在 stream 字段中）
+                    text, error_msg = _render_build_chunk(chunk)
+                    if text:
+                        log(text)
+                    if error_msg is not None:
+                        raise RuntimeError(error_msg)
+                    # 记录其他未知字段
+                    if not _KNOWN_BUILD_CHUNK_KEYS.issuperset(chunk):
+                        log(f"🔧 其他信息: {chunk}\n")
                 log(f"✅ Docker 构建流处理完成，共 {chunk_count} 个数据块\n")
 
                 log(f"✅ 镜像构建完成: {full_tag}\n")
 
             # 如果需要推送，直接使用构建好的镜像名推送，从激活的registry获取认证信息
             if should_push and not service_level_push_completed:
-                log(f"📡 开始推送镜像...\n")
-                log(f"🧭 推送路径: global\n")
-                # 直接使用构建时的镜像名和标签进行推送
-                # full_tag 格式: image_name:tag，可能包含registry路径
-                # 例如: registry.cn-shanghai.aliyuncs.com/51jbm/app2docker:dev
-                global_push_repository = image_name  # 直接使用构建时的镜像名
-                global_push_tag = tag
-                # 强一致：优先按构建时 full_tag 反解 repository/tag，避免变量漂移导致推送错镜像
-                last_colon = full_tag.rfind(":")
-                last_slash = full_tag.rfind("/")
-                if last_colon > last_slash:
-                    global_push_repository = full_tag[:last_colon]
-                    global_push_tag = full_tag[last_colon + 1 :]
-
-                # 根据镜像名找到对应的registry配置
-                def find_matching_registry_for_push(image_name):
-                    """根据镜像名找到匹配的registry配置"""
-                    # 如果镜像名包含斜杠，提取registry部分
-                    parts = image_name.split("/")
-                    if len(parts) >= 2 and "." in parts[0]:
-                        # 镜像名格式: registry.com/namespace/image
-                        image_registry = parts[0]
-                        log(f"🔍 从镜像名提取registry: {image_registry}\n")
-                        all_registries = get_all_registries(
-                            team_id=reg_team_id, user_id=reg_user_id
-                        )
-                        log(f"🔍 共有 {len(all_registries)} 个registry配置\n")
-                        for reg in all_registries:
-                            reg_address = reg.get("registry", "")
-                            reg_name = reg.get("name", "Unknown")
-                            reg_key = reg.get("registry_id") or reg_name
-                            log(f"🔍 检查registry: {reg_name}, 地址: {reg_address}\n")
-                            if reg_address and (
-                                image_registry == reg_address
-                                or image_registry.startswith(reg_address)
-                                or reg_address.startswith(image_registry)
-                            ):
-                                log(f"✅ 找到匹配的registry: {reg_name}\n")
-                                return get_registry_by_name(
-                                    reg_key,
-                                    team_id=reg_team_id,
-                                    user_id=reg_user_id,
-                                )
-                    return None
-
-                # 尝试根据镜像名找到匹配的registry
-                registry_config = find_matching_registry_for_push(global_push_repository)
-                if not registry_config:
-                    # 如果找不到匹配的，使用激活的registry
-                    registry_config = get_active_registry(
-                        team_id=reg_team_id, user_id=reg_user_id
-                    )
-                    log(
-                        f"⚠️  未找到匹配的registry配置，使用激活仓库: {registry_config.get('name', 'Unknown')}\n"
-                    )
-                else:
-                    log(
-                        f"🎯 找到匹配的registry配置: {registry_config.get('name', 'Unknown')}\n"
-                    )
-
+                log("📡 开始推送镜像...\n")
+                log("🧭 推送路径: global\n")
                 log(f"📦 推送镜像: {global_push_repository}:{global_push_tag}\n")
 
-                # 从registry配置中获取认证信息
-                username = registry_config.get("username")
-                password = registry_config.get("password")
-                registry_host = registry_config.get("registry", "")
-
-                log(
-                    f"🔐 Registry配置 - 地址: {registry_host}, 用户名: {username}, 密码: {'***' if password else '(未配置)'}\n"
-                )
-
-                auth_config = None
-                if username and password:
-                    # 构建auth_config，包含registry信息
-                    # docker-py的push API需要serveraddress字段来指定registry
-                    auth_config = {
-                        "username": username,
-                        "password": password,
-                    }
-                    # 对于非docker.io的registry，必须设置serveraddress
-                    # 注意：对于阿里云等registry，直接使用registry地址，不需要加协议
-                    if registry_host:
-                        if registry_host != "docker.io":
-                            # 对于阿里云等registry，直接使用registry地址
-                            auth_config["serveraddress"] = registry_host
-                        else:
-                            # docker.io使用标准地址
-                            auth_config["serveraddress"] = "https://index.docker.io/v1/"
-                    else:
-                        # 如果没有registry_host，默认使用docker.io
-                        auth_config["serveraddress"] = "https://index.docker.io/v1/"
-
-                    log(f"✅ 已配置认证信息\n")
-                    log(
-                        f"🔐 Auth配置: username={username}, serveraddress={auth_config.get('serveraddress', 'docker.io')}\n"
-                    )
-
-                    # 对于阿里云registry，添加特殊提示
-                    if registry_host and "aliyuncs.com" in registry_host:
-                        log(
-                            f"ℹ️  检测到阿里云registry，请确保使用独立的Registry登录密码\n"
-                        )
-
-                    # 推送前先登录到registry（重要：确保认证生效）
-                    try:
-                        if hasattr(docker_builder, "client") and docker_builder.client:
-                            # 对于阿里云等registry，需要确保使用正确的registry地址
-                            login_registry = (
-                                registry_host
-                                if registry_host and registry_host != "docker.io"
-                                else None
-                            )
-                            log(
-                                f"🔑 正在登录到registry: {login_registry or 'docker.io'}\n"
-                            )
-                            log(f"🔑 用户名: {username}\n")
-
-                            # 执行登录
-                            login_result = docker_builder.client.login(
-                                username=username,
-                                password=password,
-                                registry=login_registry,
-                            )
-                            log(f"✅ 登录成功: {login_result}\n")
-                        else:
-                            log(f"⚠️  Docker客户端不可用，跳过登录\n")
-                    except Exception as login_error:
-                        error_msg = str(login_error)
-                        log(f"❌ 登录失败: {error_msg}\n")
-
-                        # 检查是否是认证错误
-                        if (
-                            "401" in error_msg
-                            or "Unauthorized" in error_msg
-                            or "unauthorized" in error_msg
-                        ):
-                            log(f"⚠️  认证失败，可能的原因：\n")
-                            log(f"   1. 用户名或密码不正确\n")
-                            log(f"   2. 对于阿里云registry，请确认：\n")
-                            log(
-                                f"      - 用户名：使用阿里云账号或独立的镜像仓库用户名\n"
-                            )
-                            log(f"      - 密码：使用阿里云账号密码或镜像仓库独立密码\n")
-                            log(f"      - 如果使用访问令牌，请确认令牌未过期\n")
-                            log(f"   3. 请检查registry配置中的认证信息是否正确\n")
-                            log(
-                                f"⚠️  继续尝试推送（推送时会使用auth_config，但可能仍然失败）\n"
-                            )
-                        else:
-                            log(f"⚠️  继续尝试推送（推送时会使用auth_config）\n")
-                else:
-                    log(f"ℹ️  未配置认证信息，将使用匿名推送（适用于公开仓库）\n")
-
-                # 推送并处理错误（支持重试）
-                push_retried = False
+                # 推送并处理错误（认证错误重新登录、限流/临时错误退避重试）
                 try:
-                    # 直接推送构建好的镜像
-                    log(
-                        f"🚀 开始推送，repository: {global_push_repository}, tag: {global_push_tag}\n"
-                    )
-                    if auth_config:
-                        log(
-                            f"🔐 使用认证信息: username={auth_config.get('username')}, serveraddress={auth_config.get('serveraddress', 'docker.io')}\n"
-                        )
-                    else:
-                        log(f"⚠️  未使用认证信息\n")
-                    push_stream = docker_builder.push_image(
-                        global_push_repository, global_push_tag, auth_config=auth_config
-                    )
-                    for chunk in push_stream:
-                        if isinstance(chunk, dict):
-                            if "status" in chunk:
-                                log(chunk["status"] + "\n")
-                            elif "error" in chunk:
-                                error_detail = chunk.get("errorDetail", {})
-                                error_msg = chunk["error"]
-                                log(f"❌ 推送错误: {error_msg}\n")
-                                if error_detail:
-                                    log(f"❌ 错误详情: {error_detail}\n")
-
-                                # 检查是否是认证错误
-                                is_auth_error = (
-                                    "denied" in error_msg.lower()
-                                    or "unauthorized" in error_msg.lower()
-                                    or "401" in str(error_detail).lower()
-                                    or "authentication required" in error_msg.lower()
-                                )
-
-                                if is_auth_error and not push_retried:
-                                    # 尝试重新登录并重试
-                                    log(f"🔄 检测到认证错误，尝试重新登录...\n")
-                                    if _retry_login_and_push(
-                                        docker_builder,
-                                        global_push_repository,
-                                        global_push_tag,
-                                        auth_config,
-                                        username,
-                                        password,
-                                        registry_host,
-                                        log,
-                                    ):
-                                        # 重新登录成功，重试推送
-                                        log(f"🔄 重新登录成功，重试推送...\n")
-                                        push_retried = True
-                                        push_stream = docker_builder.push_image(
-                                            global_push_repository,
-                                            global_push_tag,
-                                            auth_config=auth_config,
-                                        )
-                                        for retry_chunk in push_stream:
-                                            if isinstance(retry_chunk, dict):
-                                                if "status" in retry_chunk:
-                                                    log(retry_chunk["status"] + "\n")
-                                                elif "error" in retry_chunk:
-                                                    retry_error_detail = (
-                                                        retry_chunk.get(
-                                                            "errorDetail", {}
-                                                        )
-                                                    )
-                                                    retry_error_msg = retry_chunk[
-                                                        "error"
-                                                    ]
-                                                    log(
-                                                        f"❌ 重试推送仍然失败: {retry_error_msg}\n"
-                                                    )
-                                                    if retry_error_detail:
-                                                        log(
-                                                            f"❌ 错误详情: {retry_error_detail}\n"
-                                                        )
-                                                    raise RuntimeError(
-                                                        f"推送失败（已重试）: {retry_error_msg}"
-                                                    )
-                                        # 重试成功，跳出外层循环
-                                        break
-                                    else:
-                                        raise RuntimeError(
-                                            f"推送失败: {error_msg}（重新登录失败）"
-                                        )
-                                else:
-                                    raise RuntimeError(chunk["error"])
-                        else:
-                            log(str(chunk))
-
-                    log(
-                        f"✅ 推送完成: {global_push_repository}:{global_push_tag}\n"
+                    retried = _push_to_registry(
+                        docker_builder,
+                        global_push_repository,
+                        global_push_tag,
+                        registry_config,
+                        log,
+                        login_future=global_push_login,
+                        stop_event=stop_event,
                     )
-                except RuntimeError:
-                    raise
                 except Exception as e:
-                    error_str = str(e)
-                    log(f"❌ 推送异常: {error_str}\n")
-
-                    # 检查是否是认证错误
-                    is_auth_error = (
-                        "denied" in error_str.lower()
-                        or "unauthorized" in error_str.lower()
-                        or "401" in error_str
-                        or "authentication required" in error_str.lower()
-                    )
-
-                    if is_auth_error:
-                        # 如果还没有重试过，尝试重新登录并重试
-                        if username and password and not push_retried:
-                            log(f"🔄 检测到认证错误，尝试重新登录...\n")
-                            if _retry_login_and_push(
-                                docker_builder,
-                                global_push_repository,
-                                global_push_tag,
-                                auth_config,
-                                username,
-                                password,
-                                registry_host,
-                                log,
-                            ):
-                                # 重新登录成功，重试推送
-                                log(f"🔄 重新登录成功，重试推送...\n")
-                                try:
-                                    push_stream = docker_builder.push_image(
-                                        global_push_repository,
-                                        global_push_tag,
-                                        auth_config=auth_config,
-                                    )
-                                    for retry_chunk in push_stream:
-                                        if isinstance(retry_chunk, dict):
-                                            if "status" in retry_chunk:
-                                                log(retry_chunk["status"] + "\n")
-                                            elif "error" in retry_chunk:
-                                                retry_error_msg = retry_chunk["error"]
-                                                log(
-                                                    f"❌ 重试推送仍然失败: {retry_error_msg}\n"
-                                                )
-                                                raise RuntimeError(
-                                                    f"推送失败（已重试）: {retry_error_msg}"
-                                                )
-                                    log(
-                                        f"✅ 推送完成（重试成功）: {global_push_repository}:{global_push_tag}\n"
-                                    )
-                                except Exception as retry_error:
-                                    raise RuntimeError(
-                                        f"推送失败（已重试）: {str(retry_error)}"
-                                    )
-                            else:
-                                # 重新登录失败，提供详细提示
-                                log(f"💡 推送认证失败，建议：\n")
-                                log(f"   1. 确认registry配置中的用户名和密码正确\n")
-                                log(
-                                    f"   2. 对于阿里云registry，请使用独立的Registry登录密码\n"
-                                )
-                                log(f"   3. 检查认证信息是否过期（如访问令牌）\n")
-                                log(f"   4. 可以尝试手动执行以下命令测试：\n")
-                                log(
-                                    f"      docker login --username={username} {registry_host or ''}\n"
-                                )
-                                log(f"      docker push {full_tag}\n")
-                                log(
-                                    f"   5. 如果手动命令成功，说明配置有问题；如果也失败，说明认证信息不正确\n"
-                                )
-                                raise RuntimeError(
-                                    f"推送失败: {error_str}（重新登录失败）"
-                                )
-                        else:
-                            # 已经重试过或没有认证信息，提供详细提示
-                            log(f"💡 推送认证失败，建议：\n")
-                            log(f"   1. 确认registry配置中的用户名和密码正确\n")
-                            log(
-                                f"   2. 对于阿里云registry，请使用独立的Registry登录密码\n"
-                            )
-                            log(f"   3. 检查认证信息是否过期（如访问令牌）\n")
-                            log(f"   4. 可以尝试手动执行以下命令测试：\n")
-                            log(
-                                f"      docker login --username={username or 'YOUR_USERNAME'} {registry_host or ''}\n"
-                            )
-                            log(f"      docker push {full_tag}\n")
-                            log(
-                                f"   5. 如果手动命令成功，说明配置有问题；如果也失败，说明认证信息不正确\n"
-                            )
-                            raise
+                    if _is_auth_error(str(e), getattr(e, "detail", None)):
+                        _log_push_auth_hint(
+                            log,
+                            registry_config.get("username"),
+                            registry_config.get("registry", ""),
+                            full_tag,
+                        )
+                    raise RuntimeError(f"推送失败: {e}") from e
+                log(
+                    f"✅ 推送完成{'（重试成功）' if retried else ''}: {global_push_repository}:{global_push_tag}\n"
+                )
             elif should_push and service_level_push_completed:
                 log(
-                    f"ℹ️  多服务模式已在服务级别完成推送，跳过全局推送\n"
+                    "ℹ️  多服务模式已在服务级别完成推送，跳过全局推送\n"
                 )
 
-            log(f"✅ 所有操作已完成\n")
+            log("✅ 所有操作已完成\n")
+            # 先确保日志全部落库，再更新任务状态
+            log_batcher.flush()
             # 更新任务状态为完成（确保状态更新）
             print(f"🔍 准备更新任务 {task_id[:8]} 状态为 completed")
             try:
@@ -4121,9 +4744,9 @@ logs/
                 traceback.print_exc()
             # 从任务字典中移除已完成的线程
             with self.lock:
-                if task_id in self.tasks:
-                    del self.tasks[task_id]
-                    print(f"✅ 任务 {task_id[:8]} 线程已清理")
+                removed = self.tasks.pop(task_id, None) is not None
+            if removed:
+                print(f"✅ 任务 {task_id[:8]} 线程已清理")
 
         except Exception as e:
             import traceback
@@ -4148,6 +4771,8 @@ logs/
                     print(f"📋 错误堆栈:\n{error_trace}")
 
             # 更新任务状态为失败
+            if log_batcher is not None:
+                log_batcher.flush()
             try:
                 self.task_manager.update_task_status(task_id, "failed", error=error_msg)
             except Exception as status_error:
@@ -4156,14 +4781,16 @@ logs/
 
             # 从任务字典中移除失败的线程
             with self.lock:
-                if task_id in self.tasks:
-                    del self.tasks[task_id]
-                    print(f"✅ 任务 {task_id[:8]} 线程已清理（异常失败）")
+                removed = self.tasks.pop(task_id, None) is not None
+            if removed:
+                print(f"✅ 任务 {task_id[:8]} 线程已清理（异常失败）")
 
             traceback.print_exc()
         finally:
+            if log_batcher is not None:
+                log_batcher.close()
+            self.task_manager.release_stop_event(task_id)
             # 清理构建上下文（可选，保留用于调试）
-            pass
             # if os.path.exists(build_context):
             #     try:
             #         shutil.rmtree(build_context, ignore_errors=True)
@@ -4179,28 +4806,46 @@ logs/
         log_func=None,
         git_ref_type: str = "branch",
         git_ref_name: str = None,
+        clone_depth: int = _GIT_CLONE_DEPTH,
+        dest_dir: str = None,
+        fast_transfer: bool = True,
     ):
-        """克隆 Git 仓库"""
+        """克隆 Git 仓库
+
+        默认浅克隆（--depth 1 --single-branch），构建只需要目标引用的工作区；
+        clone_depth 为 0/None 或 git_config["full_history"] 为真时完整克隆，
+        此时使用部分克隆（--filter=blob:none），历史文件内容按需获取。
+        分支为 40 位提交 SHA 时改用 init + fetch <sha> + checkout FETCH_HEAD 的方式检出。
+
+        dest_dir 指定仓库的克隆目录（默认 clone_dir/<从 URL 推导的仓库名>）。
+        fast_transfer 为 True 时使用协议 v2 并关闭对象 fsync（见 _GIT_TRANSFER_OPTIONS）。
+
+        Returns:
+            (success, error_msg, repo_dir)：成功时 repo_dir 为仓库所在的绝对路径
+        """
         try:
             git_config = git_config or {}
             log = log_func or (lambda x: None)
 
             # 准备 Git 命令
-            cmd = ["git", "clone"]
+            git = ["git", *_GIT_TRANSFER_OPTIONS] if fast_transfer else ["git"]
+            cmd = [*git, "clone"]
+            # 只传给本次 git 子进程的环境变量（不修改 os.environ，避免并发克隆互相覆盖）
+            env_overrides = {"GIT_PROTOCOL": "version=2"} if fast_transfer else {}
+
+            username = git_config.get("username")
+            password = git_config.get("password")
+            ssh_key_path = git_config.get("ssh_key_path")
 
             # 如果是 HTTPS URL 且有用户名密码，嵌入到 URL 中
-            if (
-                git_url.startswith("https://")
-                and git_config.get("username")
-                and git_config.get("password")
-            ):
+            if username and password and git_url.startswith("https://"):
                 # 将用户名密码嵌入 URL
                 from urllib.parse import urlparse, urlunparse, quote
 
                 parsed = urlparse(git_url)
                 # 对用户名和密码进行URL编码，避免特殊字符（如@）导致URL格式错误
-                encoded_username = quote(git_config['username'], safe="")
-                encoded_password = quote(git_config['password'], safe="")
+                encoded_username = quote(username, safe="")
+                encoded_password = quote(password, safe="")
                 auth_url = urlunparse(
                     (
                         parsed.scheme,
@@ -4214,42 +4859,65 @@ logs/
                 git_url = auth_url
                 log("🔐 使用配置的用户名密码进行认证\n")
 
-            # 如果是 SSH URL 且有 SSH key，配置 SSH
-            if git_url.startswith("git@") and git_config.get("ssh_key_path"):
-                ssh_key_path = git_config["ssh_key_path"]
+            # 如果是 SSH URL 且有 SSH key，配置 SSH（HTTPS 已嵌入认证时不再检查）
+            elif ssh_key_path and git_url.startswith("git@"):
                 if os.path.exists(ssh_key_path):
                     # 设置 GIT_SSH_COMMAND 使用指定的 SSH key
-                    os.environ["GIT_SSH_COMMAND"] = (
+                    env_overrides["GIT_SSH_COMMAND"] = (
                         f"ssh -i {ssh_key_path} -o StrictHostKeyChecking=no"
                     )
                     log(f"🔑 使用 SSH key: {ssh_key_path}\n")
 
             # 如果指定了分支，需要在 URL 之前添加 -b 参数
             # 调试日志
-            print(f"🔍 _clone_git_repo:")
-            print(f"   - branch参数: {repr(branch)}")
-            print(f"   - branch类型: {type(branch)}")
-            print(f"   - branch是否为真值: {bool(branch)}")
-            print(f"   - git_ref_type: {git_ref_type}")
-            print(f"   - git_ref_name: {git_ref_name}")
-
-            if branch and git_ref_type != "tag":
+            logger.debug(
+                "_clone_git_repo: branch=%r, git_ref_type=%s, git_ref_name=%s",
+                branch,
+                git_ref_type,
+                git_ref_name,
+            )
+
+            tag_ref = git_ref_name or branch
+            shallow = bool(clone_depth) and not git_config.get("full_history")
+            commit_sha = (
+                branch
+                if shallow
+                and branch
+                and git_ref_type != "tag"
+                and _COMMIT_SHA_RE.fullmatch(branch)
+                else None
+            )
+            if shallow and not commit_sha:
+                cmd.extend(["--depth", str(clone_depth), "--single-branch"])
+            elif not shallow:
+                # 完整历史只下载提交和树对象，文件内容在检出时按需拉取（服务端不支持时 git 会忽略）
+                cmd.append("--filter=blob:none")
+
+            if commit_sha:
+                log(f"📌 检出提交: {commit_sha}\n")
+            elif branch and git_ref_type != "tag":
                 cmd.extend(["-b", branch])
                 log(f"📌 检出分支: {branch}\n")
             elif git_ref_type == "tag":
-                log(f"📌 将在克隆后检出标签: {git_ref_name or branch}\n")
+                if shallow:
+                    # 浅克隆直接克隆标签，无需再拉取全部标签
+                    cmd.extend(["-b", tag_ref])
+                log(f"📌 将在克隆后检出标签: {tag_ref}\n")
             else:
-                log(f"📌 使用默认分支（未指定分支）\n")
+                log("📌 使用默认分支（未指定分支）\n")
 
-            # Git clone 会在目标目录下创建仓库目录
-            # 确定仓库名称（从 URL 提取）
-            repo_name = git_url.rstrip("/").split("/")[-1].replace(".git", "")
-            target_dir = os.path.join(clone_dir, repo_name)
+            # 调用方指定了克隆目录时直接使用，否则从 URL 提取仓库名称
+            if dest_dir:
+                target_dir = dest_dir
+            else:
+                repo_name = git_url.rstrip("/").split("/")[-1].replace(".git", "")
+                target_dir = os.path.join(clone_dir, repo_name)
 
             cmd.append(git_url)
             cmd.append(target_dir)
 
             # 执行克隆
+            git_env = {**os.environ, **env_overrides} if env_overrides else None
             # 确保父目录存在
             os.makedirs(os.path.dirname(target_dir), exist_ok=True)
             # 使用绝对路径，避免路径问题
@@ -4258,32 +4926,54 @@ logs/
             # 更新命令中的目标路径为绝对路径
             cmd[-1] = abs_target_dir
 
-            # 调试日志：打印完整命令
-            log(f"🔧 完整命令: {' '.join(cmd)}\n")
+            if commit_sha:
+                # 按提交 SHA 浅拉取：git clone 不支持直接检出任意提交
+                os.makedirs(abs_target_dir, exist_ok=True)
+                steps = [
+                    [*git, "init", "-q"],
+                    [*git, "remote", "add", "origin", git_url],
+                    [*git, "fetch", "--depth", str(clone_depth), "origin", commit_sha],
+                    [*git, "checkout", "-q", "--detach", "FETCH_HEAD"],
+                ]
+                for step in steps:
+                    result = subprocess.run(
+                        step,
+                        cwd=abs_target_dir,
+                        capture_output=True,
+                        text=True,
+                        env=git_env,
+                        timeout=300,
+                    )
+                    if result.returncode != 0:
+                        break
+            else:
+                # 调试日志：打印完整命令
+                log(f"🔧 完整命令: {' '.join(cmd)}\n")
 
-            result = subprocess.run(
-                cmd,
-                cwd=os.path.dirname(abs_clone_dir),
-                capture_output=True,
-                text=True,
-                timeout=300,  # 5分钟超时
-            )
+                result = subprocess.run(
+                    cmd,
+                    cwd=os.path.dirname(abs_clone_dir),
+                    capture_output=True,
+                    text=True,
+                    env=git_env,
+                    timeout=300,  # 5分钟超时
+                )
 
             if result.returncode != 0:
                 error_msg = result.stderr.strip() or result.stdout.strip() or "未知错误"
                 log(f"❌ Git 克隆失败: {error_msg}\n")
-                # 清理环境变量
-                if "GIT_SSH_COMMAND" in os.environ:
-                    del os.environ["GIT_SSH_COMMAND"]
-                return (False, error_msg)
+                return (False, error_msg, None)
 
-            if git_ref_type == "tag":
-                tag_ref = git_ref_name or branch
+            if git_ref_type == "tag" and shallow:
+                # 浅克隆时 clone -b <tag> 已处于该标签的分离 HEAD
+                log(f"✅ Git 标签检出成功: {tag_ref}\n")
+            elif git_ref_type == "tag":
                 fetch_result = subprocess.run(
-                    ["git", "fetch", "--tags", "--force"],
+                    [*git, "fetch", "--tags", "--force"],
                     cwd=abs_target_dir,
                     capture_output=True,
                     text=True,
+                    env=git_env,
                     timeout=300,
                 )
                 if fetch_result.returncode != 0:
@@ -4293,15 +4983,14 @@ logs/
                         or "获取标签失败"
                     )
                     log(f"❌ Git 标签获取失败: {error_msg}\n")
-                    if "GIT_SSH_COMMAND" in os.environ:
-                        del os.environ["GIT_SSH_COMMAND"]
-                    return (False, error_msg)
+                    return (False, error_msg, None)
 
                 checkout_result = subprocess.run(
-                    ["git", "checkout", "--detach", f"refs/tags/{tag_ref}"],
+                    [*git, "checkout", "--detach", f"refs/tags/{tag_ref}"],
                     cwd=abs_target_dir,
                     capture_output=True,
                     text=True,
+                    env=git_env,
                     timeout=300,
                 )
                 if checkout_result.returncode != 0:
@@ -4311,34 +5000,22 @@ logs/
                         or "检出标签失败"
                     )
                     log(f"❌ Git 标签检出失败: {error_msg}\n")
-                    if "GIT_SSH_COMMAND" in os.environ:
-                        del os.environ["GIT_SSH_COMMAND"]
-                    return (False, error_msg)
+                    return (False, error_msg, None)
                 log(f"✅ Git 标签检出成功: {tag_ref}\n")
 
-            log(f"✅ Git 仓库克隆成功\n")
+            log("✅ Git 仓库克隆成功\n")
             log(f"📂 仓库已克隆到: {abs_target_dir}\n")
 
-            # 清理环境变量
-            if "GIT_SSH_COMMAND" in os.environ:
-                del os.environ["GIT_SSH_COMMAND"]
-
-            return (True, None)
+            return (True, None, abs_target_dir)
 
         except subprocess.TimeoutExpired:
             error_msg = "Git 克隆超时（超过5分钟）"
             log(f"❌ {error_msg}\n")
-            # 清理环境变量
-            if "GIT_SSH_COMMAND" in os.environ:
-                del os.environ["GIT_SSH_COMMAND"]
-            return (False, error_msg)
+            return (False, error_msg, None)
         except Exception as e:
             error_msg = f"Git 克隆异常: {str(e)}"
             log(f"❌ {error_msg}\n")
-            # 清理环境变量
-            if "GIT_SSH_COMMAND" in os.environ:
-                del os.environ["GIT_SSH_COMMAND"]
-            return (False, error_msg)
+            return (False, error_msg, None)
 
 
 # ============ 队列处理函数 ============
@@ -4354,71 +5031,64 @@ def _process_global_queued_tasks():
         candidates = []
         db = get_db_session()
         try:
+            # 只查询调度所需的列，不加载完整的任务行（task_config 等大字段）
             pending_tasks = (
-                db.query(Task)
+                db.query(Task.task_id, Task.created_at, Task.team_id, Task.pipeline_id)
                 .filter(Task.status == "pending")
                 .filter(Task.task_type.in_(["build", "build_from_source", "deploy"]))
                 .order_by(Task.created_at.asc())
                 .all()
             )
             pending_exports = (
-                db.query(ExportTask)
+                db.query(ExportTask.task_id, ExportTask.created_at, ExportTask.team_id)
                 .filter(ExportTask.status == "pending")
                 .order_by(ExportTask.created_at.asc())
                 .all()
             )
             pending_migrations = (
-                db.query(MigrationTask)
+                db.query(
+                    MigrationTask.task_id,
+                    MigrationTask.updated_at,
+                    MigrationTask.team_id,
+                )
                 .filter(MigrationTask.status == "pending")
                 .order_by(MigrationTask.updated_at.asc())
                 .all()
             )
 
-            for task in pending_tasks:
+            for task_id, created_at, team_id, pipeline_id in pending_tasks:
                 candidates.append(
-                    (
-                        "task",
-                        task.task_id,
-                        task.created_at or datetime.max,
-                        task.team_id,
-                        task.pipeline_id,
-                    )
+                    ("task", task_id, created_at or datetime.max, team_id, pipeline_id)
                 )
-            for export in pending_exports:
+            for task_id, created_at, team_id in pending_exports:
                 candidates.append(
-                    (
-                        "export",
-                        export.task_id,
-                        export.created_at or datetime.max,
-                        export.team_id,
-                        None,
-                    )
+                    ("export", task_id, created_at or datetime.max, team_id, None)
                 )
-            for migration in pending_migrations:
+            for task_id, updated_at, team_id in pending_migrations:
                 candidates.append(
-                    (
-                        "migration",
-                        migration.task_id,
-                        migration.updated_at or datetime.max,
-                        migration.team_id,
-                        None,
-                    )
+                    ("migration", task_id, updated_at or datetime.max, team_id, None)
                 )
-            if candidates:
-                candidates.sort(key=lambda x: x[2])
+            # 按 (创建时间, 加入顺序) 建堆，依次弹出最早的候选：通常第一个候选即可启动，
+            # 不必对全部 pending 任务排序；加入顺序保证同一时间时与原先的稳定排序一致
+            candidates = [
+                (candidate[2], index, candidate)
+                for index, candidate in enumerate(candidates)
+            ]
+            heapq.heapify(candidates)
         finally:
             db.close()
 
         if not candidates:
             return
 
-        for (
-            candidate_kind,
-            candidate_id,
-            _,
-            candidate_team_id,
-            candidate_pipeline_id,
-        ) in candidates:
+        while candidates:
+            (
+                candidate_kind,
+                candidate_id,
+                _,
+                candidate_team_id,
+                candidate_pipeline_id,
+            ) = heapq.heappop(candidates)[2]
 
             def _starter():
                 nonlocal started
@@ -4556,38 +5226,54 @@ def build_task_config(
             )
         should_push = merged
 
-    config = {
-        "git_url": git_url,
-        "image_name": image_name,
-        "tag": tag,
-        "branch": branch,
-        "project_type": project_type,
-        "template": template or "",
-        "template_params": template_params or {},
-        "should_push": should_push,
-        "sub_path": sub_path,
-        "use_project_dockerfile": use_project_dockerfile,
-        "dockerfile_name": dockerfile_name,
-        "source_id": source_id,
-        "selected_services": selected_services or [],
-        "service_push_config": normalized_service_push_config,
-        "service_template_params": service_template_params or {},
-        "push_mode": push_mode,
-        "resource_package_ids": resource_package_ids or [],
-        "pipeline_id": pipeline_id,
-        "trigger_source": trigger_source,
-        "git_ref_type": git_ref_type or "branch",
-        "git_ref_name": git_ref_name or branch,
-    }
-
-    # 添加其他参数
-    config.update(kwargs)
-
-    # 移除None值（保留空列表和空字典）
-    return {k: v for k, v in config.items() if v is not None}
-
-
-def replace_tag_date_placeholders(tag: str) -> str:
+    fields = (
+        ("git_url", git_url),
+        ("image_name", image_name),
+        ("tag", tag),
+        ("branch", branch),
+        ("project_type", project_type),
+        ("template", template or ""),
+        ("template_params", template_params or {}),
+        ("should_push", should_push),
+        ("sub_path", sub_path),
+        ("use_project_dockerfile", use_project_dockerfile),
+        ("dockerfile_name", dockerfile_name),
+        ("source_id", source_id),
+        ("selected_services", selected_services or []),
+        ("service_push_config", normalized_service_push_config),
+        ("service_template_params", service_template_params or {}),
+        ("push_mode", push_mode),
+        ("resource_package_ids", resource_package_ids or []),
+        ("pipeline_id", pipeline_id),
+        ("trigger_source", trigger_source),
+        ("git_ref_type", git_ref_type or "branch"),
+        ("git_ref_name", git_ref_name or branch),
+    )
+
+    # 一次遍历生成配置，附加其他参数；值为 None 的项不写入（保留空列表和空字典）
+    config = {k: v for k, v in fields if v is not None}
+    config.update((k, v) for k, v in kwargs.items() if v is not None)
+    return config
+
+
+# 标签中的 ${DATE:FORMAT} 占位符，以及 FORMAT 中的日期记号到 strftime 指令的映射
+_DATE_FORMAT_PLACEHOLDER_RE = re.compile(r"\$\{DATE:([^}]+)\}")
+_DATE_FORMAT_TOKEN_RE = re.compile(r"YYYY|MM|DD|HH|mm|ss")
+_DATE_FORMAT_TOKENS = {
+    "YYYY": "%Y",
+    "MM": "%m",
+    "DD": "%d",
+    "HH": "%H",
+    "mm": "%M",
+    "ss": "%S",
+}
+
+
+def _date_format_token_to_strftime(match):
+    return _DATE_FORMAT_TOKENS[match.group(0)]
+
+
+def replace_tag_date_placeholders(tag: str, now: datetime = None) -> str:
     """
     替换标签中的动态日期占位符
 
@@ -4598,35 +5284,30 @@ def replace_tag_date_placeholders(tag: str) -> str:
 
     Args:
         tag: 原始标签字符串
+        now: 替换所用的时间（默认当前时间）；同一次配置生成中多次替换时传入同一时间
 
     Returns:
         替换后的标签字符串
     """
-    if not tag:
+    # 大多数标签不含占位符，一次子串检查即可返回
+    if not tag or "${" not in tag:
         return tag
 
-    now = datetime.now()
+    if now is None:
+        now = datetime.now()
 
     # 替换 ${DATE:FORMAT} 格式（自定义格式）
-    import re
-
-    date_format_pattern = r"\$\{DATE:([^}]+)\}"
-
     def replace_date_format(match):
-        format_str = match.group(1)
         try:
-            # 将 YYYY-MM-DD 格式转换为 Python 的 strftime 格式
-            format_str = (
-                format_str.replace("YYYY", "%Y").replace("MM", "%m").replace("DD", "%d")
-            )
-            format_str = (
-                format_str.replace("HH", "%H").replace("mm", "%M").replace("ss", "%S")
+            # 将 YYYY-MM-DD 格式转换为 Python 的 strftime 格式（一次扫描替换所有记号）
+            format_str = _DATE_FORMAT_TOKEN_RE.sub(
+                _date_format_token_to_strftime, match.group(1)
             )
             return now.strftime(format_str)
         except:
             return match.group(0)  # 如果格式错误，返回原字符串
 
-    tag = re.sub(date_format_pattern, replace_date_format, tag)
+    tag = _DATE_FORMAT_PLACEHOLDER_RE.sub(replace_date_format, tag)
 
     # 替换 ${DATE} -> YYYYMMDD
     tag = tag.replace("${DATE}", now.strftime("%Y%m%d"))
@@ -4680,16 +5361,20 @@ def pipeline_to_task_config(
     final_tag = tag if tag is not None else pipeline_original_tag
 
     # 调试日志
-    print(f"🔍 pipeline_to_task_config:")
-    print(f"   - 传入branch参数: {branch}")
-    print(f"   - 流水线配置branch: {pipeline.get('branch')}")
-    print(f"   - 最终使用branch: {final_branch}")
-    print(f"   - 传入tag参数: {tag}")
-    print(f"   - 流水线原始tag: {pipeline_original_tag}")
-    print(f"   - 初始final_tag: {final_tag}")
+    logger.debug(
+        "pipeline_to_task_config: branch=%s, pipeline_branch=%s, final_branch=%s, "
+        "tag=%s, pipeline_tag=%s, final_tag=%s",
+        branch,
+        pipeline.get("branch"),
+        final_branch,
+        tag,
+        pipeline_original_tag,
+        final_tag,
+    )
 
-    # 替换标签中的动态日期占位符
-    final_tag = replace_tag_date_placeholders(final_tag)
+    # 替换标签中的动态日期占位符（本次配置中的所有替换使用同一时间）
+    now = datetime.now()
+    final_tag = replace_tag_date_placeholders(final_tag, now)
 
     # 处理分支标签映射（webhook和manual触发时都应用）
     # 注意：即使传入了tag参数，我们仍然需要检查分支标签映射，确保多服务模式下的标签正确更新
@@ -4701,11 +5386,13 @@ def pipeline_to_task_config(
             if (trigger_source == "webhook" and webhook_branch)
             else final_branch
         )
-        print(f"🔍 分支标签映射处理:")
-        print(f"   - trigger_source: {trigger_source}")
-        print(f"   - branch_for_mapping: {branch_for_mapping}")
-        print(f"   - mapping: {mapping}")
-        print(f"   - 当前final_tag: {final_tag}")
+        logger.debug(
+            "分支标签映射处理: trigger_source=%s, branch_for_mapping=%s, mapping=%s, final_tag=%s",
+            trigger_source,
+            branch_for_mapping,
+            mapping,
+            final_tag,
+        )
         if branch_for_mapping and mapping:
             mapped_tag_value = get_branch_mapping_value(branch_for_mapping, mapping)
 
@@ -4730,22 +5417,24 @@ def pipeline_to_task_config(
                 # 这样可以支持多个标签的场景（如test分支映射到dev,test两个标签）
                 if tag and tag in tag_list:
                     final_tag = tag
-                    print(f"   - 使用传入的tag参数: {tag} (在映射值中)")
+                    logger.debug("使用传入的tag参数: %s (在映射值中)", tag)
                 elif tag_list:
                     # 否则使用映射值的第一个标签
                     final_tag = tag_list[0]
-                    print(f"   - 使用映射值的第一个标签: {tag_list[0]}")
+                    logger.debug("使用映射值的第一个标签: %s", final_tag)
                 else:
                     # 映射值为空，保持当前final_tag
                     pass
 
             # 替换映射标签中的动态日期占位符
-            final_tag = replace_tag_date_placeholders(final_tag)
-            print(f"   - 映射后的final_tag: {final_tag}")
+            final_tag = replace_tag_date_placeholders(final_tag, now)
+            logger.debug("映射后的final_tag: %s", final_tag)
 
     # 调试日志：确认传递给 build_task_config 的分支
-    print(f"🔍 pipeline_to_task_config 准备调用 build_task_config:")
-    print(f"   - final_branch: {repr(final_branch)}")
+    logger.debug(
+        "pipeline_to_task_config 准备调用 build_task_config: final_branch=%r",
+        final_branch,
+    )
 
     # 根据 push_mode 和 service_push_config 确定 should_push
     push_mode = pipeline.get("push_mode", "multi")
@@ -4759,47 +5448,43 @@ def pipeline_to_task_config(
         if final_tag != pipeline_original_tag:
             # 标签已被映射更新，需要同步到多服务配置中
             if selected_services and service_push_config:
-                # 深拷贝 service_push_config，避免修改原始 pipeline 数据
-                import copy
-
-                service_push_config = copy.deepcopy(service_push_config)
-
+                # 写时复制：只复制外层字典和需要修改的服务配置，避免修改原始 pipeline 数据；
+                # 未变化的服务配置直接共享，不做深拷贝
+                updated_config = None
                 # 更新每个服务的 tag（强制使用映射后的标签，因为这是分支标签映射的结果）
                 # 注意：即使服务配置中已经有tag，也要更新为映射后的标签，因为这是分支标签映射的要求
                 for service_name in selected_services:
-                    if service_name in service_push_config:
-                        service_config = service_push_config[service_name]
-                        if isinstance(service_config, dict):
-                            # 深拷贝服务配置，避免修改原始对象
-                            service_config = service_config.copy()
-                            # 强制更新为映射后的标签（分支标签映射的优先级最高）
-                            service_config["tag"] = final_tag
-                            service_push_config[service_name] = service_config
-                            print(
-                                f"   - 更新服务 {service_name} 的标签为: {final_tag} (分支标签映射)"
-                            )
-                        else:
-                            # 兼容旧格式：只有 push 布尔值，转换为新格式
-                            service_push_config[service_name] = {
-                                "enabled": True,
-                                "push": bool(service_config),
-                                "imageName": "",
-                                "tag": final_tag,
-                            }
-                            print(
-                                f"   - 为服务 {service_name} 转换并设置标签为: {final_tag} (分支标签映射)"
-                            )
+                    service_config = service_push_config.get(service_name)
+                    if isinstance(service_config, dict):
+                        if service_config.get("tag") == final_tag:
+                            continue
+                        # 强制更新为映射后的标签（分支标签映射的优先级最高）
+                        new_service_config = {**service_config, "tag": final_tag}
+                        message = f"   - 更新服务 {service_name} 的标签为: {final_tag} (分支标签映射)"
+                    elif service_name in service_push_config:
+                        # 兼容旧格式：只有 push 布尔值，转换为新格式
+                        new_service_config = {
+                            "enabled": True,
+                            "push": bool(service_config),
+                            "imageName": "",
+                            "tag": final_tag,
+                        }
+                        message = f"   - 为服务 {service_name} 转换并设置标签为: {final_tag} (分支标签映射)"
                     else:
                         # 如果服务没有配置，创建一个默认配置并使用映射后的标签
-                        service_push_config[service_name] = {
+                        new_service_config = {
                             "enabled": True,
                             "push": False,
                             "imageName": "",
                             "tag": final_tag,
                         }
-                        print(
-                            f"   - 为服务 {service_name} 创建配置，标签为: {final_tag} (分支标签映射)"
-                        )
+                        message = f"   - 为服务 {service_name} 创建配置，标签为: {final_tag} (分支标签映射)"
+                    if updated_config is None:
+                        updated_config = dict(service_push_config)
+                    updated_config[service_name] = new_service_config
+                    print(message)
+                if updated_config is not None:
+                    service_push_config = updated_config
 
     should_push = False
     if push_mode == "single":
@@ -4819,11 +5504,13 @@ def pipeline_to_task_config(
             service_push_config or {},
         )
 
-    print(f"🔍 should_push 计算:")
-    print(f"   - push_mode: {push_mode}")
-    print(f"   - selected_services: {selected_services}")
-    print(f"   - service_push_config: {service_push_config}")
-    print(f"   - should_push: {should_push}")
+    logger.debug(
+        "should_push 计算: push_mode=%s, selected_services=%s, service_push_config=%s, should_push=%s",
+        push_mode,
+        selected_services,
+        service_push_config,
+        should_push,
+    )
 
     task_config_result = build_task_config(
         git_url=pipeline.get("git_url"),
@@ -4851,8 +5538,9 @@ def pipeline_to_task_config(
     )
 
     # 调试日志：确认返回的任务配置中的分支
-    print(f"🔍 build_task_config 返回的配置:")
-    print(f"   - branch字段: {repr(task_config_result.get('branch'))}")
+    logger.debug(
+        "build_task_config 返回的配置: branch=%r", task_config_result.get("branch")
+    )
 
     return task_config_result
 
@@ -4900,6 +5588,7 @@ class BuildTaskManager:
         except:
             pass
         self.lock = threading.Lock()
+        self._stop_events = {}  # task_id -> threading.Event，运行中的构建用来感知停止
         self.tasks_dir = os.path.join(BUILD_DIR, "tasks")
         os.makedirs(self.tasks_dir, exist_ok=True)
 
@@ -5430,6 +6119,19 @@ class BuildTaskManager:
         finally:
             db.close()
 
+    def stop_event(self, task_id: str) -> threading.Event:
+        """获取任务的停止事件，stop_task 成功后会被设置"""
+        with self.lock:
+            event = self._stop_events.get(task_id)
+            if event is None:
+                event = self._stop_events[task_id] = threading.Event()
+            return event
+
+    def release_stop_event(self, task_id: str):
+        """任务线程结束后释放停止事件"""
+        with self.lock:
+            self._stop_events.pop(task_id, None)
+
     def stop_task(self, task_id: str) -> bool:
         """停止任务"""
         from backend.database import get_db_session
@@ -5461,6 +6163,11 @@ class BuildTaskManager:
 
             db.commit()
             print(f"✅ 任务 {task_id[:8]} 已停止")
+            # 通知正在运行的构建线程（仅对已注册事件的任务生效）
+            with self.lock:
+                event = self._stop_events.get(task_id)
+            if event is not None:
+                event.set()
 
             # 仅当停止的是运行中任务时，释放全局并发槽位并触发后续调度
             if old_status == "running":
@@ -5959,7 +6666,7 @@ class BuildTaskManager:
                     deploy_config.tag = tag
 
                 # 更新webhook配置
-                print(f"🔍 接收到的webhook配置参数:")
+                print("🔍 接收到的webhook配置参数:")
                 print(
                     f"  - webhook_token: {webhook_token if webhook_token is None else (webhook_token[:8] + '...' if webhook_token else '(空字符串)')}"
                 )
@@ -5978,7 +6685,7 @@ class BuildTaskManager:
                     deploy_config.webhook_token = webhook_token
                     print(f"✅ 更新webhook_token: {webhook_token[:8]}...")
                 else:
-                    print(f"⚠️ webhook_token为None，不更新")
+                    print("⚠️ webhook_token为None，不更新")
 
                 # 如果提供了webhook_secret（包括空字符串），则更新
                 if webhook_secret is not None:
@@ -5987,14 +6694,14 @@ class BuildTaskManager:
                         f"✅ 更新webhook_secret: {'已设置' if webhook_secret else '已清空'}"
                     )
                 else:
-                    print(f"⚠️ webhook_secret为None，不更新")
+                    print("⚠️ webhook_secret为None，不更新")
 
                 # 如果提供了webhook_branch_strategy，则更新
                 if webhook_branch_strategy is not None:
                     deploy_config.webhook_branch_strategy = webhook_branch_strategy
                     print(f"✅ 更新webhook_branch_strategy: {webhook_branch_strategy}")
                 else:
-                    print(f"⚠️ webhook_branch_strategy为None，不更新")
+                    print("⚠️ webhook_branch_strategy为None，不更新")
 
                 # 如果提供了webhook_allowed_branches，则更新（包括空列表）
                 if webhook_allowed_branches is not None:
@@ -6003,7 +6710,7 @@ class BuildTaskManager:
                         f"✅ 更新webhook_allowed_branches: {webhook_allowed_branches}"
                     )
                 else:
-                    print(f"⚠️ webhook_allowed_branches为None，不更新")
+                    print("⚠️ webhook_allowed_branches为None，不更新")
 
                 # 更新更新时间
                 deploy_config.updated_at = datetime.now()
@@ -6168,7 +6875,7 @@ class BuildTaskManager:
                         if attempt == 0:
                             print(
                                 f"⏳ 等待部署任务记录可见: task_id={task_id[:8]}... "
-                                f"(SQLite 跨线程提交延迟，将短暂重试)"
+                                "(SQLite 跨线程提交延迟，将短暂重试)"
                             )
                     else:
                         # 如果任务有 deploy_config_id，从 DeployConfig 表获取配置
@@ -6900,7 +7607,6 @@ class ExportTaskManager:
 
             # 获取认证信息
             from backend.config import (
-                get_all_registries,
                 get_active_registry,
                 get_registry_by_name,
             )
@@ -6924,29 +7630,9 @@ class ExportTaskManager:
 
             if not registry_config:
                 # 尝试智能匹配仓库
-                def find_matching_registry_for_export(image_name):
-                    parts = image_name.split("/")
-                    if len(parts) >= 2 and "." in parts[0]:
-                        image_registry = parts[0]
-                        all_registries = get_all_registries(
-                            team_id=export_team_id, user_id=export_user_id
-                        )
-                        for reg in all_registries:
-                            reg_address = reg.get("registry", "")
-                            if reg_address and (
-                                image_registry == reg_address
-                                or image_registry.startswith(reg_address)
-                                or reg_address.startswith(image_registry)
-                            ):
-                                reg_key = reg.get("registry_id") or reg.get("name")
-                                return get_registry_by_name(
-                                    reg_key,
-                                    team_id=export_team_id,
-                                    user_id=export_user_id,
-                                )
-                    return None
-
-                registry_config = find_matching_registry_for_export(image)
+                registry_config = _RegistryMatcher(export_team_id, export_user_id).match(
+                    image
+                )
             if not registry_config:
                 registry_config = get_active_registry(
                     team_id=export_team_id, user_id=export_user_id
@@ -7033,7 +7719,7 @@ class ExportTaskManager:
             # 导出镜像
             image_stream = docker_builder.export_image(full_tag)
             chunk_count = 0
-            with open(tar_path, "wb") as f:
+            with open(tar_path, "wb", buffering=_EXPORT_WRITE_BUFFER_SIZE) as f:
                 for chunk in image_stream:
                     chunk_count += 1
                     # 减少停止标志检查频率（每 100 个 chunk 检查一次，避免频繁查询数据库）
@@ -7066,7 +7752,7 @@ class ExportTaskManager:
             if compress.lower() in ("gzip", "gz", "tgz", "1", "true", "yes"):
                 final_path = f"{tar_path}.gz"
                 with open(tar_path, "rb") as src, gzip.open(final_path, "wb") as dst:
-                    shutil.copyfileobj(src, dst)
+                    shutil.copyfileobj(src, dst, _EXPORT_WRITE_BUFFER_SIZE)
                 os.remove(tar_path)
                 file_size = os.path.getsize(final_path)
 
@@ -3,16 +3,65 @@
 资源包管理模块（基于数据库）
 用于管理不能公开的配置信息，在构建时一同打包到镜像中
 """
+import errno
 import os
 import shutil
+import sys
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional
 from backend.database import get_db_session, init_db
 from backend.models import ResourcePackage
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # 资源包存储目录
 RESOURCE_PACKAGE_DIR = "data/resource_packages"
+# 并行复制资源包到构建上下文的最大线程数
+_MAX_COPY_WORKERS = 8
+# Linux FICLONE ioctl（_IOW(0x94, 9, int)），其他平台不可用
+_FICLONE = 0x40049409 if fcntl is not None and sys.platform.startswith("linux") else None
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """尝试用 FICLONE 创建写时复制副本（btrfs/xfs 等），不支持时返回 False"""
+    if _FICLONE is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _link_or_copy(src: str, dst: str) -> str:
+    """把资源包文件放入构建上下文：优先硬链接（零拷贝），无法链接时回退到复制
+
+    资源包上传后内容不再修改，构建上下文中的文件只会被读取和删除，
+    因此可以与资源包目录共享 inode。目标已存在时先删除，
+    避免 copy2 写穿另一个资源包的硬链接。
+    同一文件系统上硬链接失败（如链接数达到上限）时先尝试 reflink；
+    reflink 同样不能跨文件系统，跨文件系统（EXDEV）时直接 copy2（Linux 上内部走 sendfile）。
+    """
+    if os.path.lexists(dst) and not os.path.isdir(dst):
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno == errno.EXDEV or not _reflink(src, dst):
+            shutil.copy2(src, dst)
+    return dst
+
 
 # 确保数据库已初始化
 try:
@@ -210,89 +259,137 @@ class ResourcePackageManager:
         package_configs: List[Dict],
         build_context: str
     ) -> List[str]:
-        """将资源包复制到构建上下文"""
+        """将资源包复制到构建上下文（目标目录互不重叠时并行复制）"""
         if not package_configs:
             return []
         
+        # 一次查询取出所有资源包，数据库会话只在当前线程使用
+        package_ids = [config.get('package_id') for config in package_configs if config.get('package_id')]
+        if not package_ids:
+            return []
         db = get_db_session()
         try:
-            copied_packages = []
+            packages = {
+                package.package_id: (package.filename, package.extracted)
+                for package in db.query(ResourcePackage)
+                .filter(ResourcePackage.package_id.in_(package_ids))
+                .all()
+            }
+        finally:
+            db.close()
+        
+        jobs = []
+        for config in package_configs:
+            package_id = config.get('package_id')
+            target_path_rel = config.get('target_path') or config.get('target_dir', 'resources')
             
-            for config in package_configs:
-                package_id = config.get('package_id')
-                target_path_rel = config.get('target_path') or config.get('target_dir', 'resources')
-                
-                if not package_id:
-                    continue
-                
-                package = db.query(ResourcePackage).filter(ResourcePackage.package_id == package_id).first()
-                if not package:
-                    print(f"⚠️ 资源包不存在: {package_id}")
-                    continue
-                
-                package_dir = os.path.join(RESOURCE_PACKAGE_DIR, package_id)
-                if not os.path.exists(package_dir):
-                    print(f"⚠️ 资源包目录不存在: {package_dir}")
-                    continue
-                
-                try:
-                    target_path_rel = target_path_rel.replace('\\', '/')
-                    path_parts = target_path_rel.split('/')
-                    last_part = path_parts[-1]
-                    has_extension = '.' in last_part and not last_part.startswith('.')
-                    
-                    if len(path_parts) == 1 and has_extension:
-                        target_dir_rel = '.'
-                        target_filename = last_part
-                    elif len(path_parts) > 1 and has_extension:
-                        target_dir_rel = '/'.join(path_parts[:-1])
-                        target_filename = last_part
-                    else:
-                        target_dir_rel = target_path_rel
-                        target_filename = None
-                    
-                    if target_dir_rel == '.':
-                        target_dir_abs = build_context
-                    else:
-                        target_dir_abs = os.path.join(build_context, target_dir_rel)
-                    os.makedirs(target_dir_abs, exist_ok=True)
-                    
-                    if package.extracted:
-                        extracted_path = os.path.join(package_dir, "extracted")
-                        if os.path.exists(extracted_path):
-                            for item in os.listdir(extracted_path):
-                                src = os.path.join(extracted_path, item)
-                                if target_filename and os.path.isfile(src):
-                                    dst = os.path.join(target_dir_abs, target_filename)
-                                    shutil.copy2(src, dst)
-                                    break
-                                else:
-                                    dst = os.path.join(target_dir_abs, item)
-                                    if os.path.isdir(src):
-                                        shutil.copytree(src, dst, dirs_exist_ok=True)
-                                    else:
-                                        shutil.copy2(src, dst)
+            if not package_id:
+                continue
+            
+            if package_id not in packages:
+                print(f"⚠️ 资源包不存在: {package_id}")
+                continue
+            
+            package_dir = os.path.join(RESOURCE_PACKAGE_DIR, package_id)
+            if not os.path.exists(package_dir):
+                print(f"⚠️ 资源包目录不存在: {package_dir}")
+                continue
+            
+            filename, extracted = packages[package_id]
+            jobs.append((package_id, filename, extracted, package_dir, target_path_rel))
+        
+        # 目标目录互不相同且没有嵌套时才并行，否则保持串行以保证覆盖顺序
+        target_dirs = sorted(
+            os.path.join(os.path.normpath(self._split_target_path(job[4])[0]), '')
+            for job in jobs
+        )
+        # 构建根目录（.）包含所有其他目录
+        overlapping = os.path.join('.', '') in target_dirs or any(
+            later.startswith(earlier)
+            for earlier, later in zip(target_dirs, target_dirs[1:])
+        )
+        
+        def copy_job(job):
+            return self._copy_package_to_build_context(*job, build_context=build_context)
+        
+        if len(jobs) > 1 and not overlapping:
+            workers = min(len(jobs), os.cpu_count() or 1, _MAX_COPY_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(copy_job, jobs))
+        else:
+            results = [copy_job(job) for job in jobs]
+        
+        return [package_id for package_id in results if package_id]
+    
+    @staticmethod
+    def _split_target_path(target_path_rel: str):
+        """将目标路径拆分为 (目标目录, 目标文件名)，路径末段带扩展名时视为文件名"""
+        target_path_rel = target_path_rel.replace('\\', '/')
+        path_parts = target_path_rel.split('/')
+        last_part = path_parts[-1]
+        has_extension = '.' in last_part and not last_part.startswith('.')
+        
+        if len(path_parts) == 1 and has_extension:
+            return '.', last_part
+        if len(path_parts) > 1 and has_extension:
+            return '/'.join(path_parts[:-1]), last_part
+        return target_path_rel, None
+    
+    def _copy_package_to_build_context(
+        self,
+        package_id: str,
+        filename: str,
+        extracted: bool,
+        package_dir: str,
+        target_path_rel: str,
+        build_context: str,
+    ) -> Optional[str]:
+        """复制单个资源包，成功返回 package_id，失败返回 None"""
+        try:
+            target_dir_rel, target_filename = self._split_target_path(target_path_rel)
+            
+            if target_dir_rel == '.':
+                target_dir_abs = build_context
+            else:
+                target_dir_abs = os.path.join(build_context, target_dir_rel)
+            os.makedirs(target_dir_abs, exist_ok=True)
+            
+            dst_filename = None
+            if extracted:
+                extracted_path = os.path.join(package_dir, "extracted")
+                if os.path.exists(extracted_path):
+                    for item in os.listdir(extracted_path):
+                        src = os.path.join(extracted_path, item)
+                        if target_filename and os.path.isfile(src):
+                            dst = os.path.join(target_dir_abs, target_filename)
+                            _link_or_copy(src, dst)
+                            break
                         else:
-                            original_file = os.path.join(package_dir, package.filename)
-                            if os.path.exists(original_file):
-                                dst_filename = target_filename or package.filename
-                                shutil.copy2(original_file, os.path.join(target_dir_abs, dst_filename))
-                    else:
-                        original_file = os.path.join(package_dir, package.filename)
-                        if os.path.exists(original_file):
-                            dst_filename = target_filename or package.filename
-                            shutil.copy2(original_file, os.path.join(target_dir_abs, dst_filename))
-                    
-                    copied_packages.append(package_id)
-                    final_path = os.path.join(target_dir_rel, dst_filename or package.filename).replace('\\', '/')
-                    if final_path.startswith('./'):
-                        final_path = final_path[2:]
-                    print(f"✅ 资源包已复制到构建上下文: {package_id} ({package.filename}) -> {final_path}")
-                except Exception as e:
-                    print(f"❌ 复制资源包失败 {package_id}: {e}")
-                    import traceback
-                    traceback.print_exc()
+                            dst = os.path.join(target_dir_abs, item)
+                            if os.path.isdir(src):
+                                shutil.copytree(
+                                    src, dst, copy_function=_link_or_copy, dirs_exist_ok=True
+                                )
+                            else:
+                                _link_or_copy(src, dst)
+                else:
+                    original_file = os.path.join(package_dir, filename)
+                    if os.path.exists(original_file):
+                        dst_filename = target_filename or filename
+                        _link_or_copy(original_file, os.path.join(target_dir_abs, dst_filename))
+            else:
+                original_file = os.path.join(package_dir, filename)
+                if os.path.exists(original_file):
+                    dst_filename = target_filename or filename
+                    _link_or_copy(original_file, os.path.join(target_dir_abs, dst_filename))
             
-            return copied_packages
-        finally:
-            db.close()
+            final_path = os.path.join(target_dir_rel, dst_filename or filename).replace('\\', '/')
+            if final_path.startswith('./'):
+                final_path = final_path[2:]
+            print(f"✅ 资源包已复制到构建上下文: {package_id} ({filename}) -> {final_path}")
+            return package_id
+        except Exception as e:
+            print(f"❌ 复制资源包失败 {package_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
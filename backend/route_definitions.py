@@ -37,6 +37,9 @@ from backend.handlers import (
     USER_TEMPLATES_DIR,
     EXPORT_DIR,
     BUILD_DIR,
+    UPLOAD_DIR,
+    UPLOAD_COPY_BUFFER_SIZE,
+    preallocate_file,
     natural_sort_key,
     docker_builder,
     DOCKER_AVAILABLE,
@@ -2801,9 +2804,6 @@ async def upload_file(
         if not app_file or not app_file.filename:
             raise HTTPException(status_code=400, detail="未上传文件")
 
-        # 读取文件内容
-        file_data = await app_file.read()
-
         # 解析模板参数
         params_dict = {}
         if template_params:
@@ -2833,24 +2833,51 @@ async def upload_file(
                 [f"{imagename}:{tag or 'latest'}"], scoped_team_id, username
             )
 
+        # 将上传文件流式写入临时文件，避免整个文件驻留内存
+        def save_upload() -> str:
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=UPLOAD_DIR, suffix=".upload", delete=False
+            ) as tmp_file:
+                try:
+                    # 已知大小时预分配磁盘空间，写完按实际长度截断
+                    preallocate_file(tmp_file, getattr(app_file, "size", None))
+                    shutil.copyfileobj(
+                        app_file.file, tmp_file, UPLOAD_COPY_BUFFER_SIZE
+                    )
+                    tmp_file.truncate()
+                except BaseException:
+                    # 磁盘写满、客户端断开等情况下删除已预分配的临时文件，避免残留
+                    os.unlink(tmp_file.name)
+                    raise
+                return tmp_file.name
+
+        # 复制和预分配都是阻塞 IO，放到线程中执行，避免阻塞事件循环
+        upload_path = await asyncio.to_thread(save_upload)
+
         # 调用构建管理器
         manager = BuildManager()
-        task_id = manager.start_build(
-            file_data=file_data,
-            image_name=imagename,
-            tag=tag,
-            should_push=(push == "on"),
-            selected_template=template,
-            original_filename=app_file.filename,
-            project_type=project_type,
-            template_params=params_dict,  # 传递模板参数
-            push_registry=None,  # 已废弃，统一使用激活的registry
-            extract_archive=(extract_archive == "on"),  # 传递解压选项
-            build_steps=build_steps_dict,  # 传递构建步骤信息
-            resource_package_ids=resource_package_configs_list,  # 传递资源包配置
-            team_id=scoped_team_id,
-            created_by=user_id,
-        )
+        try:
+            task_id = manager.start_build(
+                file_path=upload_path,
+                image_name=imagename,
+                tag=tag,
+                should_push=(push == "on"),
+                selected_template=template,
+                original_filename=app_file.filename,
+                project_type=project_type,
+                template_params=params_dict,  # 传递模板参数
+                push_registry=None,  # 已废弃，统一使用激活的registry
+                extract_archive=(extract_archive == "on"),  # 传递解压选项
+                build_steps=build_steps_dict,  # 传递构建步骤信息
+                resource_package_ids=resource_package_configs_list,  # 传递资源包配置
+                team_id=scoped_team_id,
+                created_by=user_id,
+            )
+        finally:
+            # 成功时文件已被移入 staging 目录，这里只清理残留的临时文件
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
 
         # 记录操作日志
         OperationLogger.log(
@@ -3210,7 +3237,7 @@ async def parse_dockerfile_services_api(
                 clone_dir = os.path.join(temp_dir, "repo")
                 os.makedirs(clone_dir, exist_ok=True)
 
-                clone_success, clone_error = manager._clone_git_repo(
+                clone_success, clone_error, repo_path = manager._clone_git_repo(
                     body.git_url,
                     clone_dir,
                     body.branch,
@@ -3224,14 +3251,6 @@ async def parse_dockerfile_services_api(
                         error_detail += f": {clone_error}"
                     raise HTTPException(status_code=400, detail=error_detail)
 
-                # 找到仓库目录
-                repo_name = body.git_url.rstrip("/").split("/")[-1].replace(".git", "")
-                repo_path = os.path.join(clone_dir, repo_name)
-                if not os.path.exists(repo_path):
-                    items = os.listdir(clone_dir)
-                    if items:
-                        repo_path = os.path.join(clone_dir, items[0])
-
                 # 读取 Dockerfile
                 dockerfile_path = os.path.join(repo_path, body.dockerfile_name)
                 if not os.path.exists(dockerfile_path):
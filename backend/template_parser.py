@@ -4,6 +4,12 @@ import re
 from typing import Dict, List
 
 
+# 模板占位符 {{NAME}} / {{NAME:default}}
+_PLACEHOLDER_RE = re.compile(r'\{\{([^{}:]+)(?::([^}]+))?\}\}')
+# 可使用默认值 / 视为必填的模板变量名
+_TEMPLATE_VAR_NAME_RE = re.compile(r'[A-Z_][A-Z0-9_]*')
+
+
 def parse_template_variables(content: str) -> List[Dict[str, str]]:
     """
     解析 Dockerfile 模板中的变量
@@ -85,31 +91,32 @@ def replace_template_variables(content: str, variables: Dict[str, str]) -> str:
     Returns:
         替换后的内容
     """
-    result = content
-    
-    # 替换所有变量
-    for var_name, value in variables.items():
-        # 匹配 {{VAR_NAME}} 或 {{VAR_NAME:default}}
-        pattern = r'\{\{' + re.escape(var_name) + r'(?::[^}]+)?\}\}'
-        result = re.sub(pattern, str(value), result)
-    
-    # 检查是否还有未替换的必填变量
-    remaining = re.findall(r'\{\{([A-Z_][A-Z0-9_]*?)\}\}', result)
-    if remaining:
-        raise ValueError(f"缺少必填参数: {', '.join(remaining)}")
-    
-    # 替换带默认值的变量（使用默认值）
-    def replace_with_default(match):
+    # 单次扫描：每个 {{NAME}} / {{NAME:default}} 占位符按变量表替换，
+    # 未提供值时使用默认值，必填变量缺失则记录下来统一报错
+    missing = []
+
+    def replace_placeholder(match):
         var_name = match.group(1)
-        default_value = match.group(2) or ""
+        if var_name in variables:
+            return str(variables[var_name])
+        if not _TEMPLATE_VAR_NAME_RE.fullmatch(var_name):
+            return match.group(0)
+        default_value = match.group(2)
+        if default_value is None:
+            missing.append(var_name)
+            return match.group(0)
         return default_value
-    
-    result = re.sub(r'\{\{([A-Z_][A-Z0-9_]*?):([^}]+)\}\}', replace_with_default, result)
-    
+
+    result = _PLACEHOLDER_RE.sub(replace_placeholder, content)
+
+    # 检查是否还有未替换的必填变量
+    if missing:
+        raise ValueError(f"缺少必填参数: {', '.join(missing)}")
+
     return result
 
 
-def parse_template(template_path: str, output_path: str, variables: Dict[str, str]) -> None:
+def parse_template(template_path: str, output_path: str, variables: Dict[str, str]) -> str:
     """
     从模板文件生成 Dockerfile
     
@@ -117,6 +124,9 @@ def parse_template(template_path: str, output_path: str, variables: Dict[str, st
         template_path: 模板文件路径
         output_path: 输出 Dockerfile 路径
         variables: 变量值字典 {"VAR_NAME": "value", ...}
+    
+    Returns:
+        生成的 Dockerfile 内容（调用方可直接复用，无需再读回文件）
     """
     import os
     
@@ -134,6 +144,8 @@ def parse_template(template_path: str, output_path: str, variables: Dict[str, st
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(dockerfile_content)
+    
+    return dockerfile_content
 
 
 # 示例用法
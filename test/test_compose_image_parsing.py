@@ -0,0 +1,86 @@
+import yaml
+
+from backend.handlers import App2DockerHandler, _split_image_reference
+
+
+def parse_compose(content):
+    """直接调用 handle_parse_compose，返回 (状态码, 响应体)"""
+    handler = App2DockerHandler.__new__(App2DockerHandler)
+    response = {}
+    handler._read_json_body = lambda: {"content": content}
+    handler._send_json = lambda code, body: response.update(code=code, body=body)
+    handler.handle_parse_compose()
+    return response["code"], response["body"]
+
+
+def expected_images(content):
+    """按 yaml.safe_load 的结果计算期望的镜像列表"""
+    images = []
+    seen = set()
+    for doc in yaml.safe_load_all(content.strip()):
+        for service_name, conf in (doc or {}).get("services", {}).items():
+            image_ref = conf.get("image") if isinstance(conf, dict) else None
+            if not image_ref:
+                continue
+            image, tag = _split_image_reference(str(image_ref).strip())
+            if image and (image, tag) not in seen:
+                seen.add((image, tag))
+                images.append(
+                    {"service": service_name, "image": image, "tag": tag, "raw": image_ref}
+                )
+    return images
+
+
+def test_simple_compose_matches_safe_load():
+    content = """
+services:
+  api:
+    image: registry.example.com:5000/demo/api:1.0
+  web:
+    image: "nginx:alpine"  # 前端
+  db:
+    build: .
+"""
+    code, body = parse_compose(content)
+    assert code == 200
+    assert body["images"] == expected_images(content)
+
+
+def test_hash_inside_value_is_not_a_comment():
+    content = """
+services:
+  app:
+    image: foo#bar
+"""
+    code, body = parse_compose(content)
+    assert code == 200
+    assert body["images"] == expected_images(content)
+    assert body["images"][0]["raw"] == "foo#bar"
+
+
+def test_null_image_is_skipped():
+    content = """
+services:
+  a:
+    image: null
+  b:
+    image: ~
+  c:
+    image: redis:7
+"""
+    code, body = parse_compose(content)
+    assert code == 200
+    assert body["images"] == expected_images(content)
+    assert [img["service"] for img in body["images"]] == ["c"]
+
+
+def test_malformed_yaml_returns_400():
+    content = """
+services:
+  app:
+    image: nginx:1
+  bad: [unclosed
+"""
+    code, body = parse_compose(content)
+    assert code == 400
+    assert "解析 YAML 失败" in body["error"]
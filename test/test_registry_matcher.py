@@ -0,0 +1,76 @@
+import pytest
+
+import backend.handlers as handlers
+from backend.handlers import _RegistryMatcher
+
+
+ALIYUN = "registry.cn-shanghai.aliyuncs.com"
+
+
+@pytest.fixture
+def make_matcher(monkeypatch):
+    def factory(*registries):
+        entries = [
+            {"name": name, "registry": address, "registry_id": f"id-{name}"}
+            for name, address in registries
+        ]
+        monkeypatch.setattr(
+            handlers, "get_all_registries", lambda team_id=None, user_id=None: entries
+        )
+        return _RegistryMatcher()
+
+    return factory
+
+
+def found(matcher, image_name):
+    reg, how = matcher.find(image_name)
+    return (reg.name if reg else None), how
+
+
+def test_exact_match(make_matcher):
+    matcher = make_matcher(("hub", "docker.io"), ("ali", ALIYUN))
+    assert found(matcher, f"{ALIYUN}/ns/app:1.0") == ("ali", "exact")
+
+
+def test_longest_prefix_match_stops_at_port(make_matcher):
+    matcher = make_matcher(("short", "harbor.example"), ("long", "harbor.example.com"))
+    assert found(matcher, "harbor.example.com:5000/team/app") == ("long", "partial")
+
+
+def test_reverse_prefix_match(make_matcher):
+    matcher = make_matcher(("harbor", "harbor.example.com:5000"))
+    assert found(matcher, "harbor.example.com/team/app") == ("harbor", "partial")
+
+
+def test_duplicate_addresses_keep_first(make_matcher):
+    matcher = make_matcher(("first", ALIYUN), ("second", ALIYUN))
+    assert found(matcher, f"{ALIYUN}/ns/app") == ("first", "exact")
+    assert matcher.registry_count == 2
+
+
+def test_prefix_requires_host_boundary(make_matcher):
+    matcher = make_matcher(("ali", ALIYUN), ("harbor", "harbor.example.com:5000"))
+    assert found(matcher, f"{ALIYUN}.evil.com/x") == (None, None)
+    assert found(matcher, "harbor.example/x") == (None, None)
+    assert found(matcher, "harbor.example.com.evil/x") == (None, None)
+
+
+def test_image_without_registry_is_not_matched(make_matcher):
+    matcher = make_matcher(("hub", "docker.io"))
+    assert found(matcher, "nginx:alpine") == (None, None)
+
+
+def test_address_with_namespace_matches_its_host(make_matcher):
+    matcher = make_matcher(("ali", f"{ALIYUN}/51jbm"))
+    assert found(matcher, f"{ALIYUN}/51jbm/app:1") == ("ali", "partial")
+
+
+def test_address_with_trailing_slash_matches_its_host(make_matcher):
+    matcher = make_matcher(("harbor", "harbor.example.com/"))
+    assert found(matcher, "harbor.example.com/team/app") == ("harbor", "partial")
+    assert found(matcher, "harbor.example.com.evil/x") == (None, None)
+
+
+def test_address_with_scheme_matches_its_host(make_matcher):
+    matcher = make_matcher(("harbor", "https://harbor.example.com:5000"))
+    assert found(matcher, "harbor.example.com:5000/team/app") == ("harbor", "partial")